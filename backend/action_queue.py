@@ -0,0 +1,110 @@
+import asyncio
+import os
+from collections import deque
+from typing import Optional
+
+MAX_QUEUED_CHAT = int(os.getenv("MH_MAX_QUEUED_CHAT", "2"))
+LLM_TURN_CONCURRENCY = int(os.getenv("MH_LLM_TURN_CONCURRENCY", "16"))
+
+# 全进程共享的 LLM 回合并发上限；每个会话同一时刻最多占一个名额
+llm_turn_slots = asyncio.Semaphore(LLM_TURN_CONCURRENCY)
+
+
+class QueuedAction:
+    def __init__(self, kind: str, text: str = "", target_npc: Optional[str] = None):
+        self.kind = kind  # command / chat / batch / advance / load
+        self.text = text
+        self.target_npc = target_npc
+        self.status = "queued"  # queued / running / coalesced / dropped / done
+        self.state = None
+        self.ready = asyncio.Event()
+
+
+class ActionQueue:
+    """
+    Per-session FIFO of player actions; only the head runs.
+
+    - Consecutive workbench commands behind a running command are handed to it
+      via take_commands() and applied as one batch.
+    - At most ``max_queued_chat`` chat turns wait at a time; older ones are
+      dropped as stale when a newer one arrives.
+    """
+
+    def __init__(self, max_queued_chat: int = MAX_QUEUED_CHAT):
+        self.max_queued_chat = max(1, max_queued_chat)
+        self._pending = deque()
+        self._running: Optional[QueuedAction] = None
+        self.dropped = 0
+        self.coalesced = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending) + (1 if self._running else 0)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "running": self._running.kind if self._running else None,
+            "queued_chat": sum(1 for item in self._pending if item.kind == "chat"),
+            "queued_commands": sum(1 for item in self._pending if item.kind == "command"),
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    def submit(self, kind: str, text: str = "", target_npc: Optional[str] = None) -> QueuedAction:
+        item = QueuedAction(kind, text, target_npc)
+        self._pending.append(item)
+        if kind == "chat":
+            self._drop_stale_chat()
+        self._wake_head()
+        return item
+
+    def _drop_stale_chat(self):
+        chats = [item for item in self._pending if item.kind == "chat"]
+        for stale in chats[:-self.max_queued_chat]:
+            self._pending.remove(stale)
+            stale.status = "dropped"
+            stale.ready.set()
+            self.dropped += 1
+
+    def _wake_head(self):
+        if self._running is None and self._pending:
+            head = self._pending.popleft()
+            head.status = "running"
+            self._running = head
+            head.ready.set()
+
+    async def wait_turn(self, item: QueuedAction) -> bool:
+        """Wait until ``item`` may run. False means it was dropped or coalesced (see item.state)."""
+        try:
+            await item.ready.wait()
+        except asyncio.CancelledError:
+            self.cancel(item)
+            raise
+        return item.status == "running"
+
+    def take_commands(self) -> list:
+        batch = []
+        while self._pending and self._pending[0].kind == "command":
+            item = self._pending.popleft()
+            item.status = "coalesced"
+            batch.append(item)
+        self.coalesced += len(batch)
+        return batch
+
+    def finish(self, item: QueuedAction, state=None, coalesced=()):
+        item.status = "done"
+        item.state = state
+        for other in coalesced:
+            other.state = state
+            other.ready.set()
+        if self._running is item:
+            self._running = None
+        self._wake_head()
+
+    def cancel(self, item: QueuedAction):
+        if item in self._pending:
+            self._pending.remove(item)
+            item.status = "dropped"
+        elif self._running is item:
+            self.finish(item)
@@ -0,0 +1,117 @@
+import asyncio
+import contextlib
+import os
+from typing import Awaitable, Callable, Optional
+
+BACKGROUND_CONCURRENCY = int(os.getenv("MH_BACKGROUND_CONCURRENCY", "8"))
+PER_SESSION_CONCURRENCY = int(os.getenv("MH_BACKGROUND_PER_SESSION", "2"))
+MAX_PENDING_PER_SESSION = int(os.getenv("MH_BACKGROUND_MAX_PENDING", "6"))
+
+# 全进程共享的后台任务并发上限：批量开局时欢迎语 / 推荐回复的 LLM 调用排队，而不是一拥而上
+background_slots = asyncio.Semaphore(BACKGROUND_CONCURRENCY)
+
+
+class BackgroundTasks:
+    """
+    Per-session supervisor for work that finishes after the request returns
+    (welcome message, onboarding random event, suggested replies).
+
+    Each job is split in two: ``fetch()`` runs without the session lock
+    (LLM calls, read-only) under the per-session and process-wide
+    concurrency limits; ``commit(result)`` then mutates state while holding
+    the session lock, so it never interleaves with a turn, and ``publish()``
+    runs in the same locked section so the snapshot version moves together
+    with the state (turns planned outside the lock rely on that to notice
+    they went stale). ``on_commit`` is awaited afterwards, outside the lock
+    (push events, flush the journal). Jobs whose fetch already waits on its
+    own process-wide queue pass ``shared_slot=False`` so they do not also
+    hold a ``background_slots`` slot while queued.
+    """
+
+    def __init__(
+        self,
+        lock: Optional[asyncio.Lock] = None,
+        publish: Optional[Callable[[], object]] = None,
+        on_commit: Optional[Callable[[str], Awaitable[None]]] = None,
+        concurrency: int = PER_SESSION_CONCURRENCY,
+        max_pending: int = MAX_PENDING_PER_SESSION,
+    ):
+        self.lock = lock or asyncio.Lock()
+        self.publish = publish
+        self.on_commit = on_commit
+        self.max_pending = max(1, max_pending)
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._tasks = set()
+        self.closed = False
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.cancelled = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "cancelled": self.cancelled,
+        }
+
+    def spawn(
+        self,
+        name: str,
+        fetch: Callable[[], Awaitable],
+        commit: Callable,
+        timeout: Optional[float] = None,
+        shared_slot: bool = True,
+    ) -> Optional[asyncio.Task]:
+        """Schedule a job; returns None (and counts it as dropped) when closed or too many are pending."""
+        if self.closed or len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            return None
+        task = asyncio.create_task(self._run(name, fetch, commit, timeout, shared_slot), name=f"bg:{name}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, name: str, fetch, commit, timeout, shared_slot: bool = True):
+        shared = background_slots if shared_slot else contextlib.nullcontext()
+        try:
+            async with self._slots, shared:
+                result = await asyncio.wait_for(fetch(), timeout) if timeout else await fetch()
+            if result is None:
+                return
+            async with self.lock:
+                if self.closed:
+                    return
+                commit(result)
+                if self.publish:
+                    self.publish()
+            self.completed += 1
+            if self.on_commit:
+                await self.on_commit(name)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception as e:
+            # 后台任务失败不影响回合本身，只记一笔
+            self.failed += 1
+            print(f"Background task {name} failed: {type(e).__name__}: {e}")
+
+    async def join(self):
+        """Wait for everything scheduled so far (tests / graceful shutdown)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self):
+        """Cancel pending jobs and refuse new ones; called when the session is evicted."""
+        self.closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
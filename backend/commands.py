@@ -0,0 +1,111 @@
+from typing import Dict, Optional, Tuple
+
+
+# 在聊天频道执行指令时，有这个概率抽一位 NPC 用 LLM 接话
+NPC_REPLY_CHANCE = 0.1
+
+
+class CommandSpec:
+    """
+    One workbench ``cmd:`` command. ``handler`` names a GameManager method
+    called as ``handler(arg, channel)`` that returns the narrative text.
+
+    ``energy`` is the nominal energy change (negative = cost, None when it
+    depends on the item / course picked), ``days`` the time the command
+    takes when run in a chat channel (0 = instant), ``npc_reply`` whether it
+    can draw an LLM reply from an NPC there. Each spec also keeps call
+    counts and handler time for /metrics.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: str,
+        arg: Optional[str] = None,
+        preset: Optional[str] = None,
+        source: str = "workbench",
+        energy: Optional[int] = None,
+        days: int = 1,
+        npc_reply: bool = True,
+    ):
+        self.name = name
+        self.handler = handler
+        self.arg = arg  # 参数名（item_id / npc_id / project），None 表示不接受参数
+        self.preset = preset  # 别名命令的固定参数，如 eat_mifan -> standard
+        self.source = source  # 工作台反馈的分类
+        self.energy = energy
+        self.days = days
+        self.npc_reply = npc_reply
+        self.calls = 0
+        self.total_ms = 0.0
+
+    def parse_arg(self, raw: Optional[str]) -> Optional[str]:
+        if self.preset is not None:
+            return self.preset
+        if self.arg is None or raw is None:
+            return None
+        return raw.strip() or None
+
+    def record(self, elapsed: float):
+        self.calls += 1
+        self.total_ms += elapsed * 1000
+
+
+COMMAND_TABLE = [
+    # 食堂：精力随菜品而定
+    CommandSpec("eat_mifan", "_cmd_rice", preset="standard", source="rice"),
+    CommandSpec("eat_mifan_light", "_cmd_rice", preset="light", source="rice"),
+    CommandSpec("eat_mifan_luxury", "_cmd_rice", preset="luxury", source="rice"),
+    CommandSpec("rice", "_cmd_rice", arg="item_id", source="rice"),
+    # 工作
+    CommandSpec("work_hard", "_cmd_work_hard", energy=-15),
+    CommandSpec("work_normal", "_cmd_work_normal", energy=-10),
+    CommandSpec("tech_breakthrough", "_cmd_tech_breakthrough", energy=-15),
+    CommandSpec("make_ppt", "_cmd_make_ppt", energy=-8),
+    CommandSpec("align_meeting", "_cmd_align_meeting", energy=-2),
+    CommandSpec("paid_slack", "_cmd_paid_slack", energy=3),
+    CommandSpec("tutorial_reward", "_cmd_tutorial_reward", energy=10, days=0, npc_reply=False),
+    CommandSpec("rest", "_cmd_rest", energy=4),
+    CommandSpec("report", "_cmd_report", energy=-10),
+    CommandSpec("msg_boss", "_cmd_msg_boss", energy=-8),
+    # 商店 / 房产 / 学院：买东西是即时的，上课要花时间
+    CommandSpec("buy_gift", "_cmd_shop", preset="gift", source="shop", days=0, npc_reply=False),
+    CommandSpec("buy_gpu", "_cmd_shop", preset="gpu", source="shop", days=0, npc_reply=False),
+    CommandSpec("buy_monitor", "_cmd_shop", preset="monitor", source="shop", days=0, npc_reply=False),
+    CommandSpec("buy_chair", "_cmd_shop", preset="chair", source="shop", days=0, npc_reply=False),
+    CommandSpec("shop", "_cmd_shop", arg="item_id", source="shop", days=0, npc_reply=False),
+    CommandSpec("house", "_cmd_house", arg="house_id", source="house", days=0, npc_reply=False),
+    CommandSpec("learn_skill", "_cmd_academy", preset="base", source="academy"),
+    CommandSpec("train_hard", "_cmd_academy", preset="hard_camp", source="academy"),
+    CommandSpec("train_soft", "_cmd_academy", preset="soft_workshop", source="academy"),
+    CommandSpec("train_leadership", "_cmd_academy", preset="leadership", source="academy"),
+    CommandSpec("academy", "_cmd_academy", arg="course_id", source="academy"),
+    # 职业
+    CommandSpec("transfer", "_cmd_transfer", arg="project", energy=0),
+    CommandSpec("add_subordinate", "_cmd_add_subordinate", arg="npc_id", energy=0, days=0),
+    CommandSpec("remove_subordinate", "_cmd_remove_subordinate", arg="npc_id", energy=0, days=0),
+    CommandSpec("sub_work", "_cmd_sub_work", arg="npc_id", energy=0),
+    CommandSpec("sub_all_work", "_cmd_sub_all_work", energy=0),
+    CommandSpec("resign", "_cmd_resign", energy=0, days=0, npc_reply=False),
+]
+
+COMMANDS: Dict[str, CommandSpec] = {spec.name: spec for spec in COMMAND_TABLE}
+
+
+def parse_command(text: str) -> Tuple[Optional[CommandSpec], Optional[str]]:
+    """Split ``cmd:<name>[:<arg>]`` into its spec and typed argument; unknown names give ``(None, None)``."""
+    raw = text[len("cmd:"):] if text.startswith("cmd:") else text
+    name, _, rest = raw.partition(":")
+    spec = COMMANDS.get(name)
+    if spec is None:
+        return None, None
+    return spec, spec.parse_arg(rest.split(":", 1)[0] if rest else None)
+
+
+def command_stats() -> dict:
+    """Calls and handler time per command that has run at least once."""
+    return {
+        spec.name: {"calls": spec.calls, "total_ms": round(spec.total_ms, 3)}
+        for spec in COMMAND_TABLE
+        if spec.calls
+    }
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：缺失时只协商 gzip
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("MH_COMPRESSION", "1") != "0"
+MIN_SIZE = int(os.getenv("MH_COMPRESS_MIN_BYTES", "500"))
+GZIP_LEVEL = int(os.getenv("MH_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("MH_BROTLI_QUALITY", "5"))
+# 超过这个大小的整包压缩放到线程里做，不阻塞事件循环
+THREAD_MIN_SIZE = 128 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header; None means identity."""
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        params = params.strip()
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            q = 0.0
+        weights[token.strip().lower()] = q
+    best, best_q = None, 0.0
+    # 按 supported 的顺序比较，权重相同时优先 br
+    for name in supported:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._z.compress(data)
+        return out + self._z.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._c.process(data)
+        return out + self._c.flush() if flush else out
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+_ENCODERS = {"gzip": _GzipEncoder, "br": _BrotliEncoder}
+
+
+def _compress_whole(encoding: str, body: bytes) -> bytes:
+    encoder = _ENCODERS[encoding]()
+    return encoder.compress(body) + encoder.finish()
+
+
+class CompressionMiddleware:
+    """
+    gzip / brotli for JSON and text responses, negotiated via Accept-Encoding.
+
+    - Single-body responses below ``minimum_size`` are sent as is.
+    - Streaming responses (SSE) share one compressor for the whole stream and
+      flush after every chunk, so each event reaches the client immediately
+      while later state_update frames still compress against earlier ones.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.passthrough = False
+        self.encoder = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES)
+            if self.passthrough:
+                await self.send(message)
+            else:
+                # 等第一段 body 到了才知道是整包还是流式
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body:
+                await self._send_whole(body)
+                return
+            headers = MutableHeaders(raw=self.start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            self.encoder = _ENCODERS[self.encoding]()
+            await self.send(self.start)
+
+        if more_body:
+            chunk = self.encoder.compress(body, flush=True)
+        else:
+            chunk = self.encoder.compress(body) + self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_whole(self, body: bytes):
+        if len(body) < self.minimum_size:
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+        if len(body) >= THREAD_MIN_SIZE:
+            compressed = await asyncio.to_thread(_compress_whole, self.encoding, body)
+        else:
+            compressed = _compress_whole(self.encoding, body)
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": compressed})
@@ -0,0 +1,75 @@
+# 意图识别标注语料：玩家在聊天框里的真实风格输入 -> 期望意图
+# 供 tools/bench_intent.py 评估本地意图引擎的准确率 / 置信度覆盖
+# 标签取值与 _apply_effects 一致：WORK / REFUSE / SHOP / LEARN / ATTACK / SMALL_TALK
+
+INTENT_CORPUS = [
+    # --- WORK ---
+    ("今晚通宵把这个版本的bug修完", "WORK"),
+    ("我去加班了，今天必须把需求推进完", "WORK"),
+    ("爆肝一波，明天上线", "WORK"),
+    ("先把登录模块的代码写完再说", "WORK"),
+    ("这个崩溃我来debug一下", "WORK"),
+    ("稍微加一会儿班，把文档补齐", "WORK"),
+    ("认真工作，争取这周绩效拿A", "WORK"),
+    ("修复一下昨天那个闪退", "WORK"),
+    ("策划又改需求了，我去改", "WORK"),
+    ("死磕这个性能问题，不搞定不下班", "WORK"),
+    ("小加班一下，把测试用例跑完", "WORK"),
+    ("继续肝活动关卡", "WORK"),
+    ("我来写代码，你们先开会", "WORK"),
+    ("把渲染管线的优化推进一下", "WORK"),
+    ("今天努力工作一点", "WORK"),
+    ("帮忙review一下我的提交", "WORK"),
+    ("赶一下里程碑，周五要交付", "WORK"),
+    # --- REFUSE ---
+    ("今天不想干了，摸鱼", "REFUSE"),
+    ("休息一下，太累了", "REFUSE"),
+    ("摆烂了，爱咋咋地", "REFUSE"),
+    ("躺平，这个需求我不接", "REFUSE"),
+    ("带薪摸鱼中，勿扰", "REFUSE"),
+    ("先休息十分钟", "REFUSE"),
+    ("这活谁爱干谁干，我不干了", "REFUSE"),
+    ("请个假回家睡觉", "REFUSE"),
+    # --- SHOP ---
+    ("点个外卖，饿死了", "SHOP"),
+    ("下楼买杯奶茶", "SHOP"),
+    ("来杯咖啡续命", "SHOP"),
+    ("中午吃什么？食堂还是点餐", "SHOP"),
+    ("给组里每人买一份下午茶", "SHOP"),
+    ("喝口水继续", "SHOP"),
+    ("去便利店买点零食", "SHOP"),
+    ("我想换一把人体工学椅", "SHOP"),
+    # --- LEARN ---
+    ("报名下周的引擎培训", "LEARN"),
+    ("去学习一下新的渲染框架", "LEARN"),
+    ("开个复盘会，总结一下上个版本", "LEARN"),
+    ("下午上课，学Shader", "LEARN"),
+    ("读文档，看看新接口怎么用", "LEARN"),
+    ("看一下技术分享的录屏", "LEARN"),
+    ("研究一下竞品的战斗系统", "LEARN"),
+    # --- ATTACK ---
+    ("滚，别来烦我", "ATTACK"),
+    ("你这个废物，需求都看不懂", "ATTACK"),
+    ("傻子才这么设计", "ATTACK"),
+    ("我要骂人了", "ATTACK"),
+    ("信不信我打你", "ATTACK"),
+    ("你是不是脑子有问题", "ATTACK"),
+    ("闭嘴吧你", "ATTACK"),
+    # --- SMALL_TALK ---
+    ("大家好，我是新来的", "SMALL_TALK"),
+    ("早上好呀", "SMALL_TALK"),
+    ("哈哈哈哈笑死我了", "SMALL_TALK"),
+    ("谢谢大佬", "SMALL_TALK"),
+    ("在吗？", "SMALL_TALK"),
+    ("辛苦了各位", "SMALL_TALK"),
+    ("晚安，明天见", "SMALL_TALK"),
+    ("hello everyone", "SMALL_TALK"),
+    ("今天天气不错", "SMALL_TALK"),
+    ("周末有人一起打游戏吗", "SMALL_TALK"),
+    ("你觉得新版本的角色怎么样", "SMALL_TALK"),
+    ("最近组里氛围挺好的", "SMALL_TALK"),
+    ("老板今天心情如何", "SMALL_TALK"),
+    ("有人知道年会什么时候吗", "SMALL_TALK"),
+    ("吃了吗您", "SMALL_TALK"),
+    ("打个招呼，大家好", "SMALL_TALK"),
+]
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import pickle
+from functools import lru_cache
+
+from models import NPC
+from relations import RelationGraph, RelationWorld
+
+_BASE_DIR = os.path.dirname(__file__)
+CACHE_DIR = os.getenv("MH_DATA_CACHE_DIR") or os.path.join(_BASE_DIR, ".cache")
+CACHE_VERSION = 1
+NPC_FIELDS = tuple(NPC.model_fields.keys())
+
+
+def resolve_data_path(filename: str):
+    data_path_candidates = [
+        os.path.join(_BASE_DIR, "backend/data", filename),
+        os.path.join(_BASE_DIR, "data", filename),
+    ]
+    return next((p for p in data_path_candidates if os.path.exists(p)), None)
+
+
+def _load_cached(kind: str, path: str, build):
+    """
+    Parse ``path`` through ``build`` once and keep the result as a pickle of
+    plain Python values, keyed on the sha256 of the source file. Later processes
+    reuse the pickle as long as the source bytes are unchanged.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{kind}.pkl")
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("version") == CACHE_VERSION and cached.get("digest") == digest:
+            return cached["payload"]
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, TypeError):
+        pass
+
+    payload = build(json.loads(raw.decode("utf-8")))
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": CACHE_VERSION, "digest": digest, "payload": payload}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Data cache write skipped ({kind}): {e}")
+    return payload
+
+
+def _build_npc_rows(generated_data: dict) -> tuple:
+    rows = []
+    for npc_id, data in generated_data.items():
+        npc = NPC(**data)
+        rows.append((npc_id, tuple(getattr(npc, f) for f in NPC_FIELDS)))
+    return tuple(rows)
+
+
+@lru_cache(maxsize=None)
+def npc_rows() -> tuple:
+    data_path = resolve_data_path("npcs.json")
+    if not data_path:
+        print("NPC 配置文件未找到。")
+        return ()
+    try:
+        rows = _load_cached("npcs", data_path, _build_npc_rows)
+        print(f"Loaded {len(rows)} NPCs")
+        return rows
+    except Exception as e:
+        print(f"Error loading configured NPCs: {e}")
+        return ()
+
+
+def _npc_from_row(values: tuple) -> NPC:
+    fields = dict(zip(NPC_FIELDS, values))
+    fields["relations"] = dict(fields.get("relations") or {})
+    # 数据在写缓存前已经过一次 NPC 校验，这里直接构造即可
+    return NPC.model_construct(**fields)
+
+
+@lru_cache(maxsize=None)
+def initial_npcs() -> dict:
+    """Shared base roster. Treat as read-only; use fresh_npcs() for session state."""
+    return {npc_id: _npc_from_row(values) for npc_id, values in npc_rows()}
+
+
+def fresh_npcs() -> dict:
+    return {npc_id: _npc_from_row(values) for npc_id, values in npc_rows()}
+
+
+@lru_cache(maxsize=None)
+def global_events() -> list:
+    data_path = resolve_data_path("global_events.json")
+    if not data_path:
+        print("Global Events 配置文件未找到。")
+        return []
+    try:
+        events = _load_cached("global_events", data_path, lambda data: data)
+        print(f"Loaded {len(events)} Global Events")
+        return events
+    except Exception as e:
+        print(f"Error loading Global Events: {e}")
+        return []
+
+
+@lru_cache(maxsize=None)
+def base_relation_graph() -> RelationGraph:
+    return RelationGraph.from_npcs(initial_npcs())
+
+
+@lru_cache(maxsize=None)
+def relation_worlds() -> list:
+    data_path = resolve_data_path("relation_worlds.json")
+    if not data_path:
+        return []
+    try:
+        payload = _load_cached("relation_worlds", data_path, lambda data: data)
+        known_ids = {npc_id for npc_id, _ in npc_rows()}
+        worlds = [
+            RelationWorld.from_pairs(pairs, known_ids=known_ids)
+            for pairs in payload.get("worlds") or []
+        ]
+        print(f"Loaded {len(worlds)} Relation Worlds")
+        return worlds
+    except Exception as e:
+        print(f"Error loading Relation Worlds: {e}")
+        return []
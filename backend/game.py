@@ -1,11 +1,26 @@
 from datetime import datetime
-import json
-import os
 import asyncio
+import os
+import time
+import uuid
 from models import GameState, Player, Project, ProjectType, ProjectStatus, Role, OnboardRequest, NPC
 from llm import llm_service
+from relations import RelationOverlay, RelationWorld, RelationKind, TENSION_KINDS, build_relation_pairs
+from turns import TurnPlan, TurnTransaction, snapshot_view
+from serialization import sse_frame, state_update_frame
+from commands import COMMANDS, NPC_REPLY_CHANCE, parse_command
+from team import TeamTable
+from promotion import MAX_LEVEL as MAX_PROMOTION_LEVEL, PromotionTracker, is_eval_week, promotion_reviews
+from background import BackgroundTasks
+import metrics
+import tracer
+from tracer import traced
+from intent import CONFIDENCE_THRESHOLD as INTENT_CONFIDENCE_THRESHOLD, classify_intent, parse_analysis
+import data_loader
+import savefile
 import random
 import math
+import re
 from data.random_events import RANDOM_EVENTS_DB
 
 
@@ -19,51 +34,22 @@ INITIAL_PROJECTS = {
     "HYG": Project(name="HYG", type=ProjectType.GAME, status=ProjectStatus.RD, difficulty=3, risk=30),
 }
 
-def load_all_npcs():
-    npcs = {}
-    data_path_candidates = [
-        os.path.join(os.path.dirname(__file__), "backend/data/npcs.json"),
-        os.path.join(os.path.dirname(__file__), "data/npcs.json"),
-    ]
-    data_path = next((p for p in data_path_candidates if os.path.exists(p)), None)
-    
-    if data_path and os.path.exists(data_path):
-        try:
-            with open(data_path, "r", encoding="utf-8") as f:
-                generated_data = json.load(f)
-                for npc_id, data in generated_data.items():
-                    if npc_id not in npcs:
-                        npcs[npc_id] = NPC(**data)
-            print(f"Loaded {len(npcs)} NPCs")
-        except Exception as e:
-            print(f"Error loading configured NPCs: {e}")
-    else:
-        print("NPC 配置文件未找到。")
-    
-    return npcs
+# 回合在会话锁外规划；落地前发现状态已被别人改过就重新规划，最后一次在锁内规划保证能落地
+TURN_REPLANS = int(os.getenv("MH_TURN_REPLANS", "2"))
 
-INITIAL_NPCS = load_all_npcs()
+def load_all_npcs():
+    return data_loader.initial_npcs()
 
 def load_global_events():
-    events = []
-    data_path_candidates = [
-        os.path.join(os.path.dirname(__file__), "backend/data/global_events.json"),
-        os.path.join(os.path.dirname(__file__), "data/global_events.json"),
-    ]
-    data_path = next((p for p in data_path_candidates if os.path.exists(p)), None)
-
-    if data_path and os.path.exists(data_path):
-        try:
-            with open(data_path, "r", encoding="utf-8") as f:
-                events = json.load(f)
-            print(f"Loaded {len(events)} Global Events")
-        except Exception as e:
-            print(f"Error loading Global Events: {e}")
-    else:
-        print("Global Events 配置文件未找到。")
-    return events
+    return data_loader.global_events()
 
-GLOBAL_EVENTS = load_global_events()
+def __getattr__(name):
+    # 兼容旧的模块级常量：首次访问时才加载数据，import game 不再解析 JSON
+    if name == "INITIAL_NPCS":
+        return data_loader.initial_npcs()
+    if name == "GLOBAL_EVENTS":
+        return data_loader.global_events()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 RICE_ITEMS = [
     {
@@ -787,67 +773,138 @@ MIHA_HOUSES = [
     },
 ]
 
+FAST_FORWARD_STATS = ("money", "kpi", "mood", "energy", "political_capital", "level")
+FAST_FORWARD_DIGEST_LINES = 8
+
+_STREAM_SECTION_RE = re.compile(r"<(analysis|narrative|reply|effects)([^>]*)>(.*?)</\1>", re.DOTALL)
+
+
+def _iter_stream_sections(text: str):
+    for match in _STREAM_SECTION_RE.finditer(text or ""):
+        yield match.group(1), match.group(2), match.group(3), match.end()
+
+
 class GameManager:
     def __init__(self):
         self.state = GameState()
         self.state.projects = {k: v.model_copy(deep=True) for k, v in INITIAL_PROJECTS.items()}
-        self.state.npcs = {k: v.model_copy(deep=True) for k, v in INITIAL_NPCS.items()}
+        self.state.npcs = data_loader.fresh_npcs()
         self.state.known_npcs = []
         self.state.player_subordinates = []
         self._init_npc_relations()
-
-    def _init_npc_relations(self):
-        project_groups = {}
-        for npc_id, npc in self.state.npcs.items():
-            if not npc_id.startswith("NPC_"):
-                continue
-            existing_relations = getattr(npc, "relations", None) or {}
-            if existing_relations:
-                continue
-            project_key = npc.project or "General"
-            if project_key not in project_groups:
-                project_groups[project_key] = []
-            project_groups[project_key].append(npc_id)
-
-        for project_key, ids in project_groups.items():
-            if len(ids) < 2:
-                continue
-            random.shuffle(ids)
-            pair_count = max(1, len(ids) // 4)
-            for _ in range(pair_count):
-                a_id, b_id = random.sample(ids, 2)
-                a = self.state.npcs.get(a_id)
-                b = self.state.npcs.get(b_id)
-                if not a or not b:
-                    continue
-                a_rel = getattr(a, "relations", None) or {}
-                if b_id in a_rel:
-                    continue
-                if self._should_be_rivals(a, b):
-                    label = "对立"
-                else:
-                    label = "合作"
-                new_a_rel = dict(a_rel)
-                b_rel = getattr(b, "relations", None) or {}
-                new_b_rel = dict(b_rel)
-                new_a_rel[b_id] = label
-                new_b_rel[a_id] = label
-                a.relations = new_a_rel
-                b.relations = new_b_rel
-
-    def _should_be_rivals(self, npc_a, npc_b) -> bool:
-        roles = {npc_a.role, npc_b.role}
-        traits_text = (npc_a.traits or "") + (npc_b.traits or "")
-        tough_keywords = ["毒舌", "强硬", "零容忍"]
-        has_tough = any(k in traits_text for k in tough_keywords)
-        cross_role = "Dev" in roles and "Product" in roles
-        same_project = npc_a.project == npc_b.project and npc_a.project not in ("", "General")
-        high_level = self._parse_level(npc_a.level) >= 7 or self._parse_level(npc_b.level) >= 7
-        if cross_role and same_project and has_tough:
+        self._clock = None
+        self.state_version = 0
+        # 进程内的版本号重启后会从头计数，ETag 带上 epoch 避免和旧进程发出的撞上
+        self.state_epoch = uuid.uuid4().hex[:8]
+        self._snapshot_changed = asyncio.Event()
+        self.journal = None
+        # 会话锁：只在回合落地 + 发布快照时持有，LLM 规划在锁外进行；main 的会话也用这把锁
+        self.lock = asyncio.Lock()
+        # 开局后的欢迎语 / 随机事件 / 推荐回复走这里，结果在同一把锁里落地并发布
+        self.background = BackgroundTasks(
+            lock=self.lock, publish=self.publish_snapshot, on_commit=self._background_committed
+        )
+        # 营收合计等晋升计数随状态变化累加，周结算不再逐项目重算
+        self.promotion = PromotionTracker(on_change=self._promotion_eligibility_changed)
+        # 会话的 SSE 事件缓冲；main 挂上 ctx.events.append，后台结果（述职评分）据此推给 /api/events
+        self.event_sink = None
+        self.snapshot = None
+        self.publish_snapshot()
+
+    @traced("publish_snapshot")
+    def publish_snapshot(self) -> GameState:
+        # 提交点：发布一份只读快照，/api/state 等读接口只读它，不必等正在进行的 LLM 回合
+        # 没变的 NPC / 项目和聊天记录条目与上一份快照共享，发布成本不随存档变大
+        self.state_version += 1
+        snapshot = snapshot_view(self.state, self.snapshot)
+        snapshot.version = self.state_version
+        self.snapshot = snapshot
+        changed, self._snapshot_changed = self._snapshot_changed, asyncio.Event()
+        changed.set()
+        return snapshot
+
+    @property
+    def snapshot_etag(self) -> str:
+        return f'W/"{self.state_epoch}-{self.state_version}"'
+
+    async def wait_snapshot(self, etag: str, timeout: float) -> bool:
+        """Long-poll: wait until a snapshot other than ``etag`` is published. False on timeout."""
+        if etag != self.snapshot_etag:
             return True
-        if same_project and has_tough and high_level:
+        changed = self._snapshot_changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=timeout)
             return True
-        return False
+        except asyncio.TimeoutError:
+            return False
+
+    def _state_update_frame(self) -> str:
+        # 发布都在落地的那段锁里完成，这里只序列化最新快照
+        with tracer.span("serialize"):
+            return state_update_frame(self.snapshot)
+
+    def _timing_frame(self):
+        # MH_TRACE=1 时在流末尾补一帧本请求的分阶段耗时（流式响应的头早已发出，带不了 Server-Timing）
+        trace = tracer.current()
+        return sse_frame({"type": "timing", **trace.summary()}) if trace is not None else None
+
+    def _init_npc_relations(self, seed: int = None):
+        # 优先使用离线预生成的关系世界（tools/normalize_npcs.py），按 seed 选一个即可
+        worlds = data_loader.relation_worlds()
+        self.relation_world_index = None
+        self.relation_world_pairs = None
+        if worlds:
+            if seed is None:
+                seed = random.randrange(len(worlds))
+            self.relation_world_index = seed % len(worlds)
+            world = worlds[self.relation_world_index]
+        else:
+            self.relation_world_pairs = build_relation_pairs(self.state.npcs, random)
+            world = RelationWorld.from_pairs(self.relation_world_pairs)
+        self.relations = RelationOverlay(data_loader.base_relation_graph(), self.state.npcs, world=world)
+        # NPC.relations 仅作为对外展示的镜像，查询统一走 self.relations
+        for npc_id, rels in world.mirror.items():
+            npc = self.state.npcs.get(npc_id)
+            if npc:
+                npc.relations = {**(npc.relations or {}), **rels}
+
+    def _relation_world_for(self, payload: dict) -> RelationWorld:
+        worlds = data_loader.relation_worlds()
+        world_index = payload.get("world")
+        if world_index is not None and worlds:
+            return worlds[world_index % len(worlds)]
+        return RelationWorld.from_pairs(payload.get("world_pairs") or [])
+
+    def export_save(self, compress: bool = True) -> bytes:
+        relations = {
+            "world": self.relation_world_index,
+            "world_pairs": self.relation_world_pairs,
+            **self.relations.export_changes(),
+        }
+        return savefile.dump_save(self.state, relations, self.relations.world.mirror, compress=compress)
+
+    def import_save(self, blob: bytes) -> GameState:
+        state, relations = savefile.load_save(blob, lambda payload: self._relation_world_for(payload).mirror)
+        world = self._relation_world_for(relations)
+        self.state = state
+        self.promotion = PromotionTracker(on_change=self._promotion_eligibility_changed)
+        self.relation_world_index = relations.get("world")
+        self.relation_world_pairs = relations.get("world_pairs")
+        self.relations = RelationOverlay(data_loader.base_relation_graph(), self.state.npcs, world=world)
+        self.relations.import_changes(relations)
+        if self.journal:
+            self.journal.snapshot(self)
+        return self.publish_snapshot()
+
+    def replay_journal_record(self, record: dict):
+        # 恢复会话时重放 write-ahead log 的一条记录（见 journal.py）
+        op = record.get("op")
+        if op == "plan":
+            self.apply_turn(TurnPlan.model_validate(record["plan"]))
+        elif op == "suggestions":
+            self._apply_suggested_replies(record.get("suggestions"))
+        elif op == "ack":
+            self.state.active_global_event = None
 
     def _parse_level(self, level: str) -> int:
         try:
@@ -878,41 +935,41 @@ class GameManager:
         )
         return exec_ids[:5]
 
-    async def _safe_call(self, coro):
-        try:
-            await coro
-        except Exception:
-            return
+    async def _background_committed(self, name: str):
+        # 后台结果已在会话锁内落地并发布：推送事件，并等日志落盘
+        snapshot = self.snapshot
+        if name == "promotion_review" and self.event_sink:
+            self.event_sink(sse_frame({"type": "promotion_result", "review": snapshot.promotion_review}))
+            self.event_sink(state_update_frame(snapshot))
+        if self.journal:
+            await self.journal.commit()
+
+    async def _plan_welcome(self, req: OnboardRequest, leader):
+        plan = TurnPlan(kind="welcome", text="", channel="group")
+        metrics.bind(turn_id=plan.turn_id)
+        welcome_text = await llm_service.generate_welcome(
+            player_name=req.name,
+            player_role=req.role.value,
+            project_name=req.project_name,
+            leader_name=leader.name,
+            leader_role=leader.role,
+            leader_traits=leader.traits
+        )
+        if not welcome_text:
+            return None
+        plan.llm["welcome"] = {"sender": leader.name, "content": welcome_text}
+        return plan
 
-    async def _try_generate_welcome(self, req: OnboardRequest, leader):
-        try:
-            welcome_text = await asyncio.wait_for(
-                llm_service.generate_welcome(
-                    player_name=req.name,
-                    player_role=req.role.value,
-                    project_name=req.project_name,
-                    leader_name=leader.name,
-                    leader_role=leader.role,
-                    leader_traits=leader.traits
-                ),
-                timeout=6.0
-            )
-            if welcome_text:
-                self.state.chat_history.append({
-                    "sender": leader.name, 
-                    "content": welcome_text,
-                    "type": "npc",
-                    "target": "group",
-                    "timestamp": self._get_timestamp()
-                })
-        except Exception:
-            return
+    def _apply_welcome_turn(self, plan: TurnPlan):
+        welcome = plan.llm["welcome"]
+        self.state.chat_history.append(self._chat_msg(welcome["sender"], welcome["content"], "npc", plan.channel))
 
     def _get_timestamp(self) -> str:
-        return datetime.now().isoformat()
+        # apply 阶段使用回合开始时记录的时间，保证同一 plan 重放结果一致
+        return self._clock or datetime.now().isoformat()
 
-    def _get_recent_history(self, channel: str, limit: int = 5) -> list[dict]:
-        msgs = [m for m in self.state.chat_history if m.get("target") == channel]
+    def _get_recent_history(self, channel: str, limit: int = 5, pending: list = None) -> list[dict]:
+        msgs = [m for m in self.state.chat_history + list(pending or []) if m.get("target") == channel]
         trimmed = msgs[-limit:]
         return [{"sender": m.get("sender"), "content": m.get("content")} for m in trimmed]
 
@@ -981,6 +1038,7 @@ class GameManager:
         desc = house.get("desc") or f"你在米哈房购入了 {house['name']}。"
         return f"{desc} 金钱 -{cost}。从下周开始，每周都会稍微减轻你的疲劳。"
 
+    @traced("advance_time")
     def _advance_time(self, channel: str, weeks: int = 1, days: int = 0, global_event_prob: float = None):
         if not self.state.player:
             return
@@ -1030,7 +1088,7 @@ class GameManager:
         mood = player.mood
         energy = player.energy
         candidates = []
-        for ev in GLOBAL_EVENTS:
+        for ev in data_loader.global_events():
             min_week = ev.get("min_week")
             if min_week is not None and week < min_week:
                 continue
@@ -1241,35 +1299,21 @@ class GameManager:
         })
 
     def _infer_intent_magnitude(self, text: str):
-        t = (text or "").lower()
-
-        def has_any(words):
-            return any(w in t for w in words)
-
-        intent = "SMALL_TALK"
-        if has_any(["加班", "爆肝", "肝", "工作", "修bug", "修复", "debug", "写代码", "改需求", "推进"]):
-            intent = "WORK"
-        elif has_any(["摸鱼", "休息", "摆烂", "躺平"]):
-            intent = "REFUSE"
-        elif has_any(["买", "吃", "喝", "外卖", "奶茶", "咖啡", "点餐"]):
-            intent = "SHOP"
-        elif has_any(["学习", "培训", "上课", "复盘", "读文档"]):
-            intent = "LEARN"
-        elif has_any(["打", "骂", "滚", "傻", "废物", "操", "你妈"]):
-            intent = "ATTACK"
-
-        magnitude = 1.0
-        if intent == "SMALL_TALK":
-            magnitude = 0.4
-        elif has_any(["通宵", "爆肝", "肝爆", "死磕"]):
-            magnitude = 1.6
-        elif has_any(["稍微", "一点", "小加班"]):
-            magnitude = 0.8
-        elif has_any(["加班", "努力", "认真"]):
-            magnitude = 1.2
-
-        return intent, magnitude
+        result = classify_intent(text)
+        return result.intent, result.magnitude
+
+    def _stream_intent(self, plan: TurnPlan):
+        # 本地置信度不够时 prompt 里带了 <analysis>，以 LLM 的判断为准
+        result = classify_intent(plan.text)
+        if result.confidence < INTENT_CONFIDENCE_THRESHOLD:
+            for tag, _, content, _ in _iter_stream_sections(plan.llm.get("stream_response") or ""):
+                if tag == "analysis":
+                    parsed = parse_analysis(content)
+                    if parsed:
+                        return parsed
+        return result.intent, result.magnitude
 
+    @traced("weekly_tick")
     def _weekly_tick(self, channel: str):
         player = self.state.player
         project = self.state.projects.get(player.current_project) if player else None
@@ -1317,7 +1361,7 @@ class GameManager:
                 if project.revenue < target:
                     remaining = max(0, target - project.revenue)
                     gain = min(potential_gain, remaining)
-                    project.revenue = project.revenue + gain
+                    self.promotion.credit_revenue(self.state, project, gain)
                 if project.stakeholder_trust >= 70 and project.morale >= 60:
                     project.risk = max(0, project.risk - 2)
                 elif project.stakeholder_trust >= 50 and project.morale >= 50:
@@ -1356,6 +1400,7 @@ class GameManager:
         self._check_promotion(channel)
         self._check_game_over(channel)
 
+    @traced("npc_ecology_tick")
     def _npc_ecology_tick(self, channel: str):
         player = self.state.player
         if not player or not self.state.npcs:
@@ -1385,13 +1430,7 @@ class GameManager:
             if npc_project_state and npc_project_state.risk >= 70:
                 base_prob += 0.05
 
-            relations = getattr(npc, "relations", None) or {}
-            relation_candidates = []
-            for other_id, relation_label in relations.items():
-                other = self.state.npcs.get(other_id)
-                if not other or getattr(other, "status", "在职") != "在职":
-                    continue
-                relation_candidates.append((other_id, relation_label))
+            relation_candidates = self.relations.neighbors(npc_id)
 
             if relation_candidates:
                 relation_prob = base_prob + 0.03
@@ -1426,6 +1465,7 @@ class GameManager:
 
             if event_type == "resign":
                 npc.status = "已离职"
+                self.relations.set_active(npc_id, False)
                 if npc_id in self.state.player_subordinates:
                     self.state.player_subordinates = [
                         sid for sid in self.state.player_subordinates if sid != npc_id
@@ -1441,6 +1481,7 @@ class GameManager:
                     continue
                 new_project = random.choice(target_candidates)
                 npc.project = new_project
+                self.relations.set_project(npc_id, new_project)
                 if npc_id in self.state.player_subordinates and new_project != player.current_project:
                     self.state.player_subordinates = [
                         sid for sid in self.state.player_subordinates if sid != npc_id
@@ -1463,13 +1504,12 @@ class GameManager:
             })
 
     def _trigger_relation_event(self, npc, relation_candidates, channel: str, player: Player):
-        other_id, relation_label = random.choice(relation_candidates)
+        other_id, relation_kind = random.choice(relation_candidates)
         other = self.state.npcs.get(other_id)
         if not other or getattr(other, "status", "在职") != "在职":
             return
         project_name = npc.project or other.project or "General"
-        text = relation_label or ""
-        conflict = "对立" in text or "冲突" in text
+        conflict = relation_kind == RelationKind.RIVAL
         if conflict:
             npc.mood = max(0, npc.mood - 4)
             other.mood = max(0, other.mood - 4)
@@ -1558,6 +1598,12 @@ class GameManager:
         self._add_fact(f"第{self.state.week}周：立项 {name}")
 
     async def init_game(self, req: OnboardRequest) -> GameState:
+        await self._init_game(req)
+        if self.journal:
+            self.journal.snapshot(self)
+        return self.publish_snapshot()
+
+    async def _init_game(self, req: OnboardRequest) -> GameState:
         learning_rate = 1.0
         max_energy = 100
         money = 5000
@@ -1588,7 +1634,9 @@ class GameManager:
         # 2. Setup State
         self.state.player = player
         self.state.projects = {k: v.model_copy(deep=True) for k, v in INITIAL_PROJECTS.items()}
-        self.state.npcs = {k: v.model_copy(deep=True) for k, v in INITIAL_NPCS.items()}
+        # 同一个 state 对象上重新开局：营收累计和可晋升档位都要从新项目重算
+        self.promotion = PromotionTracker(on_change=self._promotion_eligibility_changed)
+        self.state.npcs = data_loader.fresh_npcs()
         self.state.chat_history = []
         self.state.week = 1
         self.state.year = 1
@@ -1657,11 +1705,16 @@ class GameManager:
                 "target": "group",
                 "timestamp": self._get_timestamp()
             })
-            asyncio.create_task(self._try_generate_welcome(req, leader))
+            self.background.spawn("welcome", lambda: self._plan_welcome(req, leader), self.apply_turn, timeout=6.0)
         
         if random.random() < 0.5:
-            asyncio.create_task(self._safe_call(asyncio.wait_for(self._trigger_random_event("group"), timeout=3.0)))
-        asyncio.create_task(self._safe_call(asyncio.wait_for(self._refresh_suggested_replies("group"), timeout=3.0)))
+            self.background.spawn("random_event", self._plan_random_event, self.apply_turn, timeout=3.0)
+        self.background.spawn(
+            "suggested_replies",
+            lambda: self._fetch_suggested_replies("group"),
+            self._commit_suggested_replies,
+            timeout=3.0,
+        )
         
         return self.state
 
@@ -1712,6 +1765,7 @@ class GameManager:
             return candidates[0][1]
         return self._determine_project_leader(project)
 
+    @traced("npc_scoring")
     async def _infer_relevant_npc_by_text(self, text: str) -> str:
         player = self.state.player
         if not player:
@@ -1788,433 +1842,149 @@ class GameManager:
 
         if not best_id:
             best_id = scored[0][1]
+        return best_id
 
-        if best_id:
-            self._mark_npc_known(best_id)
-            return best_id
-        return None
-
-    async def stream_text_action(self, text: str, target_npc: str = None):
-        if self.state.active_global_event:
-            yield f"data: {json.dumps({'type': 'error', 'content': '当前有全局事件进行中，请先处理事件提示。'})}\n\n"
-            return
-        if not self.state.player:
-            yield f"data: {json.dumps({'type': 'error', 'content': 'Game not initialized'})}\n\n"
-            return
-        if self.state.game_over:
-            yield f"data: {json.dumps({'type': 'state_update', 'state': self.state.dict()})}\n\n"
-            yield "data: [DONE]\n\n"
-            return
-            
-        player = self.state.player
-        channel = target_npc if target_npc else "group"
-
-        if self.state.promotion_review and (self.state.promotion_review.get("status") or "") == "pending_answer":
-            player_msg = {
-                "sender": "Me",
-                "content": text,
-                "type": "player",
-                "target": channel,
-                "timestamp": self._get_timestamp()
-            }
-            self.state.chat_history.append(player_msg)
-            yield f"data: {json.dumps({'type': 'msg_append', 'msg': player_msg})}\n\n"
-            prev_len = len(self.state.chat_history)
-            await self._handle_promotion_answer(text, channel)
-            if len(self.state.chat_history) > prev_len:
-                for msg in self.state.chat_history[prev_len:]:
-                    yield f"data: {json.dumps({'type': 'msg_append', 'msg': msg})}\n\n"
-            self._advance_time(channel, days=1)
-            self._check_game_over(channel)
-        # 1. Handle Commands (Fast Path)
-        if text.startswith("cmd:"):
-            self._handle_command(text, channel)
-            if random.random() < 0.1:
-                player_project = getattr(self.state.player, "current_project", None)
-                candidates = [
-                    nid for nid, npc in self.state.npcs.items()
-                    if getattr(npc, "status", "在职") == "在职"
-                    and getattr(npc, "project", None) in [player_project, "General", "HR"]
-                ]
-            else:
-                candidates = []
-            if candidates:
-                npc_id = random.choice(candidates)
-                npc_data = self.state.npcs.get(npc_id)
-                if npc_data:
-                    recent_history = self._get_recent_history(channel, limit=5)
-                    gen_result = await llm_service.process_action(
-                        text,
-                        player.dict(),
-                        chat_history=recent_history,
-                        target_npc=npc_data.dict(),
-                    )
-                    npc_reply = gen_result.get("npc_reply")
-                    if npc_reply:
-                        npc_name = gen_result.get("npc_name") or getattr(npc_data, "name", npc_id)
-                        msg = {
-                            "sender": npc_name,
-                            "content": npc_reply,
-                            "type": "npc",
-                            "target": channel,
-                            "timestamp": self._get_timestamp(),
-                        }
-                        self.state.chat_history.append(msg)
-                        yield f"data: {json.dumps({'type': 'msg_append', 'msg': msg})}\n\n"
-            self._advance_time(channel, weeks=1, global_event_prob=0.05)
-            self._check_game_over(channel)
-            yield f"data: {json.dumps({'type': 'state_update', 'state': self.state.dict()})}\n\n"
-            return
+    # ---- 回合引擎：plan 阶段只读状态、并发收集 LLM 输出；apply 阶段同步、原子地落地到 state ----
 
-        # 2. Append Player Message
-        player_msg = {
-            "sender": "Me",
-            "content": text,
-            "type": "player",
+    def _chat_msg(self, sender: str, content: str, msg_type: str, channel: str) -> dict:
+        return {
+            "sender": sender,
+            "content": content,
+            "type": msg_type,
             "target": channel,
-            "timestamp": self._get_timestamp()
+            "timestamp": self._get_timestamp(),
         }
-        self.state.chat_history.append(player_msg)
-        # Yield player message confirmation
-        yield f"data: {json.dumps({'type': 'msg_append', 'msg': player_msg})}\n\n"
 
-        inferred_intent, inferred_magnitude = self._infer_intent_magnitude(text)
-        inferred_narrative = self._apply_effects(inferred_intent, inferred_magnitude, text, channel=channel)
-        applied_intent = True
-        if inferred_narrative:
-            sys_msg = {
-                "sender": "System",
-                "content": inferred_narrative,
-                "type": "system",
-                "target": channel,
-                "timestamp": self._get_timestamp()
-            }
-            self.state.chat_history.append(sys_msg)
-            yield f"data: {json.dumps({'type': 'msg_append', 'msg': sys_msg})}\n\n"
-
-        conflict_npcs = []
-        if channel == "group":
-            self._context_capture(text)
-            prev_len = len(self.state.chat_history)
-            conflict_npcs = self._context_event_infer(text, channel)
-            if len(self.state.chat_history) > prev_len:
-                msg = self.state.chat_history[-1]
-                yield f"data: {json.dumps({'type': 'msg_append', 'msg': msg})}\n\n"
-
-        event_mode = False
-        if conflict_npcs:
-            event_mode = True
-        elif channel == "group":
-            selected_topic_ids = await self._select_topic_npcs(text, channel)
-            if len(selected_topic_ids) >= 2:
-                event_mode = True
-        
-        if not event_mode:
-            active_npc_id = target_npc if target_npc != "group" else None
-            if not active_npc_id:
-                for npc_id, npc_data in self.state.npcs.items():
-                    name_str = str(getattr(npc_data, "name", npc_id) or "")
-                    base_name = name_str.split("（")[0].split("(")[0].strip()
-                    if (
-                        f"@{npc_id}" in text
-                        or f"@{name_str}" in text
-                        or (name_str and name_str in text)
-                        or (base_name and base_name in text)
-                    ):
-                        active_npc_id = npc_id
-                        break
-            if not active_npc_id:
-                active_npc_id = await self._infer_relevant_npc_by_text(text)
+    def _promotion_pending(self) -> bool:
+        review = self.state.promotion_review
+        return bool(review) and (review.get("status") or "") == "pending_answer"
 
-            target_npc_data = self.state.npcs.get(active_npc_id, {}) if active_npc_id else {}
-            recent_history = self._get_recent_history(channel, limit=5)
-
-            stream_gen = llm_service.process_action_stream(
-                text,
-                player.dict(),
-                chat_history=recent_history,
-                target_npc=target_npc_data.dict() if target_npc_data else None,
-            )
-
-            applied_intent = True
-            llm_reply_appended = False
-
-            def parse_intent_magnitude(content: str):
-                intent = None
-                magnitude = 1.0
-                for raw in (content or "").splitlines():
-                    line = raw.strip()
-                    if not line:
-                        continue
-                    if line.startswith("intent:"):
-                        intent = line.split("intent:", 1)[1].strip().upper()
-                    elif line.startswith("magnitude:"):
-                        try:
-                            magnitude = float(line.split("magnitude:", 1)[1].strip())
-                        except Exception:
-                            magnitude = 1.0
-                if not intent:
-                    return None, 1.0
-                return intent, max(0.0, min(2.0, magnitude))
-
-            def process_content(tag, content):
-                content = content.strip()
-                if not content:
-                    return
-
-                nonlocal applied_intent
-                nonlocal llm_reply_appended
-
-                if tag == "analysis":
-                    if applied_intent:
-                        return None
-                    intent, magnitude = parse_intent_magnitude(content)
-                    if intent:
-                        narrative = self._apply_effects(intent, magnitude, text, channel=channel)
-                        applied_intent = True
-                        if narrative:
-                            msg = {
-                                "sender": "System",
-                                "content": narrative,
-                                "type": "system",
-                                "target": channel,
-                                "timestamp": self._get_timestamp(),
-                            }
-                            self.state.chat_history.append(msg)
-                            return json.dumps({"type": "msg_append", "msg": msg})
-                    return None
-
-                if tag == "narrative":
-                    msg = {
-                        "sender": "System",
-                        "content": content,
-                        "type": "system",
-                        "target": channel,
-                        "timestamp": self._get_timestamp(),
-                    }
-                    self.state.chat_history.append(msg)
-                    return json.dumps({"type": "msg_append", "msg": msg})
-
-                elif tag == "reply":
-                    sender = active_npc_id if active_npc_id else "System"
-                    msg = {
-                        "sender": sender,
-                        "content": content,
-                        "type": "npc",
-                        "target": channel,
-                        "timestamp": self._get_timestamp(),
-                    }
-                    self.state.chat_history.append(msg)
-                    llm_reply_appended = True
-                    return json.dumps({"type": "msg_append", "msg": msg})
-
-                elif tag == "effects":
-                    lines = content.split("\n")
-                    for line in lines:
-                        if "mood:" in line:
-                            val = int(line.split(":")[1].strip())
-                            player.mood = max(0, min(100, player.mood + val))
-                        if "trust:" in line and active_npc_id:
-                            val = int(line.split(":")[1].strip())
-                            npc = self.state.npcs[active_npc_id]
-                            npc.trust = max(0, min(100, npc.trust + val))
-                            if self._is_executive(npc):
-                                player.political_capital = max(0, player.political_capital + max(0, int(val / 2)))
-                    return json.dumps({"type": "state_update", "state": self.state.dict()})
-                return None
-
-            full_response = ""
-            processed_pos = 0
-
-            async for chunk in stream_gen:
-                full_response += chunk
-
-                import re
-
-                tags = ["analysis", "narrative", "reply", "effects"]
-                for tag in tags:
-                    close_tag = f"</{tag}>"
-                    if close_tag in full_response[processed_pos:]:
-                        pattern = f"<{tag}.*?>(.*?)</{tag}>"
-                        match = re.search(pattern, full_response, re.DOTALL)
-                        if match:
-                            content = match.group(1).strip()
-                            match_end = match.end()
-                            if match_end > processed_pos:
-                                res_json = process_content(tag, content)
-                                if res_json:
-                                    yield f"data: {res_json}\n\n"
-
-                                if tag == "reply":
-                                    open_tag_match = re.search(f"<{tag}(.*?)>", full_response)
-                                    if open_tag_match:
-                                        attrs = open_tag_match.group(1)
-                                        if 'npc="' in attrs:
-                                            npc_name = attrs.split('npc="')[1].split('"')[0]
-                                            self.state.chat_history[-1]["sender"] = npc_name
-                                            yield f"data: {json.dumps({'type': 'msg_update', 'msg': self.state.chat_history[-1]})}\n\n"
-
-                                processed_pos = match_end
-
-            if not llm_reply_appended:
-                try:
-                    fallback_res = await llm_service.process_action(
-                        text,
-                        player.dict(),
-                        chat_history=recent_history,
-                        target_npc=target_npc_data.dict() if target_npc_data else None,
-                    )
-                    if fallback_res:
-                        npc_reply = fallback_res.get("npc_reply")
-                        if npc_reply:
-                            if target_npc_data:
-                                default_name = getattr(target_npc_data, "name", active_npc_id if active_npc_id else "System")
-                            else:
-                                default_name = active_npc_id if active_npc_id else "System"
-                            npc_name = fallback_res.get("npc_name") or default_name
-                            msg = {
-                                "sender": npc_name,
-                                "content": npc_reply,
-                                "type": "npc",
-                                "target": channel,
-                                "timestamp": self._get_timestamp(),
-                            }
-                            self.state.chat_history.append(msg)
-                            yield f"data: {json.dumps({'type': 'msg_append', 'msg': msg})}\n\n"
-                        sys_narrative = fallback_res.get("system_narrative")
-                        if sys_narrative:
-                            sys_msg = {
-                                "sender": "System",
-                                "content": sys_narrative,
-                                "type": "system",
-                                "target": channel,
-                                "timestamp": self._get_timestamp(),
-                            }
-                            self.state.chat_history.append(sys_msg)
-                            yield f"data: {json.dumps({'type': 'msg_append', 'msg': sys_msg})}\n\n"
-                except Exception:
-                    pass
-
-        if channel == "group" and len(self.state.npcs) > 1:
-            prev_len = len(self.state.chat_history)
-            responders = conflict_npcs if conflict_npcs else []
-            await self._npc_cross_talk(text, responders, channel)
-            if len(self.state.chat_history) > prev_len:
-                for msg in self.state.chat_history[prev_len:]:
-                    yield f"data: {json.dumps({'type': 'msg_append', 'msg': msg})}\n\n"
-
-        # 6. Check Random Events (Async)
-        if random.random() < 0.1:
-            prev_len = len(self.state.chat_history)
-            await self._trigger_random_event(channel)
-            if len(self.state.chat_history) > prev_len:
-                new_msg = self.state.chat_history[-1]
-                yield f"data: {json.dumps({'type': 'msg_append', 'msg': new_msg})}\n\n"
-
-        self._advance_time(channel, days=1)
-        self._check_game_over(channel)
+    def _new_turn_plan(self, text: str, target_npc: str = None) -> TurnPlan:
+        if self._promotion_pending():
+            kind = "promotion"
+        elif text.startswith("cmd:"):
+            kind = "command"
+        else:
+            kind = "chat"
+        plan = TurnPlan(kind=kind, text=text, target_npc=target_npc, channel=target_npc if target_npc else "group")
+        # 本回合（及其派生的推荐回复任务）里的 LLM 调用都带上这个 turn_id
+        metrics.bind(turn_id=plan.turn_id)
+        return plan
+
+    @traced("apply_turn")
+    def apply_turn(self, plan: TurnPlan):
+        """Apply a gathered plan in one transaction; state is rolled back if anything raises."""
+        applier = getattr(self, f"_apply_{plan.kind}_turn")
+        with TurnTransaction(self, plan):
+            applier(plan)
+            if plan.llm.get("suggested_replies") is not None:
+                self._apply_suggested_replies(plan.llm["suggested_replies"])
+        if self.journal:
+            # 落盘前序列化：之后 _finish_turn 追加的推荐回复单独记一条
+            self.journal.record(self, "plan", plan=plan.model_dump(mode="json", exclude={"outcome"}))
+
+    async def _finish_turn(self, plan: TurnPlan, timeout: float = None):
+        # 推荐回复依赖本回合落地后的聊天记录，只能在 apply 之后取；失败不影响回合本身
         try:
-            await asyncio.wait_for(self._refresh_suggested_replies(channel), timeout=5.0)
+            fetch = self._fetch_suggested_replies(plan.channel)
+            suggestions = await (asyncio.wait_for(fetch, timeout=timeout) if timeout else fetch)
         except Exception:
-            pass
-        yield f"data: {json.dumps({'type': 'state_update', 'state': self.state.dict()})}\n\n"
-        yield "data: [DONE]\n\n"
-
-    async def process_text_action(self, text: str, target_npc: str = None) -> GameState:
-        if self.state.active_global_event:
-            return self.state
-        if not self.state.player or self.state.game_over:
-            return self.state
-            
+            return
+        if suggestions is None:
+            return
+        async with self.lock:
+            plan.llm["suggested_replies"] = suggestions
+            self._commit_suggested_replies(suggestions)
+            self.publish_snapshot()
+
+    async def _plan_promotion(self, plan: TurnPlan):
+        # 回合内只收下答案，打分交给后台评审队列，不在会话锁里等 LLM
+        plan.advance = {"days": 1}
+
+    def _apply_promotion_turn(self, plan: TurnPlan):
+        self.state.chat_history.append(self._chat_msg("Me", plan.text, "player", plan.channel))
+        answer = self._pending_promotion_answer(plan.text)
+        if "promotion_score" in plan.llm:
+            # 旧版日志里的回合：当时是同步打分的，照原样重放
+            self._apply_promotion_answer(answer, plan.channel, plan.llm["promotion_score"])
+        elif answer:
+            self._submit_promotion_answer(answer, plan.channel)
+        self._advance_time(plan.channel, **plan.advance)
+        self._check_game_over(plan.channel)
+
+    def _apply_promotion_review_turn(self, plan: TurnPlan):
+        review = self.state.promotion_review
+        if not review or review.get("status") != "pending_score" or review.get("answer") != plan.text:
+            return  # 读档 / 恢复后评审已经换了一份，丢弃过期结果
+        self._apply_promotion_answer(plan.text, plan.channel, plan.llm.get("promotion_score"))
+
+    def _command_advance(self, plan: TurnPlan) -> dict:
+        # 单条 / 流式 / 批量指令共用的时间推进规则：工作台指令只结算指令本身；
+        # 聊天频道里按指令表的耗时推进，即时指令（买东西、领奖励等）和未知指令不推进
+        spec, _ = parse_command(plan.text)
+        if plan.channel == "workbench" or not spec or not spec.days:
+            return {}
+        return {"days": spec.days, "global_event_prob": 0.05}
+
+    async def _plan_command(self, plan: TurnPlan):
         player = self.state.player
-        narrative = ""
-        channel = target_npc if target_npc else "group"
+        spec, _ = parse_command(plan.text)
+        if spec and spec.npc_reply and random.random() < NPC_REPLY_CHANCE:
+            player_project = getattr(player, "current_project", None)
+            candidates = [
+                nid for nid, npc in self.state.npcs.items()
+                if getattr(npc, "status", "在职") == "在职"
+                and getattr(npc, "project", None) in [player_project, "General", "HR"]
+            ]
+        else:
+            candidates = []
+        if not candidates:
+            return
+        npc_id = random.choice(candidates)
+        npc_data = self.state.npcs.get(npc_id)
+        if not npc_data:
+            return
+        recent_history = self._get_recent_history(plan.channel, limit=5)
+        gen_result = await llm_service.process_action(
+            plan.text,
+            player.dict(),
+            chat_history=recent_history,
+            target_npc=npc_data.dict(),
+        )
+        plan.llm["npc_reply"] = {"npc_id": npc_id, "result": gen_result}
+
+    def _apply_command_turn(self, plan: TurnPlan):
+        self._handle_command(plan.text, plan.channel)
+        reply = plan.llm.get("npc_reply") or {}
+        gen_result = reply.get("result") or {}
+        npc_id = reply.get("npc_id")
+        npc_data = self.state.npcs.get(npc_id) if npc_id else None
+        npc_reply = gen_result.get("npc_reply")
+        if npc_data and npc_reply:
+            npc_name = gen_result.get("npc_name") or getattr(npc_data, "name", npc_id)
+            self.state.chat_history.append(self._chat_msg(npc_name, npc_reply, "npc", plan.channel))
+        if plan.advance:
+            self._advance_time(plan.channel, **plan.advance)
+            self._check_game_over(plan.channel)
+
+    async def _plan_chat(self, plan: TurnPlan):
+        player = self.state.player
+        text, channel = plan.text, plan.channel
+        plan.advance = {"days": 1}
+        plan.random_event_prob = 0.03
 
-        if self.state.promotion_review and (self.state.promotion_review.get("status") or "") == "pending_answer":
-            player_msg = {
-                "sender": "Me",
-                "content": text,
-                "type": "player",
-                "target": channel,
-                "timestamp": self._get_timestamp()
-            }
-            self.state.chat_history.append(player_msg)
-            await self._handle_promotion_answer(text, channel)
-            self._advance_time(channel, days=1)
-            self._check_game_over(channel)
-            try:
-                await self._refresh_suggested_replies(channel)
-            except Exception:
-                pass
-            return self.state
-
-        # 1. Handle Workbench Actions (Commands)
-        if text.startswith("cmd:"):
-            self._handle_command(text, channel)
-            if channel != "workbench":
-                if random.random() < 0.1:
-                    player_project = getattr(player, "current_project", None)
-                    candidates = [
-                        nid for nid, npc in self.state.npcs.items()
-                        if getattr(npc, "status", "在职") == "在职"
-                        and getattr(npc, "project", None) in [player_project, "General", "HR"]
-                    ]
-                else:
-                    candidates = []
-                if candidates:
-                    npc_id = random.choice(candidates)
-                    npc_data = self.state.npcs.get(npc_id)
-                    if npc_data:
-                        recent_history = self._get_recent_history(channel, limit=5)
-                        gen_result = await llm_service.process_action(
-                            text,
-                            player.dict(),
-                            chat_history=recent_history,
-                            target_npc=npc_data.dict(),
-                        )
-                        npc_reply = gen_result.get("npc_reply")
-                        if npc_reply:
-                            npc_name = gen_result.get("npc_name") or getattr(npc_data, "name", npc_id)
-                            self.state.chat_history.append({
-                                "sender": npc_name,
-                                "content": npc_reply,
-                                "type": "npc",
-                                "target": channel,
-                                "timestamp": self._get_timestamp()
-                            })
-                self._advance_time(channel, days=1, global_event_prob=0.05)
-                self._check_game_over(channel)
-            return self.state
-
-        # 2. Process Action via LLM (Combined Analysis + Generation)
-        # We skip separate analysis step to speed up
-        
-        # 4. Handle Mentions in Group Chat
-        active_npc_id = target_npc if target_npc != "group" else None
+        active_npc_id = plan.target_npc if plan.target_npc != "group" else None
         if not active_npc_id:
             for npc_id, npc_data in self.state.npcs.items():
                 if f"@{npc_id}" in text or f"@{npc_data.name}" in text or npc_data.name in text:
                     active_npc_id = npc_id
                     break
+        plan.active_npc_id = active_npc_id
 
-        # Append Player Message EARLY so it appears in history for NPCs
-        self.state.chat_history.append({
-            "sender": "Me",
-            "content": text,
-            "type": "player",
-            "target": channel,
-            "timestamp": self._get_timestamp()
-        })
-        
-        conflict_npcs = []
-        if channel == "group":
-            self._context_capture(text)
-            conflict_npcs = self._context_event_infer(text, channel)
+        # 玩家消息在 apply 时才真正写入，这里作为待提交消息拼进 prompt 的上下文
+        pending = [self._chat_msg("Me", text, "player", channel)]
+        conflict_npcs = self._peek_conflict_npcs(text) if channel == "group" else []
 
-        inferred_intent, inferred_magnitude = self._infer_intent_magnitude(text)
-        narrative = self._apply_effects(inferred_intent, inferred_magnitude, text, channel=channel)
-
-        # 5. Determine Responders (Multi-NPC Logic)
         responders = []
         if conflict_npcs:
             responders = conflict_npcs
@@ -2222,119 +1992,595 @@ class GameManager:
             responders.append(active_npc_id)
         elif channel == "group" and random.random() < 0.7:
             candidates = [
-                nid for nid, npc in self.state.npcs.items() 
+                nid for nid, npc in self.state.npcs.items()
                 if npc.project in [player.current_project, "General", "HR"]
             ]
             if candidates:
                 num_responders = random.choices([1, 2, 3], weights=[0.6, 0.3, 0.1])[0]
                 responders = random.sample(candidates, min(len(candidates), num_responders))
+        plan.responders = responders
+
+        recent_history = self._get_recent_history(channel, limit=5, pending=pending)
+
+        async def run_for_npc(npc_id: str):
+            npc_data = self.state.npcs.get(npc_id)
+            gen_result = await llm_service.process_action(
+                text,
+                player.dict(),
+                chat_history=recent_history,
+                target_npc=npc_data.dict() if npc_data else None,
+            )
+            return [npc_id, gen_result]
+
+        jobs = [run_for_npc(nid) for nid in responders]
+        if channel == "group" and len(self.state.npcs) > 1:
+            jobs.append(self._plan_cross_talk(plan, responders, pending=pending))
+        results = await asyncio.gather(*jobs)
+        plan.llm["replies"] = list(results[:len(responders)])
+
+    def _apply_chat_turn(self, plan: TurnPlan):
+        player = self.state.player
+        text, channel = plan.text, plan.channel
+        self.state.chat_history.append(self._chat_msg("Me", text, "player", channel))
+
+        if channel == "group":
+            self._context_capture(text)
+            self._context_event_infer(text, channel)
+
+        inferred_intent, inferred_magnitude = self._infer_intent_magnitude(text)
+        narrative = self._apply_effects(inferred_intent, inferred_magnitude, text, channel=channel)
+
+        for npc_id, gen_result in plan.llm.get("replies") or []:
+            if not gen_result:
+                continue
+
+            if "mood_change" in gen_result:
+                player.mood = max(0, min(100, player.mood + gen_result["mood_change"]))
+
+            if "trust_change" in gen_result:
+                npc = self.state.npcs[npc_id]
+                npc.trust = max(0, min(100, npc.trust + gen_result["trust_change"]))
+                if gen_result["trust_change"] < 0:
+                    narrative += f" {npc.name} 对你的信任度下降了。"
+
+            if gen_result.get("npc_reply"):
+                active_npc_data = self.state.npcs.get(npc_id)
+                default_name = getattr(active_npc_data, "name", npc_id)
+                npc_name = gen_result.get("npc_name", default_name)
+                self.state.chat_history.append(self._chat_msg(npc_name, gen_result["npc_reply"], "npc", channel))
+
+            sys_narrative = gen_result.get("system_narrative")
+            if sys_narrative:
+                sys_text = str(sys_narrative).strip()
+                if not sys_text.startswith("你在群里随便唠了两句"):
+                    self.state.chat_history.append(self._chat_msg("System", sys_text, "system", channel))
+
+        self._apply_cross_talk(plan)
+
+        if narrative:
+            self.state.chat_history.append(self._chat_msg("System", narrative, "system", channel))
 
-        if responders:
-            async def run_for_npc(npc_id: str):
-                active_npc_data = self.state.npcs.get(npc_id, {})
+        if random.random() < plan.random_event_prob:
+            self._apply_random_event(channel)
+
+        self._advance_time(channel, **plan.advance)
+        self._check_game_over(channel)
+
+    async def _plan_stream_chat(self, plan: TurnPlan, previews: list):
+        """
+        Stream variant of _plan_chat: yields preview frames while the LLM output
+        arrives. Each preview carries a ``preview_id`` (recorded in ``previews``)
+        that the ``msg_commit`` frame sent after apply refers back to.
+        """
+        player = self.state.player
+        text, channel = plan.text, plan.channel
+        plan.kind = "stream"
+        plan.advance = {"days": 1}
+        plan.random_event_prob = 0.1
+        # 玩家发言已在 stream_text_action 里单独提交（已在聊天记录里），这里只预览 LLM 产出的消息
+
+        conflict_npcs = self._peek_conflict_npcs(text) if channel == "group" else []
+        plan.responders = conflict_npcs
+        topic_ids = []
+        if conflict_npcs:
+            plan.event_mode = True
+        elif channel == "group":
+            topic_ids = await self._select_topic_npcs(text, channel)
+            plan.event_mode = len(topic_ids) >= 2
+
+        # 群聊接话和主回复互不依赖，并发请求
+        crosstalk_task = None
+        if channel == "group" and len(self.state.npcs) > 1:
+            crosstalk_task = asyncio.create_task(
+                self._plan_cross_talk(plan, conflict_npcs or topic_ids)
+            )
+        try:
+            if not plan.event_mode:
+                active_npc_id = plan.target_npc if plan.target_npc != "group" else None
+                if not active_npc_id:
+                    for npc_id, npc_data in self.state.npcs.items():
+                        name_str = str(getattr(npc_data, "name", npc_id) or "")
+                        base_name = name_str.split("（")[0].split("(")[0].strip()
+                        if (
+                            f"@{npc_id}" in text
+                            or f"@{name_str}" in text
+                            or (name_str and name_str in text)
+                            or (base_name and base_name in text)
+                        ):
+                            active_npc_id = npc_id
+                            break
+                if not active_npc_id:
+                    active_npc_id = await self._infer_relevant_npc_by_text(text)
+                    if active_npc_id:
+                        plan.known_ids.append(active_npc_id)
+                plan.active_npc_id = active_npc_id
+
+                target_npc_data = self.state.npcs.get(active_npc_id) if active_npc_id else None
                 recent_history = self._get_recent_history(channel, limit=5)
-                gen_result = await llm_service.process_action(
+                stream_gen = llm_service.process_action_stream(
                     text,
                     player.dict(),
                     chat_history=recent_history,
-                    target_npc=active_npc_data.dict(),
+                    target_npc=target_npc_data.dict() if target_npc_data else None,
+                    analysis=classify_intent(text).confidence < INTENT_CONFIDENCE_THRESHOLD,
                 )
-                return npc_id, gen_result
 
-            tasks = [run_for_npc(nid) for nid in responders]
-            results = await asyncio.gather(*tasks)
+                full_response = ""
+                processed_pos = 0
+                has_reply = False
+                async for chunk in stream_gen:
+                    full_response += chunk
+                    for tag, attrs, content, end in _iter_stream_sections(full_response):
+                        if end <= processed_pos:
+                            continue
+                        processed_pos = end
+                        msg = self._stream_section_msg(plan, tag, attrs, content)
+                        if msg:
+                            has_reply = has_reply or tag == "reply"
+                            yield self._preview_frame(plan, msg, previews)
+                plan.llm["stream_response"] = full_response
+
+                if not has_reply:
+                    try:
+                        plan.llm["fallback"] = await llm_service.process_action(
+                            text,
+                            player.dict(),
+                            chat_history=recent_history,
+                            target_npc=target_npc_data.dict() if target_npc_data else None,
+                        )
+                    except Exception:
+                        pass
+
+            if crosstalk_task:
+                await crosstalk_task
+        finally:
+            if crosstalk_task and not crosstalk_task.done():
+                crosstalk_task.cancel()
+
+    def _preview_frame(self, plan: TurnPlan, msg: dict, previews: list) -> str:
+        preview_id = f"{plan.turn_id}-{len(previews)}"
+        previews.append((preview_id, msg.get("sender"), msg.get("content"), msg.get("type")))
+        return sse_frame({'type': 'msg_append', 'msg': msg, 'preview_id': preview_id})
+
+    def _committed_frames(self, msgs: list, previews: list):
+        """
+        Frames for the messages a turn committed: previewed ones are only
+        acknowledged by id in one ``msg_commit`` frame (previews with no
+        committed counterpart are listed as ``discarded``), the rest are sent
+        once as ``msg_append``.
+        """
+        unmatched = list(previews)
+        committed = []
+        for msg in msgs:
+            key = (msg.get("sender"), msg.get("content"), msg.get("type"))
+            match = next((p for p in unmatched if p[1:] == key), None)
+            if match:
+                unmatched.remove(match)
+                committed.append(match[0])
+            else:
+                yield sse_frame({'type': 'msg_append', 'msg': msg})
+        if previews:
+            yield sse_frame({'type': 'msg_commit', 'preview_ids': committed, 'discarded': [p[0] for p in unmatched]})
 
-            for npc_id, gen_result in results:
-                if not gen_result:
-                    continue
+    def _apply_player_message_turn(self, plan: TurnPlan):
+        self.state.chat_history.append(self._chat_msg("Me", plan.text, "player", plan.channel))
 
-                if "mood_change" in gen_result:
-                    player.mood = max(0, min(100, player.mood + gen_result["mood_change"]))
+    def _stream_section_msg(self, plan: TurnPlan, tag: str, attrs: str, content: str):
+        content = content.strip()
+        if not content:
+            return None
+        if tag == "narrative":
+            return self._chat_msg("System", content, "system", plan.channel)
+        if tag == "reply":
+            sender = plan.active_npc_id if plan.active_npc_id else "System"
+            if 'npc="' in attrs:
+                sender = attrs.split('npc="')[1].split('"')[0]
+            return self._chat_msg(sender, content, "npc", plan.channel)
+        return None
 
-                if "trust_change" in gen_result:
-                    npc = self.state.npcs[npc_id]
-                    npc.trust = max(0, min(100, npc.trust + gen_result["trust_change"]))
-                    if gen_result["trust_change"] < 0:
-                        narrative += f" {npc.name} 对你的信任度下降了。"
+    def _apply_stream_effects(self, plan: TurnPlan, content: str):
+        player = self.state.player
+        for line in content.split("\n"):
+            try:
+                if "mood:" in line:
+                    val = int(line.split(":")[1].strip())
+                    player.mood = max(0, min(100, player.mood + val))
+                if "trust:" in line and plan.active_npc_id in self.state.npcs:
+                    val = int(line.split(":")[1].strip())
+                    npc = self.state.npcs[plan.active_npc_id]
+                    npc.trust = max(0, min(100, npc.trust + val))
+                    if self._is_executive(npc):
+                        player.political_capital = max(0, player.political_capital + max(0, int(val / 2)))
+            except ValueError:
+                continue
 
-                if gen_result.get("npc_reply"):
-                    active_npc_data = self.state.npcs.get(npc_id, {})
-                    if hasattr(active_npc_data, "name"):
-                        default_name = active_npc_data.name
-                    else:
-                        default_name = npc_id
-                    npc_name = gen_result.get("npc_name", default_name)
-                    self.state.chat_history.append({
-                        "sender": npc_name,
-                        "content": gen_result["npc_reply"],
-                        "type": "npc",
-                        "target": channel,
-                        "timestamp": self._get_timestamp()
-                    })
+    def _apply_stream_turn(self, plan: TurnPlan):
+        text, channel = plan.text, plan.channel
+        if not plan.player_committed:
+            self.state.chat_history.append(self._chat_msg("Me", text, "player", channel))
+        for npc_id in plan.known_ids:
+            self._mark_npc_known(npc_id)
 
-                sys_narrative = gen_result.get("system_narrative")
+        inferred_intent, inferred_magnitude = self._stream_intent(plan)
+        inferred_narrative = self._apply_effects(inferred_intent, inferred_magnitude, text, channel=channel)
+        if inferred_narrative:
+            self.state.chat_history.append(self._chat_msg("System", inferred_narrative, "system", channel))
+
+        if channel == "group":
+            self._context_capture(text)
+            self._context_event_infer(text, channel)
+
+        if not plan.event_mode:
+            has_reply = False
+            for tag, attrs, content, _ in _iter_stream_sections(plan.llm.get("stream_response") or ""):
+                if tag == "effects":
+                    self._apply_stream_effects(plan, content)
+                    continue
+                msg = self._stream_section_msg(plan, tag, attrs, content)
+                if msg:
+                    has_reply = has_reply or tag == "reply"
+                    self.state.chat_history.append(msg)
+
+            fallback_res = plan.llm.get("fallback")
+            if not has_reply and fallback_res:
+                npc_reply = fallback_res.get("npc_reply")
+                if npc_reply:
+                    target_npc_data = self.state.npcs.get(plan.active_npc_id) if plan.active_npc_id else None
+                    if target_npc_data:
+                        default_name = getattr(target_npc_data, "name", plan.active_npc_id)
+                    else:
+                        default_name = plan.active_npc_id if plan.active_npc_id else "System"
+                    npc_name = fallback_res.get("npc_name") or default_name
+                    self.state.chat_history.append(self._chat_msg(npc_name, npc_reply, "npc", channel))
+                sys_narrative = fallback_res.get("system_narrative")
                 if sys_narrative:
-                    sys_text = str(sys_narrative).strip()
-                    if not sys_text.startswith("你在群里随便唠了两句"):
-                        self.state.chat_history.append({
-                            "sender": "System",
-                            "content": sys_text,
-                            "type": "system",
-                            "target": channel,
-                            "timestamp": self._get_timestamp()
-                        })
+                    self.state.chat_history.append(self._chat_msg("System", sys_narrative, "system", channel))
 
-        if channel == "group" and len(self.state.npcs) > 1:
-            await self._npc_cross_talk(text, responders, channel)
+        self._apply_cross_talk(plan)
 
-        if narrative:
-            self.state.chat_history.append({
-                "sender": "System",
-                "content": narrative,
-                "type": "system",
-                "target": channel,
-                "timestamp": self._get_timestamp()
-            })
+        if random.random() < plan.random_event_prob:
+            self._apply_random_event(channel)
 
-        if random.random() < 0.03:
-            await self._trigger_random_event(channel)
-        
-        self._advance_time(channel, days=1)
+        self._advance_time(channel, **plan.advance)
         self._check_game_over(channel)
-        try:
-            await self._refresh_suggested_replies(channel)
-        except Exception:
-            pass
-        return self.state
-    
-    async def _handle_promotion_answer(self, text: str, channel: str):
-        player = self.state.player
-        if not player:
-            return
-        review = self.state.promotion_review or {}
-        if not review:
+
+    def _stream_blocked_frames(self):
+        if self.state.active_global_event:
+            return [sse_frame({'type': 'error', 'content': '当前有全局事件进行中，请先处理事件提示。'})]
+        if not self.state.player:
+            return [sse_frame({'type': 'error', 'content': 'Game not initialized'})]
+        if self.state.game_over:
+            return [self._state_update_frame(), "data: [DONE]\n\n"]
+        return None
+
+    def _turn_blocked(self) -> bool:
+        return bool(self.state.active_global_event) or not self.state.player or self.state.game_over
+
+    async def stream_text_action(self, text: str, target_npc: str = None):
+        """
+        Streamed chat / command turn. Planning (LLM calls, the preview stream)
+        runs without ``self.lock``; the lock is held only to apply the plan and
+        publish. If something else committed meanwhile (``state_version``
+        moved) the plan is stale: its previews are discarded and it is planned
+        again. The last of ``TURN_REPLANS`` retries plans under the lock, so a
+        turn always lands.
+        """
+        blocked = self._stream_blocked_frames()
+        if blocked:
+            for frame in blocked:
+                yield frame
             return
-        status = review.get("status") or ""
-        if status != "pending_answer":
+
+        plan = self._new_turn_plan(text, target_npc)
+        kind = plan.kind
+        if kind == "chat":
+            # 先把玩家发言单独提交（落日志）：流到一半客户端断开也不会丢
+            async with self.lock:
+                self.apply_turn(TurnPlan(kind="player_message", text=text, channel=plan.channel))
+                self.publish_snapshot()
+                msg = self.state.chat_history[-1]
+            plan.player_committed = True
+            yield sse_frame({'type': 'msg_append', 'msg': msg})
+
+        previews, frames = [], []
+        for attempt in range(TURN_REPLANS + 1):
+            held = False
+            try:
+                if attempt == TURN_REPLANS:
+                    await self.lock.acquire()
+                    held = True
+                if attempt:
+                    # 规划期间状态被别的提交改过：已发的预览作废，按最新状态重新规划
+                    if previews:
+                        yield sse_frame({'type': 'msg_commit', 'preview_ids': [], 'discarded': [p[0] for p in previews]})
+                        previews = []
+                    blocked = self._stream_blocked_frames()
+                    if blocked:
+                        for frame in blocked:
+                            yield frame
+                        return
+                    plan = TurnPlan(
+                        kind=kind, text=text, target_npc=target_npc,
+                        channel=plan.channel, player_committed=plan.player_committed,
+                    )
+                    metrics.bind(turn_id=plan.turn_id)
+                version = self.state_version
+                if kind == "promotion":
+                    await self._plan_promotion(plan)
+                elif kind == "command":
+                    plan.advance = self._command_advance(plan)
+                    if plan.channel != "workbench":
+                        await self._plan_command(plan)
+                else:
+                    async for frame in self._plan_stream_chat(plan, previews):
+                        yield frame
+                if not held:
+                    await self.lock.acquire()
+                    held = True
+                if self.state_version != version:
+                    continue
+                prev_len = len(self.state.chat_history)
+                self.apply_turn(plan)
+                self.start_promotion_review()
+                self.publish_snapshot()
+                frames = list(self._committed_frames(self.state.chat_history[prev_len:], previews))
+                break
+            finally:
+                if held:
+                    self.lock.release()
+
+        for frame in frames:
+            yield frame
+        if kind == "command":
+            yield self._state_update_frame()
+            timing = self._timing_frame()
+            if timing:
+                yield timing
             return
+
+        await self._finish_turn(plan, timeout=5.0)
+        yield self._state_update_frame()
+        timing = self._timing_frame()
+        if timing:
+            yield timing
+        yield "data: [DONE]\n\n"
+
+    async def process_text_action(self, text: str, target_npc: str = None) -> GameState:
+        """
+        Chat / command turn. Like stream_text_action, the plan is gathered
+        without ``self.lock`` and gathered again if ``state_version`` moved
+        before the lock was taken; the lock covers only apply + publish.
+        """
+        plan = None
+        for attempt in range(TURN_REPLANS + 1):
+            held = False
+            try:
+                if attempt == TURN_REPLANS:
+                    await self.lock.acquire()
+                    held = True
+                if self._turn_blocked():
+                    return self.snapshot
+                version = self.state_version
+                plan = self._new_turn_plan(text, target_npc)
+                if plan.kind == "promotion":
+                    await self._plan_promotion(plan)
+                elif plan.kind == "command":
+                    plan.advance = self._command_advance(plan)
+                    if plan.channel != "workbench":
+                        await self._plan_command(plan)
+                else:
+                    await self._plan_chat(plan)
+                if not held:
+                    await self.lock.acquire()
+                    held = True
+                if self.state_version != version:
+                    continue
+                self.apply_turn(plan)
+                self.start_promotion_review()
+                self.publish_snapshot()
+                break
+            finally:
+                if held:
+                    self.lock.release()
+
+        if plan.kind != "command":
+            await self._finish_turn(plan)
+        return self.snapshot
+
+    def apply_command_batch(self, commands: list, advance: str = "per_command") -> list:
+        """
+        Apply ``(text, target_npc)`` workbench commands back to back without LLM calls.
+
+        advance: ``per_command`` keeps each command's usual time advance,
+        ``once`` advances one week after the whole batch, ``none`` never advances.
+        Returns one result dict per command; unknown commands are skipped with
+        ``reason: unknown_command`` and never trigger the ``once`` advance.
+        The new snapshot is published once.
+        """
+        results = []
+        applied_channel = None
+        for text, target_npc in commands:
+            result = {"command": text, "applied": False}
+            results.append(result)
+            if self.state.active_global_event:
+                result["reason"] = "global_event"
+                continue
+            if not self.state.player or self.state.game_over:
+                result["reason"] = "game_over"
+                continue
+            plan = self._new_turn_plan(text, target_npc)
+            if plan.kind != "command":
+                result["reason"] = "not_command"
+                continue
+            if parse_command(text)[0] is None:
+                result["reason"] = "unknown_command"
+                continue
+            if advance == "per_command":
+                plan.advance = self._command_advance(plan)
+            self.apply_turn(plan)
+            result["applied"] = True
+            applied_channel = plan.channel
+
+        if advance == "once" and applied_channel and not self.state.game_over:
+            channel = applied_channel if applied_channel != "workbench" else "group"
+            self.apply_turn(TurnPlan(kind="advance", text="", channel=channel, advance={"weeks": 1, "global_event_prob": 0.05}))
+        self.publish_snapshot()
+        return results
+
+    def _apply_advance_turn(self, plan: TurnPlan):
+        self._advance_time(plan.channel, **plan.advance)
+        self._check_game_over(plan.channel)
+
+    def fast_forward(self, weeks: int, channel: str = "group") -> dict:
+        """
+        Simulate up to ``weeks`` weeks in one transaction and publish once.
+        Stops early on game over, a global event or a pending promotion review.
+        """
+        plan = TurnPlan(kind="fast_forward", text="", channel=channel, advance={"weeks": max(0, int(weeks))})
+        self.apply_turn(plan)
+        self.publish_snapshot()
+        return plan.outcome
+
+    def _fast_forward_stop_reason(self):
+        if self.state.game_over:
+            return "game_over"
+        if self.state.active_global_event:
+            return "global_event"
+        if self._promotion_pending():
+            return "promotion_review"
+        return None
+
+    def _apply_fast_forward_turn(self, plan: TurnPlan):
+        player = self.state.player
+        channel = plan.channel
+        start_week = self.state.week
+        start_history = len(self.state.chat_history)
+        start_stats = {k: getattr(player, k) for k in FAST_FORWARD_STATS} if player else {}
+
+        weeks_advanced = 0
+        stop_reason = self._fast_forward_stop_reason() if player else "not_started"
+        while not stop_reason and weeks_advanced < plan.advance.get("weeks", 0):
+            self._advance_time(channel, weeks=1)
+            self._check_game_over(channel)
+            weeks_advanced += 1
+            stop_reason = self._fast_forward_stop_reason()
+
+        # 每周的系统消息折叠成一条摘要，NPC 发言等其他消息原样保留
+        new_msgs = self.state.chat_history[start_history:]
+        del self.state.chat_history[start_history:]
+        counts = {}
+        for msg in new_msgs:
+            if msg.get("type") == "system":
+                content = str(msg.get("content") or "").strip()
+                if content:
+                    counts[content] = counts.get(content, 0) + 1
+        digest = [f"{content} ×{n}" if n > 1 else content for content, n in counts.items()]
+        if weeks_advanced:
+            head = f"快进 {weeks_advanced} 周（第 {start_week} 周 → 第 {self.state.week} 周）"
+            shown = digest[:FAST_FORWARD_DIGEST_LINES]
+            body = "；".join(line.rstrip("。") for line in shown)
+            if len(digest) > len(shown):
+                body += f"；另有 {len(digest) - len(shown)} 条动态"
+            self.state.chat_history.append(self._chat_msg("System", f"{head}：{body}" if body else f"{head}，一切平稳。", "system", channel))
+        self.state.chat_history.extend(m for m in new_msgs if m.get("type") != "system")
+
+        changes = {}
+        if player:
+            for key, before in start_stats.items():
+                after = getattr(player, key)
+                if after != before:
+                    changes[key] = after - before if isinstance(after, (int, float)) else after
+        plan.outcome = {
+            "weeks_requested": plan.advance.get("weeks", 0),
+            "weeks_advanced": weeks_advanced,
+            "from_week": start_week,
+            "to_week": self.state.week,
+            "stopped_by": stop_reason,
+            "changes": changes,
+            "digest": digest,
+        }
+
+    def _pending_promotion_answer(self, text: str):
+        if not self.state.player or not self._promotion_pending():
+            return None
         answer = (text or "").strip()
-        if not answer:
-            return
+        return answer or None
+
+    def _submit_promotion_answer(self, answer: str, channel: str):
+        review = self.state.promotion_review
         review["answer"] = answer
         review["status"] = "pending_score"
-        self.state.promotion_review = review
-        score_result = await llm_service.score_promotion_answer(
-            {
-                "role": getattr(player, "role", None),
-                "level": getattr(player, "level", None),
-                "current_project": getattr(player, "current_project", None),
-            },
-            {
-                "target_level": f"P{review.get('target_level')}",
-                "question": review.get("question"),
-                "answer": answer,
-            },
+        review["channel"] = channel
+        self.state.chat_history.append({
+            "sender": "System",
+            "content": "述职材料已提交，评审结果出来后会第一时间通知你。",
+            "type": "system",
+            "target": channel,
+            "timestamp": self._get_timestamp()
+        })
+
+    def start_promotion_review(self):
+        """Queue scoring for a submitted answer (after a turn, or after recovery / load left one pending)."""
+        review = self.state.promotion_review
+        if not review or review.get("status") != "pending_score" or not review.get("answer"):
+            return None
+        # 打分排在 promotion_reviews 自己的队列里（有独立的并发上限），不再占全局后台名额
+        return self.background.spawn(
+            "promotion_review",
+            lambda: self._plan_promotion_review(review),
+            self.apply_turn,
+            shared_slot=False,
+        )
+
+    async def _plan_promotion_review(self, review: dict):
+        plan = TurnPlan(kind="promotion_review", text=review["answer"], channel=review.get("channel") or "group")
+        metrics.bind(turn_id=plan.turn_id)
+        player = self.state.player
+        project = getattr(player, "current_project", "") or ""
+        plan.llm["promotion_score"] = await promotion_reviews.score(
+            lambda: llm_service.score_promotion_answer(
+                {
+                    "role": getattr(player, "role", None),
+                    "level": getattr(player, "level", None),
+                    "current_project": project or None,
+                },
+                {
+                    "target_level": f"P{review.get('target_level')}",
+                    "question": review.get("question"),
+                    "answer": review["answer"],
+                },
+            ),
+            review["answer"],
+            project,
         )
+        return plan
+
+    def _apply_promotion_answer(self, answer: str, channel: str, score_result):
+        if not answer or score_result is None:
+            return
+        player = self.state.player
+        review = self.state.promotion_review
+        review["answer"] = answer
         score = int(score_result.get("score", 0))
         comment = str(score_result.get("comment", "")).strip()
         threshold = int(review.get("score_threshold") or 60)
@@ -2342,6 +2588,7 @@ class GameManager:
         review["score"] = score
         review["comment"] = comment
         review["passed"] = passed
+        review["scored_by"] = score_result.get("scored_by", "llm")
         review["status"] = "finished"
         self.state.promotion_review = review
         msg1 = f"本次述职得分：{score} 分（通过线 {threshold} 分）。"
@@ -2377,13 +2624,13 @@ class GameManager:
             "timestamp": self._get_timestamp()
         })
     
-    def _context_capture(self, text: str):
+    def _capture_slots(self, text: str):
         key = ""
         t = text or ""
         if "邀请制" in t:
             key = "邀请制"
         if not key:
-            return
+            return "", {}
         slots = self.state.context_slots.get(key) or {}
         prod_id = slots.get("Product")
         dev_id = slots.get("Dev")
@@ -2406,43 +2653,69 @@ class GameManager:
             m["Product"] = prod_id
         if dev_id:
             m["Dev"] = dev_id
-        if m:
-            self.state.context_slots[key] = {**slots, **m}
-            self.state.last_topic = key
-            if ("谁" in t or "是谁" in t or "who" in t.lower()) and ("产品" in t and ("研发" in t or "工程师" in t)):
-                p = self.state.npcs.get(prod_id)
-                d = self.state.npcs.get(dev_id)
-                if p and d:
-                    msg = f"{key} 的产品与研发分别是 {p.name} 与 {d.name}。"
-                    self.state.chat_history.append({
-                        "sender": "System",
-                        "content": msg,
-                        "type": "system",
-                        "target": "group",
-                        "timestamp": self._get_timestamp()
-                    })
-    
-    def _context_event_infer(self, text: str, channel: str) -> list:
+        if not m:
+            return key, {}
+        return key, {**slots, **m}
+
+    @traced("context_capture")
+    def _context_capture(self, text: str):
+        key, slots = self._capture_slots(text)
+        if not slots:
+            return
+        t = text or ""
+        self.state.context_slots[key] = slots
+        self.state.last_topic = key
+        if ("谁" in t or "是谁" in t or "who" in t.lower()) and ("产品" in t and ("研发" in t or "工程师" in t)):
+            p = self.state.npcs.get(slots.get("Product"))
+            d = self.state.npcs.get(slots.get("Dev"))
+            if p and d:
+                msg = f"{key} 的产品与研发分别是 {p.name} 与 {d.name}。"
+                self.state.chat_history.append({
+                    "sender": "System",
+                    "content": msg,
+                    "type": "system",
+                    "target": "group",
+                    "timestamp": self._get_timestamp()
+                })
+
+    def _conflict_pair(self, text: str, context_slots: dict, last_topic: str):
         t = text or ""
         topic = ""
         if "邀请制" in t:
             topic = "邀请制"
         if not topic:
-            topic = self.state.last_topic or ""
+            topic = last_topic or ""
         if not topic:
-            return []
+            return None
         if ("打起来" in t or "吵起来" in t or "冲突" in t) and ("产品" in t and ("研发" in t or "工程师" in t)):
-            slots = self.state.context_slots.get(topic) or {}
+            slots = context_slots.get(topic) or {}
             prod_id = slots.get("Product")
             dev_id = slots.get("Dev")
-            if prod_id and dev_id:
-                prod = self.state.npcs.get(prod_id)
-                dev = self.state.npcs.get(dev_id)
-                if prod and dev:
-                    proj_name = prod.project or dev.project or "General"
-                    self._emit_relation_conflict(dev, prod, proj_name, channel)
-                    return [dev_id, prod_id]
-        return []
+            if prod_id and dev_id and prod_id in self.state.npcs and dev_id in self.state.npcs:
+                return dev_id, prod_id
+        return None
+
+    def _peek_conflict_npcs(self, text: str) -> list:
+        # 与 _context_capture + _context_event_infer 的判定一致，但不修改状态，供 plan 阶段选人
+        key, slots = self._capture_slots(text)
+        context_slots = self.state.context_slots
+        last_topic = self.state.last_topic
+        if slots:
+            context_slots = {**context_slots, key: slots}
+            last_topic = key
+        pair = self._conflict_pair(text, context_slots, last_topic)
+        return list(pair) if pair else []
+
+    def _context_event_infer(self, text: str, channel: str) -> list:
+        pair = self._conflict_pair(text, self.state.context_slots, self.state.last_topic)
+        if not pair:
+            return []
+        dev_id, prod_id = pair
+        prod = self.state.npcs[prod_id]
+        dev = self.state.npcs[dev_id]
+        proj_name = prod.project or dev.project or "General"
+        self._emit_relation_conflict(dev, prod, proj_name, channel)
+        return [dev_id, prod_id]
     
     def _emit_relation_conflict(self, npc_a, npc_b, project_name: str, channel: str):
         player = self.state.player
@@ -2697,298 +2970,30 @@ class GameManager:
         return base_desc
     
     def _handle_command(self, text: str, channel: str) -> GameState:
-        player = self.state.player
-        raw = text[len("cmd:"):] if text.startswith("cmd:") else text
-        parts = raw.split(":")
-        cmd = parts[0] if parts else raw
-        arg = parts[1] if len(parts) > 1 else None
-        narrative = ""
-        if not player:
-            return self.state
-        
-        if cmd == "eat_mifan":
-            narrative = self._apply_rice_item("standard")
-        elif cmd == "eat_mifan_light":
-            narrative = self._apply_rice_item("light")
-        elif cmd == "eat_mifan_luxury":
-            narrative = self._apply_rice_item("luxury")
-        elif cmd == "rice":
-            narrative = self._apply_rice_item(arg)
-        elif cmd == "work_hard":
-            narrative = self._apply_effects("WORK", 1.5, "", channel=channel)
-        elif cmd == "work_normal":
-            base = self._apply_effects("WORK", 1.0, "老实干活推进项目", channel=channel)
-            project = self.state.projects.get(player.current_project)
-            extra = ""
-            if project:
-                bonus_max = max(0, int(player.hard_skill / 40))
-                prog_bonus = random.randint(0, bonus_max) if bonus_max > 0 else 0
-                risk_shift = 0
-                if player.mood >= 70:
-                    risk_shift = -random.randint(0, 2)
-                elif player.mood <= 40:
-                    risk_shift = random.randint(0, 2)
-                if prog_bonus:
-                    project.progress = max(0, min(100, project.progress + prog_bonus))
-                    extra += f" 项目额外进度 +{prog_bonus}"
-                if risk_shift:
-                    project.risk = max(0, min(100, project.risk + risk_shift))
-                    if risk_shift < 0:
-                        extra += f"，项目风险 {risk_shift}"
-                    else:
-                        extra += f"，项目风险 +{risk_shift}"
-            narrative = base + extra if base else extra
-        elif cmd == "tech_breakthrough":
-            base = self._apply_effects("WORK", 1.5, "技术突破，加班钻研技术方案", channel=channel)
-            project = self.state.projects.get(player.current_project)
-            extra_parts = []
-            hard_gain_max = 1 + (1 if player.hard_skill >= 60 else 0)
-            hard_gain = random.randint(1, hard_gain_max)
-            player.hard_skill += hard_gain
-            extra_parts.append(f"硬技能 +{hard_gain}")
-            if project:
-                base_prog = random.randint(2, 5)
-                prog_factor = max(0.7, min(1.6, player.hard_skill / 60.0))
-                prog_boost = max(1, int(base_prog * prog_factor))
-                base_risk = random.randint(1, 3)
-                risk_factor = max(0.7, min(1.5, player.hard_skill / 70.0))
-                risk_drop = max(1, int(base_risk * risk_factor))
-                project.progress = max(0, min(100, project.progress + prog_boost))
-                project.risk = max(0, min(100, project.risk - risk_drop))
-                extra_parts.append(f"项目进度 +{prog_boost}")
-                extra_parts.append(f"项目风险 -{risk_drop}")
-            narrative = base or ""
-            if extra_parts:
-                narrative = f"{narrative} " if narrative else ""
-                narrative += "，".join(extra_parts)
-        elif cmd == "make_ppt":
-            project = self.state.projects.get(player.current_project)
-            energy_cost = random.randint(6, 10)
-            mood_drop = random.randint(1, 4)
-            player.energy = max(0, player.energy - energy_cost)
-            player.mood = max(0, min(100, player.mood - mood_drop))
-            soft_max = 1 + (1 if player.soft_skill >= 60 else 0)
-            soft_gain = random.randint(1, soft_max)
-            player.soft_skill += soft_gain
-            proj_desc = ""
-            if project:
-                prog_base = random.randint(0, 2)
-                trust_base = random.randint(2, 4)
-                morale_base = random.randint(0, 2)
-                if player.soft_skill >= 70:
-                    trust_base += 1
-                prog_gain = prog_base
-                trust_gain = trust_base
-                morale_gain = morale_base
-                project.progress = max(0, min(100, project.progress + prog_gain))
-                project.stakeholder_trust = min(100, project.stakeholder_trust + trust_gain)
-                project.morale = max(0, min(100, project.morale + morale_gain))
-                proj_desc = f"，项目信任 +{trust_gain}，项目进度 +{prog_gain}"
-            narrative = f"你花时间包装PPT，为项目讲故事。精力 -{energy_cost}，心情 -{mood_drop}，软技能 +{soft_gain}{proj_desc}。"
-        elif cmd == "align_meeting":
-            text = "拉群对齐项目节奏"
-            base = self._apply_effects("SOCIAL", 1.1, text, channel=channel)
-            project = self.state.projects.get(player.current_project)
-            extra = ""
-            if project:
-                prog_base = random.randint(0, 2)
-                risk_base = random.randint(0, 2)
-                if player.soft_skill >= 60:
-                    prog_base += 1
-                if player.soft_skill >= 70:
-                    risk_base += 1
-                prog_gain = max(1, prog_base)
-                risk_drop = max(0, risk_base)
-                if prog_gain:
-                    project.progress = max(0, min(100, project.progress + prog_gain))
-                if risk_drop:
-                    project.risk = max(0, min(100, project.risk - risk_drop))
-                if prog_gain or risk_drop:
-                    extra = f" 项目进度 +{prog_gain}，项目风险 -{risk_drop}。"
-            narrative = base + extra if base else (extra or "你拉了一场对齐会。")
-        elif cmd == "paid_slack":
-            project = self.state.projects.get(player.current_project)
-            mood_min, mood_max = 2, 6
-            if player.mood <= 40:
-                mood_max += 2
-            mood_gain = random.randint(mood_min, mood_max)
-            energy_min, energy_max = 2, 5
-            if player.energy <= int(player.max_energy * 0.5):
-                energy_max += 1
-            energy_gain = random.randint(energy_min, energy_max)
-            player.mood = max(0, min(100, player.mood + mood_gain))
-            player.energy = min(player.max_energy, player.energy + energy_gain)
-            if project:
-                prog_loss = random.randint(1, 3)
-                if player.hard_skill >= 70 or player.soft_skill >= 70:
-                    prog_loss = max(1, prog_loss - 1)
-                trust_loss = random.randint(1, 2)
-                if player.political_capital >= 10:
-                    trust_loss = max(1, trust_loss - 1)
-                project.progress = max(0, min(100, project.progress - prog_loss))
-                project.stakeholder_trust = max(0, project.stakeholder_trust - trust_loss)
-                narrative = f"你选择在工位带薪摸鱼，心情 +{mood_gain}，精力 +{energy_gain}，项目进度 -{prog_loss}，项目信任 -{trust_loss}。"
-            else:
-                narrative = f"你选择在工位带薪摸鱼，心情 +{mood_gain}，精力 +{energy_gain}。"
-        elif cmd == "tutorial_reward":
-            if getattr(self.state, "tutorial_reward_claimed", False):
-                narrative = "新手任务奖励已领取过了。"
-            else:
-                money_gain = 200
-                energy_gain = 10
-                mood_gain = 5
-                player.money = max(0, player.money + money_gain)
-                player.energy = min(player.max_energy, player.energy + energy_gain)
-                player.mood = max(0, min(100, player.mood + mood_gain))
-                self.state.tutorial_reward_claimed = True
-                narrative = f"新手任务完成！奖励已发放：金钱 +{money_gain}，精力 +{energy_gain}，心情 +{mood_gain}。"
-        elif cmd == "rest":
-            narrative = self._apply_effects("REFUSE", 1.0, "", channel=channel)
-        elif cmd == "report":
-            narrative = self._apply_effects("WORK", 1.0, "", channel=channel)
-        elif cmd == "msg_boss":
-            narrative = self._apply_manage_up(channel)
-        elif cmd == "buy_gift":
-            narrative = self._apply_shop_item("gift", channel)
-        elif cmd == "buy_gpu":
-            narrative = self._apply_shop_item("gpu", channel)
-        elif cmd == "buy_monitor":
-            narrative = self._apply_shop_item("monitor", channel)
-        elif cmd == "buy_chair":
-            narrative = self._apply_shop_item("chair", channel)
-        elif cmd == "shop":
-            narrative = self._apply_shop_item(arg, channel)
-        elif cmd == "house":
-            narrative = self._apply_house_purchase(arg)
-        elif cmd == "learn_skill":
-            narrative = self._apply_academy_course("base", channel)
-        elif cmd == "train_hard":
-            narrative = self._apply_academy_course("hard_camp", channel)
-        elif cmd == "train_soft":
-            narrative = self._apply_academy_course("soft_workshop", channel)
-        elif cmd == "train_leadership":
-            narrative = self._apply_academy_course("leadership", channel)
-        elif cmd == "academy":
-            narrative = self._apply_academy_course(arg, channel)
-        elif cmd == "transfer":
-            target_project = (arg or "").strip()
-            if not target_project:
-                narrative = "转岗失败：缺少目标项目（例如 cmd:transfer:HSR）。"
-            else:
-                proj = self.state.projects.get(target_project)
-                if not proj:
-                    narrative = f"转岗失败：未找到项目 {target_project}。"
-                elif proj.status == ProjectStatus.CANCELED:
-                    narrative = f"转岗失败：{proj.name} 已被砍。"
-                else:
-                    player.current_project = target_project
-                    narrative = f"你提交了转岗申请，已加入 {proj.name}。"
-                    self._add_fact(f"转岗 {proj.name}")
-        elif cmd == "add_subordinate":
-            npc_id = (arg or "").strip()
-            if self._parse_level(player.level) < 7:
-                narrative = "权限不足：需晋升至 P7 及以上才能管理下属。"
-            elif not npc_id or npc_id not in self.state.npcs:
-                narrative = "添加下属失败：未找到该 NPC。"
-            else:
-                npc = self.state.npcs[npc_id]
-                if npc.status != "在职":
-                    narrative = f"添加下属失败：{npc.name} 当前不在职。"
-                elif npc_id in self.state.player_subordinates:
-                    narrative = f"{npc.name} 已经是你的下属了。"
-                elif npc.project not in [player.current_project, "General", "HR"]:
-                    narrative = f"添加下属失败：{npc.name} 不在你当前项目线，无法直接管理。"
-                elif self._parse_level(npc.level) >= self._parse_level(player.level):
-                    narrative = f"添加下属失败：{npc.name} 职级不低于你。"
-                else:
-                    self.state.player_subordinates.append(npc_id)
-                    npc.manager_id = player.name
-                    narrative = f"你正式将 {npc.name} 划入麾下，成为你的下属。"
-        elif cmd == "remove_subordinate":
-            npc_id = (arg or "").strip()
-            if npc_id in self.state.player_subordinates:
-                self.state.player_subordinates = [
-                    sid for sid in self.state.player_subordinates if sid != npc_id
-                ]
-                npc = self.state.npcs.get(npc_id)
-                if npc and getattr(npc, "manager_id", None) == player.name:
-                    npc.manager_id = None
-                narrative = f"你与 {npc.name if npc else npc_id} 解除了一对一汇报关系。"
-            else:
-                narrative = "当前没有该下属记录。"
-        elif cmd == "sub_work":
-            npc_id = (arg or "").strip()
-            if self._parse_level(player.level) < 7:
-                narrative = "指派失败：需晋升至 P7 及以上才能指派下属工作。"
-            elif not npc_id or npc_id not in self.state.npcs:
-                narrative = "指派失败：未找到该 NPC。"
-            elif npc_id not in self.state.player_subordinates:
-                narrative = "指派失败：该 NPC 不是你的下属。"
-            else:
-                npc = self.state.npcs[npc_id]
-                project = self.state.projects.get(player.current_project)
-                if not project:
-                    narrative = "指派失败：当前无有效项目。"
-                else:
-                    fatigue = random.randint(5, 15)
-                    mood_delta = -random.randint(0, 8)
-                    npc.mood = max(0, min(100, npc.mood + mood_delta))
-                    efficiency = max(1, int(self._parse_level(npc.level) / 2))
-                    prog_gain = max(1, efficiency)
-                    project.progress = min(200, project.progress + prog_gain)
-                    trust_delta = -2 if npc.mood < 40 else 1
-                    npc.trust = max(0, min(100, npc.trust + trust_delta))
-                    if trust_delta < 0:
-                        narrative = f"{npc.name} 帮你推进了一些工作，但对频繁加班有点不满。项目进度 +{prog_gain}。"
-                    else:
-                        narrative = f"{npc.name} 主动加班帮你推进项目。项目进度 +{prog_gain}。"
-        elif cmd == "sub_all_work":
-            if self._parse_level(player.level) < 7:
-                narrative = "指派失败：需晋升至 P7 及以上才能指派下属工作。"
-            elif not self.state.player_subordinates:
-                narrative = "你目前还没有任何下属可以指派。"
-            else:
-                project = self.state.projects.get(player.current_project)
-                if not project:
-                    narrative = "指派失败：当前无有效项目。"
-                else:
-                    total_progress = 0
-                    unhappy = 0
-                    for npc_id in list(self.state.player_subordinates):
-                        npc = self.state.npcs.get(npc_id)
-                        if not npc or npc.status != "在职":
-                            continue
-                        efficiency = max(1, int(self._parse_level(npc.level) / 2))
-                        total_progress += efficiency
-                        npc.mood = max(0, min(100, npc.mood - random.randint(3, 10)))
-                        if npc.mood < 35:
-                            unhappy += 1
-                            npc.trust = max(0, npc.trust - 3)
-                    if total_progress > 0:
-                        project.progress = min(200, project.progress + total_progress)
-                        narrative = f"你发动下属集体推进项目，项目进度 +{total_progress}。"
-                        if unhappy > 0:
-                            narrative += f" 不过有 {unhappy} 位下属对高强度压榨颇有怨言。"
-                    else:
-                        narrative = "下属们今天都抽不出手来帮你干活。"
-        elif cmd == "resign":
-            self.state.game_over = True
-            self.state.ending = "Resignation"
-            narrative = "你提交了离职申请。再见了，工位与周报。"
-        
+        spec, arg = parse_command(text)
+        if spec:
+            self.run_command(spec.name, arg, channel)
+        return self.state
+
+    def run_command(self, name: str, arg: str = None, channel: str = "workbench") -> str:
+        """
+        Run a registered workbench command directly (no ``cmd:`` string parsing)
+        and post its narrative to the workbench feedback or the channel.
+        """
+        spec = COMMANDS.get(name)
+        if not spec or not self.state.player:
+            return ""
+        if spec.preset is not None:
+            arg = spec.preset
+        start = time.perf_counter()
+        try:
+            narrative = getattr(self, spec.handler)(arg, channel)
+        finally:
+            spec.record(time.perf_counter() - start)
         if narrative:
             if channel == "workbench":
-                source = "workbench"
-                if cmd in ["rice", "eat_mifan", "eat_mifan_light", "eat_mifan_luxury"]:
-                    source = "rice"
-                elif cmd in ["shop", "buy_gift", "buy_gpu", "buy_monitor", "buy_chair"]:
-                    source = "shop"
-                elif cmd in ["academy", "learn_skill", "train_hard", "train_soft", "train_leadership"]:
-                    source = "academy"
-                elif cmd in ["house"]:
-                    source = "house"
                 self.state.workbench_feedback.append({
-                    "source": source,
+                    "source": spec.source,
                     "content": narrative,
                     "timestamp": self._get_timestamp()
                 })
@@ -3000,7 +3005,276 @@ class GameManager:
                     "target": channel,
                     "timestamp": self._get_timestamp()
                 })
-        return self.state
+        return narrative
+
+    def _cmd_rice(self, item_id: str, channel: str) -> str:
+        return self._apply_rice_item(item_id)
+
+    def _cmd_shop(self, item_id: str, channel: str) -> str:
+        return self._apply_shop_item(item_id, channel)
+
+    def _cmd_house(self, house_id: str, channel: str) -> str:
+        return self._apply_house_purchase(house_id)
+
+    def _cmd_academy(self, course_id: str, channel: str) -> str:
+        return self._apply_academy_course(course_id, channel)
+
+    def _cmd_work_hard(self, arg, channel: str) -> str:
+        return self._apply_effects("WORK", 1.5, "", channel=channel)
+
+    def _cmd_rest(self, arg, channel: str) -> str:
+        return self._apply_effects("REFUSE", 1.0, "", channel=channel)
+
+    def _cmd_report(self, arg, channel: str) -> str:
+        return self._apply_effects("WORK", 1.0, "", channel=channel)
+
+    def _cmd_msg_boss(self, arg, channel: str) -> str:
+        return self._apply_manage_up(channel)
+
+    def _cmd_work_normal(self, arg, channel: str) -> str:
+        player = self.state.player
+        base = self._apply_effects("WORK", 1.0, "老实干活推进项目", channel=channel)
+        project = self.state.projects.get(player.current_project)
+        extra = ""
+        if project:
+            bonus_max = max(0, int(player.hard_skill / 40))
+            prog_bonus = random.randint(0, bonus_max) if bonus_max > 0 else 0
+            risk_shift = 0
+            if player.mood >= 70:
+                risk_shift = -random.randint(0, 2)
+            elif player.mood <= 40:
+                risk_shift = random.randint(0, 2)
+            if prog_bonus:
+                project.progress = max(0, min(100, project.progress + prog_bonus))
+                extra += f" 项目额外进度 +{prog_bonus}"
+            if risk_shift:
+                project.risk = max(0, min(100, project.risk + risk_shift))
+                if risk_shift < 0:
+                    extra += f"，项目风险 {risk_shift}"
+                else:
+                    extra += f"，项目风险 +{risk_shift}"
+        return base + extra if base else extra
+
+    def _cmd_tech_breakthrough(self, arg, channel: str) -> str:
+        player = self.state.player
+        base = self._apply_effects("WORK", 1.5, "技术突破，加班钻研技术方案", channel=channel)
+        project = self.state.projects.get(player.current_project)
+        extra_parts = []
+        hard_gain_max = 1 + (1 if player.hard_skill >= 60 else 0)
+        hard_gain = random.randint(1, hard_gain_max)
+        player.hard_skill += hard_gain
+        extra_parts.append(f"硬技能 +{hard_gain}")
+        if project:
+            base_prog = random.randint(2, 5)
+            prog_factor = max(0.7, min(1.6, player.hard_skill / 60.0))
+            prog_boost = max(1, int(base_prog * prog_factor))
+            base_risk = random.randint(1, 3)
+            risk_factor = max(0.7, min(1.5, player.hard_skill / 70.0))
+            risk_drop = max(1, int(base_risk * risk_factor))
+            project.progress = max(0, min(100, project.progress + prog_boost))
+            project.risk = max(0, min(100, project.risk - risk_drop))
+            extra_parts.append(f"项目进度 +{prog_boost}")
+            extra_parts.append(f"项目风险 -{risk_drop}")
+        narrative = base or ""
+        if extra_parts:
+            narrative = f"{narrative} " if narrative else ""
+            narrative += "，".join(extra_parts)
+        return narrative
+
+    def _cmd_make_ppt(self, arg, channel: str) -> str:
+        player = self.state.player
+        project = self.state.projects.get(player.current_project)
+        energy_cost = random.randint(6, 10)
+        mood_drop = random.randint(1, 4)
+        player.energy = max(0, player.energy - energy_cost)
+        player.mood = max(0, min(100, player.mood - mood_drop))
+        soft_max = 1 + (1 if player.soft_skill >= 60 else 0)
+        soft_gain = random.randint(1, soft_max)
+        player.soft_skill += soft_gain
+        proj_desc = ""
+        if project:
+            prog_base = random.randint(0, 2)
+            trust_base = random.randint(2, 4)
+            morale_base = random.randint(0, 2)
+            if player.soft_skill >= 70:
+                trust_base += 1
+            prog_gain = prog_base
+            trust_gain = trust_base
+            morale_gain = morale_base
+            project.progress = max(0, min(100, project.progress + prog_gain))
+            project.stakeholder_trust = min(100, project.stakeholder_trust + trust_gain)
+            project.morale = max(0, min(100, project.morale + morale_gain))
+            proj_desc = f"，项目信任 +{trust_gain}，项目进度 +{prog_gain}"
+        return f"你花时间包装PPT，为项目讲故事。精力 -{energy_cost}，心情 -{mood_drop}，软技能 +{soft_gain}{proj_desc}。"
+
+    def _cmd_align_meeting(self, arg, channel: str) -> str:
+        player = self.state.player
+        text = "拉群对齐项目节奏"
+        base = self._apply_effects("SOCIAL", 1.1, text, channel=channel)
+        project = self.state.projects.get(player.current_project)
+        extra = ""
+        if project:
+            prog_base = random.randint(0, 2)
+            risk_base = random.randint(0, 2)
+            if player.soft_skill >= 60:
+                prog_base += 1
+            if player.soft_skill >= 70:
+                risk_base += 1
+            prog_gain = max(1, prog_base)
+            risk_drop = max(0, risk_base)
+            if prog_gain:
+                project.progress = max(0, min(100, project.progress + prog_gain))
+            if risk_drop:
+                project.risk = max(0, min(100, project.risk - risk_drop))
+            if prog_gain or risk_drop:
+                extra = f" 项目进度 +{prog_gain}，项目风险 -{risk_drop}。"
+        return base + extra if base else (extra or "你拉了一场对齐会。")
+
+    def _cmd_paid_slack(self, arg, channel: str) -> str:
+        player = self.state.player
+        project = self.state.projects.get(player.current_project)
+        mood_min, mood_max = 2, 6
+        if player.mood <= 40:
+            mood_max += 2
+        mood_gain = random.randint(mood_min, mood_max)
+        energy_min, energy_max = 2, 5
+        if player.energy <= int(player.max_energy * 0.5):
+            energy_max += 1
+        energy_gain = random.randint(energy_min, energy_max)
+        player.mood = max(0, min(100, player.mood + mood_gain))
+        player.energy = min(player.max_energy, player.energy + energy_gain)
+        if project:
+            prog_loss = random.randint(1, 3)
+            if player.hard_skill >= 70 or player.soft_skill >= 70:
+                prog_loss = max(1, prog_loss - 1)
+            trust_loss = random.randint(1, 2)
+            if player.political_capital >= 10:
+                trust_loss = max(1, trust_loss - 1)
+            project.progress = max(0, min(100, project.progress - prog_loss))
+            project.stakeholder_trust = max(0, project.stakeholder_trust - trust_loss)
+            narrative = f"你选择在工位带薪摸鱼，心情 +{mood_gain}，精力 +{energy_gain}，项目进度 -{prog_loss}，项目信任 -{trust_loss}。"
+        else:
+            narrative = f"你选择在工位带薪摸鱼，心情 +{mood_gain}，精力 +{energy_gain}。"
+        return narrative
+
+    def _cmd_tutorial_reward(self, arg, channel: str) -> str:
+        player = self.state.player
+        if getattr(self.state, "tutorial_reward_claimed", False):
+            narrative = "新手任务奖励已领取过了。"
+        else:
+            money_gain = 200
+            energy_gain = 10
+            mood_gain = 5
+            player.money = max(0, player.money + money_gain)
+            player.energy = min(player.max_energy, player.energy + energy_gain)
+            player.mood = max(0, min(100, player.mood + mood_gain))
+            self.state.tutorial_reward_claimed = True
+            narrative = f"新手任务完成！奖励已发放：金钱 +{money_gain}，精力 +{energy_gain}，心情 +{mood_gain}。"
+        return narrative
+
+    def _cmd_transfer(self, target_project: str, channel: str) -> str:
+        player = self.state.player
+        if not target_project:
+            narrative = "转岗失败：缺少目标项目（例如 cmd:transfer:HSR）。"
+        else:
+            proj = self.state.projects.get(target_project)
+            if not proj:
+                narrative = f"转岗失败：未找到项目 {target_project}。"
+            elif proj.status == ProjectStatus.CANCELED:
+                narrative = f"转岗失败：{proj.name} 已被砍。"
+            else:
+                player.current_project = target_project
+                narrative = f"你提交了转岗申请，已加入 {proj.name}。"
+                self._add_fact(f"转岗 {proj.name}")
+        return narrative
+
+    def _cmd_add_subordinate(self, npc_id: str, channel: str) -> str:
+        player = self.state.player
+        if self._parse_level(player.level) < 7:
+            narrative = "权限不足：需晋升至 P7 及以上才能管理下属。"
+        elif not npc_id or npc_id not in self.state.npcs:
+            narrative = "添加下属失败：未找到该 NPC。"
+        else:
+            npc = self.state.npcs[npc_id]
+            if npc.status != "在职":
+                narrative = f"添加下属失败：{npc.name} 当前不在职。"
+            elif npc_id in self.state.player_subordinates:
+                narrative = f"{npc.name} 已经是你的下属了。"
+            elif npc.project not in [player.current_project, "General", "HR"]:
+                narrative = f"添加下属失败：{npc.name} 不在你当前项目线，无法直接管理。"
+            elif self._parse_level(npc.level) >= self._parse_level(player.level):
+                narrative = f"添加下属失败：{npc.name} 职级不低于你。"
+            else:
+                self.state.player_subordinates.append(npc_id)
+                npc.manager_id = player.name
+                narrative = f"你正式将 {npc.name} 划入麾下，成为你的下属。"
+        return narrative
+
+    def _cmd_remove_subordinate(self, npc_id: str, channel: str) -> str:
+        player = self.state.player
+        if npc_id in self.state.player_subordinates:
+            self.state.player_subordinates = [
+                sid for sid in self.state.player_subordinates if sid != npc_id
+            ]
+            npc = self.state.npcs.get(npc_id)
+            if npc and getattr(npc, "manager_id", None) == player.name:
+                npc.manager_id = None
+            narrative = f"你与 {npc.name if npc else npc_id} 解除了一对一汇报关系。"
+        else:
+            narrative = "当前没有该下属记录。"
+        return narrative
+
+    def _cmd_sub_work(self, npc_id: str, channel: str) -> str:
+        player = self.state.player
+        if self._parse_level(player.level) < 7:
+            narrative = "指派失败：需晋升至 P7 及以上才能指派下属工作。"
+        elif not npc_id or npc_id not in self.state.npcs:
+            narrative = "指派失败：未找到该 NPC。"
+        elif npc_id not in self.state.player_subordinates:
+            narrative = "指派失败：该 NPC 不是你的下属。"
+        else:
+            npc = self.state.npcs[npc_id]
+            project = self.state.projects.get(player.current_project)
+            if not project:
+                narrative = "指派失败：当前无有效项目。"
+            else:
+                fatigue = random.randint(5, 15)
+                mood_delta = -random.randint(0, 8)
+                npc.mood = max(0, min(100, npc.mood + mood_delta))
+                efficiency = max(1, int(self._parse_level(npc.level) / 2))
+                prog_gain = max(1, efficiency)
+                project.progress = min(200, project.progress + prog_gain)
+                trust_delta = -2 if npc.mood < 40 else 1
+                npc.trust = max(0, min(100, npc.trust + trust_delta))
+                if trust_delta < 0:
+                    narrative = f"{npc.name} 帮你推进了一些工作，但对频繁加班有点不满。项目进度 +{prog_gain}。"
+                else:
+                    narrative = f"{npc.name} 主动加班帮你推进项目。项目进度 +{prog_gain}。"
+        return narrative
+
+    def _cmd_sub_all_work(self, arg, channel: str) -> str:
+        player = self.state.player
+        if self._parse_level(player.level) < 7:
+            return "指派失败：需晋升至 P7 及以上才能指派下属工作。"
+        if not self.state.player_subordinates:
+            return "你目前还没有任何下属可以指派。"
+        project = self.state.projects.get(player.current_project)
+        if not project:
+            return "指派失败：当前无有效项目。"
+        team = TeamTable.from_state(self.state, self._parse_level)
+        if not team:
+            return "下属们今天都抽不出手来帮你干活。"
+        delta = team.work_all(random)
+        project.progress = min(200, project.progress + delta["progress"])
+        narrative = f"你发动下属集体推进项目，项目进度 +{delta['progress']}。"
+        if delta["unhappy"] > 0:
+            narrative += f" 不过有 {delta['unhappy']} 位下属对高强度压榨颇有怨言。"
+        return narrative
+
+    def _cmd_resign(self, arg, channel: str) -> str:
+        self.state.game_over = True
+        self.state.ending = "Resignation"
+        return "你提交了离职申请。再见了，工位与周报。"
 
     def _apply_manage_up(self, channel: str) -> str:
         player = self.state.player
@@ -3033,6 +3307,7 @@ class GameManager:
         player.political_capital = max(0, player.political_capital + pc_gain)
         return f"你进行了向上管理，与 {boss.name} 沟通顺畅。{boss.name} 的信任 +{trust_gain}，你的政治资本 +{pc_gain}。精力 -8。"
 
+    @traced("apply_effects")
     def _apply_effects(self, intent: str, magnitude: float, text: str = "", channel: str = "group") -> str:
         player = self.state.player
         narrative = ""
@@ -3294,6 +3569,7 @@ class GameManager:
             base = 35000
         return int(base * max(1, project.difficulty))
 
+    @traced("select_topic_npcs")
     async def _select_topic_npcs(self, text: str, channel: str) -> list:
         player = self.state.player
         if not player or channel != "group":
@@ -3372,16 +3648,8 @@ class GameManager:
             primary_id = selected_ids[0]
             primary_npc = self.state.npcs.get(primary_id)
             if primary_npc:
-                rels = getattr(primary_npc, "relations", {}) or {}
-                for other_id, relation in rels.items():
-                    other = self.state.npcs.get(other_id)
-                    if not other:
-                        continue
-                    status_other = getattr(other, "status", "在职")
-                    if status_other != "在职":
-                        continue
-                    rel_text = str(relation)
-                    if any(tag in rel_text for tag in ["对立", "矛盾", "冲突", "上级", "下属"]):
+                for other_id, _ in self.relations.neighbors(primary_id, kinds=TENSION_KINDS):
+                    if other_id in self.state.npcs:
                         selected_ids.append(other_id)
                         break
 
@@ -3389,7 +3657,8 @@ class GameManager:
             return []
         return selected_ids
 
-    async def _npc_cross_talk(self, text: str, responders: list, channel: str):
+    async def _plan_cross_talk(self, plan: TurnPlan, responders: list, pending: list = None):
+        text, channel = plan.text, plan.channel
         selected_ids = responders if responders else await self._select_topic_npcs(text, channel)
         if not selected_ids:
             return
@@ -3400,8 +3669,7 @@ class GameManager:
             npc = self.state.npcs.get(nid)
             if not npc:
                 continue
-            rels = getattr(npc, "relations", {}) or {}
-            filtered_rels = {k: v for k, v in rels.items() if k in selected_set}
+            filtered_rels = self.relations.labels_within(nid, selected_set)
             npc_payloads.append({
                 "id": nid,
                 "name": getattr(npc, "name", nid),
@@ -3421,7 +3689,7 @@ class GameManager:
                 "content": msg.get("content"),
                 "type": msg.get("type")
             }
-            for msg in self.state.chat_history[-12:]
+            for msg in (self.state.chat_history[-12:] + list(pending or []))[-12:]
             if msg.get("target") == "group"
         ]
 
@@ -3432,11 +3700,17 @@ class GameManager:
             chat_history=recent_group
         )
 
-        messages = llm_res.get("messages") or []
-        if not messages:
+        plan.llm["crosstalk"] = {"speakers": list(selected_ids), "messages": llm_res.get("messages") or []}
+
+    def _apply_cross_talk(self, plan: TurnPlan):
+        crosstalk = plan.llm.get("crosstalk") or {}
+        selected_ids = crosstalk.get("speakers") or []
+        messages = list(crosstalk.get("messages") or [])
+        if not selected_ids or not messages:
             return
-        if len(npc_payloads) >= 2 and len(messages) == 1:
+        if len(messages) == 1:
             messages.append({"content": messages[0].get("content", "")})
+        channel = plan.channel
 
         speaker_index = 0
         for item in messages:
@@ -3457,6 +3731,7 @@ class GameManager:
             })
             speaker_index += 1
 
+    @traced("project_evolution_tick")
     def _project_evolution_tick(self, channel: str):
         player = self.state.player
         if not self.state.projects:
@@ -3542,7 +3817,7 @@ class GameManager:
 
         target = self._project_revenue_target(project)
         if project.revenue < target:
-            project.revenue += min(base_rev, max(0, target - project.revenue))
+            self.promotion.credit_revenue(self.state, project, min(base_rev, max(0, target - project.revenue)))
         project.risk = max(0, project.risk - 5)
         project.morale = max(0, min(100, project.morale + 5))
         project.stakeholder_trust = max(0, min(100, project.stakeholder_trust + 4))
@@ -3560,7 +3835,13 @@ class GameManager:
         })
         self._add_fact(f"完成 {project.name} 里程碑")
 
-    async def _trigger_random_event(self, channel: str):
+    async def _plan_random_event(self, channel: str = "group"):
+        return TurnPlan(kind="random_event", text="", channel=channel)
+
+    def _apply_random_event_turn(self, plan: TurnPlan):
+        self._apply_random_event(plan.channel)
+
+    def _apply_random_event(self, channel: str):
         if not self.state.player:
             return
 
@@ -3641,9 +3922,9 @@ class GameManager:
             "timestamp": self._get_timestamp()
         })
 
-    async def _refresh_suggested_replies(self, channel: str):
+    async def _fetch_suggested_replies(self, channel: str):
         if not self.state.player:
-            return
+            return None
         # Use channel-specific recent chat messages to keep suggestions aligned with current context
         recent_msgs = [m for m in self.state.chat_history if m.get("target") == channel]
         recent_trimmed = recent_msgs[-8:]
@@ -3651,13 +3932,33 @@ class GameManager:
             {"sender": m.get("sender"), "content": m.get("content"), "type": m.get("type")}
             for m in recent_trimmed
         ]
-        suggestions = await llm_service.generate_suggested_replies(self.state.player.dict(), recent)
+        return await llm_service.generate_suggested_replies(self.state.player.dict(), recent)
+
+    def _apply_suggested_replies(self, suggestions):
         self.state.suggested_replies = suggestions[:2] if suggestions else []
 
+    def _commit_suggested_replies(self, suggestions):
+        self._apply_suggested_replies(suggestions)
+        if self.journal:
+            self.journal.record(self, "suggestions", suggestions=self.state.suggested_replies)
+
     def ack_global_event(self) -> GameState:
         self.state.active_global_event = None
-        return self.state
-
+        if self.journal:
+            self.journal.record(self, "ack")
+        return self.publish_snapshot()
+
+    def _promotion_eligibility_changed(self, old, new):
+        # 可晋升的目标职级变了：推给 /api/events 上的客户端（日志重放时还没挂 event_sink，不会重复推送）
+        if self.event_sink:
+            self.event_sink(sse_frame({
+                "type": "promotion_eligibility",
+                "previous": old,
+                "eligible": new,
+                "week": self.state.week,
+            }))
+
+    @traced("check_promotion")
     def _check_promotion(self, channel: str):
         player = self.state.player
         if not player:
@@ -3667,94 +3968,22 @@ class GameManager:
             if status in ("pending_answer", "pending_score"):
                 return
 
-        week = getattr(self.state, "week", 0) or 0
-        if week < 0:
-            week = 0
-
-        eval_weeks = {12, 24, 36, 48, 52, 60, 72, 80, 96}
-        is_eval_week = week >= 12 and (week in eval_weeks or week % 12 == 0)
-
-        def level_num(level: str) -> int:
-            try:
-                return int(level.replace("P", ""))
-            except Exception:
-                return 5
-
-        current = level_num(player.level)
-        if current >= 10:
+        stats = self.promotion.stats(self.state)
+        if stats.level >= MAX_PROMOTION_LEVEL:
             return
 
-        revenue_total = sum(p.revenue for p in self.state.projects.values()) if self.state.projects else 0
-        project = self.state.projects.get(player.current_project) if self.state.projects else None
-        kpi = getattr(player, "kpi", 0) or 0
-        pc = getattr(player, "political_capital", 0) or 0
-        accidents = getattr(player, "major_accidents", 0) or 0
-        participated = len(getattr(player, "participated_live_projects", []) or [])
-        is_rd_project = bool(project and getattr(project, "status", None) == ProjectStatus.RD)
-
-        can_p6 = (
-            week >= 12
-            and kpi >= 400
-            and accidents == 0
-            and (participated >= 1 or is_rd_project)
-        )
-        can_p7 = (
-            week >= 24
-            and kpi >= 1300
-            and pc >= 8
-            and revenue_total >= 0
-        )
-        can_p8 = (
-            week >= 36
-            and kpi >= 3000
-            and pc >= 25
-            and revenue_total >= 20000
-            and accidents <= 1
-        )
-        can_p9 = (
-            week >= 52
-            and kpi >= 5000
-            and pc >= 40
-            and revenue_total >= 50000
-        )
-        can_p10 = (
-            week >= 80
-            and pc >= 80
-            and revenue_total >= 200000
-        )
-
-        candidates = []
-        if current < 6 and can_p6:
-            candidates.append(6)
-        if current < 7 and can_p7:
-            candidates.append(7)
-        if current < 8 and can_p8:
-            candidates.append(8)
-        if current < 9 and can_p9:
-            candidates.append(9)
-        if current < 10 and can_p10:
-            candidates.append(10)
-
-        if candidates:
+        target = self.promotion.refresh(stats)
+        if target:
             if self.state.promotion_review and (self.state.promotion_review.get("status") or "") not in ("finished",):
                 return
-            target_level = max(candidates)
-            threshold = 55
-            if target_level == 7:
-                threshold = 60
-            elif target_level == 8:
-                threshold = 65
-            elif target_level == 9:
-                threshold = 70
-            elif target_level >= 10:
-                threshold = 72
+            target_level = target.level
             question_project = getattr(player, "current_project", "") or "当前项目"
             question = f"请结合你在项目 {question_project} 中的具体经历，用一段话说明你在当前阶段为团队和项目带来的关键价值，以及为什么你已经具备晋升到 P{target_level} 的能力。"
             self.state.promotion_review = {
                 "status": "pending_answer",
                 "target_level": target_level,
                 "question": question,
-                "score_threshold": threshold,
+                "score_threshold": target.score_threshold,
                 "answer": None,
                 "score": None,
                 "comment": "",
@@ -3769,57 +3998,15 @@ class GameManager:
             })
             return
 
-        if not is_eval_week:
+        if not is_eval_week(stats.week):
             return
 
-        if current < 6:
-            target_lvl = 6
-            need = []
-            if participated < 1 and not is_rd_project:
-                need.append("至少参与一个已上线项目，或在预研项目中持续贡献")
-            if accidents > 0:
-                need.append("避免重大事故")
-            if kpi < 400:
-                need.append("累计更多有效KPI")
-        elif current < 7:
-            target_lvl = 7
-            need = []
-            if kpi < 1300:
-                need.append("提升项目KPI贡献")
-            if pc < 8:
-                need.append("多与关键老板正向互动积累政治资本")
-        elif current < 8:
-            target_lvl = 8
-            need = []
-            if kpi < 3000:
-                need.append("承担更大范围的核心任务")
-            if pc < 25:
-                need.append("在跨团队协作中建立更强话语权")
-            if revenue_total < 20000:
-                need.append("推动至少一个项目形成可观营收")
-            if accidents > 1:
-                need.append("降低重大事故发生次数")
-        elif current < 9:
-            target_lvl = 9
-            need = []
-            if kpi < 5000:
-                need.append("在多个关键项目中形成稳定输出")
-            if pc < 40:
-                need.append("在高层视角中建立稳定信任")
-            if revenue_total < 50000:
-                need.append("带动更高的业务营收")
-        else:
-            target_lvl = 10
-            need = []
-            if pc < 80:
-                need.append("在公司范围内形成决定性影响力")
-            if revenue_total < 200000:
-                need.append("推动公司级标志性业务成功")
-
+        rung = self.promotion.next_rung(stats)
+        need = rung.hints(stats)
         if not need:
             return
 
-        msg = f"本周期暂未晋升。下一档目标：P{target_lvl}。建议：" + "；".join(need)
+        msg = f"本周期暂未晋升。下一档目标：P{rung.level}。建议：" + "；".join(need)
         self.state.chat_history.append({
             "sender": "System",
             "content": msg,
@@ -3828,6 +4015,7 @@ class GameManager:
             "timestamp": self._get_timestamp()
         })
 
+    @traced("check_game_over")
     def _check_game_over(self, channel: str):
         player = self.state.player
         if not player:
@@ -3933,5 +4121,3 @@ class GameManager:
                 "target": channel,
                 "timestamp": self._get_timestamp()
             })
-
-game_manager = GameManager()
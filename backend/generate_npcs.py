@@ -4,18 +4,34 @@ import os
 import random
 from openai import AsyncOpenAI
 from faker import Faker
+from pydantic import ValidationError
+
+from models import NPC
+from tools.normalize_npcs import collect_existing_numbers, normalize_name
 
 # Configuration
 API_BASE = "https://llm-open-ai-private.mihoyo.com/v1"
 API_KEY = "56da33c3-2075-4741-8bcc-378f879d49cf"
 MODEL = "mihoyo-deepseek-v3.2-chat"
 OUTPUT_FILE = "backend/data/npcs.json"
+SHARD_DIR = "backend/data/npc_shards"
+CHECKPOINT_FILE = os.path.join(SHARD_DIR, "checkpoint.json")
 TARGET_COUNT = 1000
-
-fake = Faker("zh_CN")
+BATCH_SIZE = 50
+MAX_CONCURRENCY = 4
+TEMPLATES_PER_BATCH = 5
+BUILD_SEED = 20240101
 
 client = AsyncOpenAI(base_url=API_BASE, api_key=API_KEY, timeout=10.0)
 
+FALLBACK_TEMPLATES = [
+    {"role": "Dev", "traits": "秃顶强者", "project": "Genshin"},
+    {"role": "Product", "traits": "需求制造机", "project": "HSR"},
+    {"role": "Art", "traits": "唯美主义", "project": "ZZZ"},
+    {"role": "Ops", "traits": "背锅侠", "project": "IAM"}
+]
+PROJECTS = ["Honkai3", "Genshin", "HSR", "ZZZ", "HYG", "IAM", "General", "HR", "Marketing"]
+
 async def generate_npc_templates(count=20):
     print(f"Generating {count} NPC templates via LLM...")
     prompt = f"""
@@ -30,7 +46,7 @@ async def generate_npc_templates(count=20):
     ]
     Make them diverse and funny. Output JSON only.
     """
-    
+
     try:
         response = await client.chat.completions.create(
             model=MODEL,
@@ -47,70 +63,123 @@ async def generate_npc_templates(count=20):
         else:
             # Fallback if structure is weird
             return list(data.values())[0]
-            
+
     except Exception as e:
         print(f"LLM Error: {e}")
-        # Fallback templates
-        return [
-            {"role": "Dev", "traits": "秃顶强者", "project": "Genshin"},
-            {"role": "Product", "traits": "需求制造机", "project": "HSR"},
-            {"role": "Art", "traits": "唯美主义", "project": "ZZZ"},
-            {"role": "Ops", "traits": "背锅侠", "project": "IAM"}
-        ]
-
-def generate_npcs(templates):
-    npcs = {}
-    projects = ["Honkai3", "Genshin", "HSR", "ZZZ", "HYG", "IAM", "General", "HR", "Marketing"]
-    
-    # 1. Keep Existing Important NPCs (Hardcoded in game.py originally)
-    # We will merge them later in game.py or here. 
-    # Let's generate new ones to append.
-    
-    print(f"Generating {TARGET_COUNT} NPCs based on templates...")
-    
-    for i in range(TARGET_COUNT):
-        template = random.choice(templates)
-
-        npc_id = f"NPC_{i+1:04d}"
-
-        name = fake.name()
-
-        role = template["role"]
-        traits = template["traits"]
-        project = template.get("project", random.choice(projects))
-
-        trust = random.randint(30, 70)
-        mood = random.randint(50, 90)
-        level = random.choice(["P4", "P5", "P6", "P7"])
-        status = "在职"
-
-        npcs[npc_id] = {
-            "id": npc_id,
-            "name": f"{name} ({role})",
-            "role": role,
-            "traits": traits,
-            "project": project,
-            "trust": trust,
-            "mood": mood,
-            "level": level,
-            "status": status
-        }
-        
-    return npcs
+        return list(FALLBACK_TEMPLATES)
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def shard_path(batch_index: int) -> str:
+    return os.path.join(SHARD_DIR, f"shard_{batch_index:04d}.json")
+
+def load_checkpoint(existing_npcs: dict) -> dict:
+    checkpoint = load_json(CHECKPOINT_FILE, None)
+    if checkpoint and checkpoint.get("batch_size") == BATCH_SIZE:
+        # Only trust batches whose shard actually made it to disk
+        checkpoint["completed"] = [i for i in checkpoint.get("completed", []) if os.path.exists(shard_path(i))]
+        return checkpoint
+    # New build: generated IDs start after the existing roster so curated NPCs are kept
+    existing_nums = collect_existing_numbers(existing_npcs)
+    return {
+        "version": 1,
+        "batch_size": BATCH_SIZE,
+        "id_offset": max(existing_nums) if existing_nums else 0,
+        "completed": [],
+        "used_names": sorted({str(d.get("name", "")).strip() for d in existing_npcs.values() if d.get("name")}),
+    }
+
+def build_npc_record(rng: random.Random, fake: Faker, templates: list, npc_id: str) -> dict:
+    template = rng.choice(templates)
+    role = template.get("role") or "Dev"
+    return {
+        "id": npc_id,
+        "name": fake.name(),
+        "role": role,
+        "traits": template.get("traits") or "",
+        "project": template.get("project") or rng.choice(PROJECTS),
+        "trust": rng.randint(30, 70),
+        "mood": rng.randint(50, 90),
+        "level": rng.choice(["P4", "P5", "P6", "P7"]),
+        "status": "在职",
+        "relations": {},
+    }
+
+async def generate_batch(batch_index: int, count: int, id_offset: int, base_templates: list, sem: asyncio.Semaphore) -> tuple:
+    async with sem:
+        templates = await generate_npc_templates(TEMPLATES_PER_BATCH)
+    templates = [t for t in templates if isinstance(t, dict)] or base_templates
+
+    # Per-batch seeds keep a resumed run reproducible for the remaining batches
+    rng = random.Random(BUILD_SEED + batch_index)
+    fake = Faker("zh_CN")
+    fake.seed_instance(BUILD_SEED + batch_index)
+    start = batch_index * BATCH_SIZE
+    records = [
+        build_npc_record(rng, fake, templates, f"NPC_{id_offset + start + i + 1:04d}")
+        for i in range(count)
+    ]
+    return batch_index, records
+
+def commit_batch(batch_index: int, records: list, checkpoint: dict, used_names: set) -> int:
+    shard = {}
+    for data in records:
+        data["name"] = normalize_name(data.get("name", ""), data["id"], used_names)
+        try:
+            npc = NPC(**data)
+        except ValidationError as e:
+            print(f"Skip invalid NPC {data.get('id')}: {e}")
+            continue
+        shard[npc.id] = npc.model_dump()
+    save_json_atomic(shard_path(batch_index), shard)
+    checkpoint["completed"] = sorted(set(checkpoint["completed"]) | {batch_index})
+    checkpoint["used_names"] = sorted(used_names)
+    save_json_atomic(CHECKPOINT_FILE, checkpoint)
+    return len(shard)
+
+def merge_shards(existing_npcs: dict, batch_count: int) -> dict:
+    merged = dict(existing_npcs)
+    for batch_index in range(batch_count):
+        merged.update(load_json(shard_path(batch_index), {}))
+    return merged
 
 async def main():
-    # 1. Get Templates from LLM
-    templates = await generate_npc_templates(20)
-    print(f"Got {len(templates)} templates.")
-    
-    # 2. Generate Bulk
-    npcs = generate_npcs(templates)
-    
-    # 3. Save
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(npcs, f, ensure_ascii=False, indent=2)
-        
+    existing_npcs = load_json(OUTPUT_FILE, {})
+    checkpoint = load_checkpoint(existing_npcs)
+    used_names = set(checkpoint.get("used_names") or [])
+    batch_count = (TARGET_COUNT + BATCH_SIZE - 1) // BATCH_SIZE
+    pending = [i for i in range(batch_count) if i not in set(checkpoint["completed"])]
+    print(f"{batch_count - len(pending)}/{batch_count} batches already built, {len(pending)} to go.")
+
+    # 1. Shared templates, used when a batch's own template request fails
+    base_templates = await generate_npc_templates(20) if pending else []
+    print(f"Got {len(base_templates)} templates.")
+
+    # 2. Generate batches concurrently; commit (normalize + validate + checkpoint) as each one lands
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    tasks = []
+    for batch_index in pending:
+        count = min(BATCH_SIZE, TARGET_COUNT - batch_index * BATCH_SIZE)
+        tasks.append(generate_batch(batch_index, count, checkpoint["id_offset"], base_templates, sem))
+    for task in asyncio.as_completed(tasks):
+        batch_index, records = await task
+        saved = commit_batch(batch_index, records, checkpoint, used_names)
+        print(f"Batch {batch_index} saved: {saved} NPCs ({len(checkpoint['completed'])}/{batch_count}).")
+
+    # 3. Save legacy single-file roster alongside the shards
+    npcs = merge_shards(existing_npcs, batch_count)
+    save_json_atomic(OUTPUT_FILE, npcs)
     print(f"Successfully saved {len(npcs)} NPCs to {OUTPUT_FILE}")
 
 if __name__ == "__main__":
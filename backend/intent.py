@@ -0,0 +1,168 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# 意图按优先级排列：同时命中多类时取靠前的一类（与旧的 if/elif 顺序一致）
+INTENT_KEYWORDS = [
+    ("WORK", ["加班", "爆肝", "肝", "工作", "修bug", "修复", "debug", "写代码", "改需求", "推进"]),
+    ("REFUSE", ["摸鱼", "休息", "摆烂", "躺平"]),
+    ("SHOP", ["买", "吃", "喝", "外卖", "奶茶", "咖啡", "点餐"]),
+    ("LEARN", ["学习", "培训", "上课", "复盘", "读文档"]),
+    ("ATTACK", ["打", "骂", "滚", "傻", "废物", "操", "你妈"]),
+]
+MAGNITUDE_KEYWORDS = [
+    (1.6, ["通宵", "爆肝", "肝爆", "死磕"]),
+    (0.8, ["稍微", "一点", "小加班"]),
+    (1.2, ["加班", "努力", "认真"]),
+]
+# 只影响置信度：命中这些且没有其它意图词时，闲聊判断是可信的
+SMALL_TALK_KEYWORDS = ["你好", "早上好", "早安", "晚安", "大家好", "在吗", "哈哈", "谢谢", "辛苦了", "hello"]
+
+VALID_INTENTS = {"WORK", "REFUSE", "SHOP", "LEARN", "ATTACK", "SOCIAL", "SMALL_TALK"}
+SMALL_TALK_MAGNITUDE = 0.4
+# 本地置信度达到该值时，流式 prompt 不再要求 LLM 输出 <analysis>
+CONFIDENCE_THRESHOLD = float(os.getenv("MH_INTENT_CONFIDENCE", "0.75"))
+
+
+_END = ""  # 结点里标记“到此为一个完整关键词”的键；文本逐字取出的都是单字符，不会冲突
+
+
+class KeywordTrie:
+    """
+    Character trie over all keywords. ``scan`` walks it from every position
+    whose character starts a keyword and keeps the deepest terminal reached,
+    i.e. the longest keyword starting there. Each keyword's value describes
+    every keyword contained in it (built by the caller), so the longest match
+    per position is enough to answer ``w in text`` for every keyword.
+    """
+
+    def __init__(self, entries: Dict[str, object]):
+        self.root: dict = {}
+        for word, value in entries.items():
+            node = self.root
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[_END] = value
+
+    def scan(self, text: str) -> list:
+        """Values of the longest keyword starting at each position, in text order."""
+        found = []
+        root = self.root
+        n = len(text)
+        for i, ch in enumerate(text):
+            node = root.get(ch)
+            if node is None:
+                continue
+            last = node.get(_END)
+            j = i + 1
+            while j < n:
+                node = node.get(text[j])
+                if node is None:
+                    break
+                if _END in node:
+                    last = node[_END]
+                j += 1
+            if last is not None:
+                found.append(last)
+        return found
+
+
+class IntentResult:
+    __slots__ = ("intent", "magnitude", "confidence", "matched")
+
+    def __init__(self, intent: str, magnitude: float, confidence: float, matched: List[str]):
+        self.intent = intent
+        self.magnitude = magnitude
+        self.confidence = confidence
+        self.matched = matched
+
+    def __repr__(self) -> str:
+        return f"IntentResult({self.intent}, {self.magnitude}, confidence={self.confidence})"
+
+
+_NO_MAGNITUDE = len(MAGNITUDE_KEYWORDS)
+
+
+class _Keyword:
+    """
+    Trie value for one keyword: bit ``r`` of ``intents`` is set when it
+    contains a keyword of INTENT_KEYWORDS[r], ``magnitude`` is the best
+    MAGNITUDE_KEYWORDS rank it contains. ``solo`` is the classification of a
+    text whose only hit is this keyword, precomputed at import.
+    """
+
+    __slots__ = ("word", "intents", "magnitude", "small_talk", "solo")
+
+    def __init__(self, word: str):
+        self.word = word
+        self.intents = 0
+        for rank, (_, words) in enumerate(INTENT_KEYWORDS):
+            if any(k in word for k in words):
+                self.intents |= 1 << rank
+        self.magnitude = min(
+            (rank for rank, (_, words) in enumerate(MAGNITUDE_KEYWORDS) if any(k in word for k in words)),
+            default=_NO_MAGNITUDE,
+        )
+        self.small_talk = any(k in word for k in SMALL_TALK_KEYWORDS)
+        result = _resolve([self])
+        self.solo = (result.intent, result.magnitude, result.confidence, tuple(result.matched))
+
+
+def _resolve(found: list) -> IntentResult:
+    """Apply the old priority rules to the keywords hit by one scan."""
+    intents, magnitude_rank = 0, _NO_MAGNITUDE
+    for kw in found:
+        intents |= kw.intents
+        if kw.magnitude < magnitude_rank:
+            magnitude_rank = kw.magnitude
+
+    if not intents:
+        # 没有任何意图词：有寒暄词时确定是闲聊，否则交给 LLM 判断
+        small_talk = [kw.word for kw in found if kw.small_talk]
+        return IntentResult("SMALL_TALK", SMALL_TALK_MAGNITUDE, 0.85 if small_talk else 0.4, small_talk)
+
+    bit = intents & -intents  # 优先级最高（最靠前）的一类
+    intent = INTENT_KEYWORDS[bit.bit_length() - 1][0]
+    matched = [kw.word for kw in found if kw.intents & bit]
+    magnitude = MAGNITUDE_KEYWORDS[magnitude_rank][0] if magnitude_rank < _NO_MAGNITUDE else 1.0
+
+    if intents != bit:
+        confidence = 0.55  # 跨类冲突，只是按优先级取了第一类
+    elif max(map(len, matched)) == 1:
+        confidence = 0.65  # 只有“打”“吃”这类单字命中，容易误判
+    else:
+        confidence = min(0.95, 0.85 + 0.05 * (len(set(matched)) - 1))
+    return IntentResult(intent, magnitude, confidence, matched)
+
+
+_KEYWORDS = KeywordTrie({
+    word: _Keyword(word)
+    for word in {w for _, ws in INTENT_KEYWORDS + MAGNITUDE_KEYWORDS for w in ws} | set(SMALL_TALK_KEYWORDS)
+})
+
+
+def classify_intent(text: str) -> IntentResult:
+    """One trie scan over the lowercased text; intent / magnitude follow the old priority rules."""
+    found = _KEYWORDS.scan((text or "").lower())
+    if len(found) == 1:
+        # 最常见的情况：只命中一个关键词，结果在建表时已经算好
+        intent, magnitude, confidence, matched = found[0].solo
+        return IntentResult(intent, magnitude, confidence, list(matched))
+    return _resolve(found)
+
+
+_ANALYSIS_INTENT_RE = re.compile(r"intent\s*[:：]\s*([A-Za-z_]+)", re.IGNORECASE)
+_ANALYSIS_MAGNITUDE_RE = re.compile(r"magnitude\s*[:：]\s*([0-9]*\.?[0-9]+)", re.IGNORECASE)
+
+
+def parse_analysis(content: str) -> Optional[Tuple[str, float]]:
+    """Read ``intent`` / ``magnitude`` from an LLM ``<analysis>`` section; None if unusable."""
+    m = _ANALYSIS_INTENT_RE.search(content or "")
+    if not m:
+        return None
+    intent = m.group(1).upper()
+    if intent not in VALID_INTENTS:
+        return None
+    mag = _ANALYSIS_MAGNITUDE_RE.search(content)
+    magnitude = max(0.0, min(2.0, float(mag.group(1)))) if mag else 1.0
+    return intent, magnitude
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import re
+
+JOURNAL_ENABLED = os.getenv("MH_JOURNAL", "1") != "0"
+JOURNAL_DIR = os.getenv("MH_JOURNAL_DIR") or os.path.join(os.path.dirname(__file__), ".journal")
+SNAPSHOT_EVERY = int(os.getenv("MH_JOURNAL_SNAPSHOT_EVERY", "20"))
+FLUSH_INTERVAL = float(os.getenv("MH_JOURNAL_FLUSH_MS", "20")) / 1000
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class JournalWriter:
+    """
+    Process-wide group commit: appends from every session are collected for
+    FLUSH_INTERVAL, written in one worker-thread pass and fsynced once per file.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+        self.batches = 0
+        self.records = 0
+        self.fsyncs = 0
+
+    def submit(self, op: str, path: str, data):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有事件循环（离线脚本）时直接同步落盘
+            self._write_batch([(op, path, data)])
+            return None
+        future = loop.create_future()
+        self._pending.append((op, path, data, future))
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # 稍等一会儿，把同一时间段内所有会话的写入攒成一批
+            await asyncio.sleep(self.flush_interval)
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            ok = True
+            try:
+                await asyncio.to_thread(self._write_batch, [(op, path, data) for op, path, data, _ in batch])
+            except Exception as e:
+                print(f"Journal write failed: {e}")
+                ok = False
+            for *_, future in batch:
+                if not future.done():
+                    future.set_result(ok)
+
+    def _write_batch(self, items: list):
+        handles = {}
+        cleanups = []
+        try:
+            for op, path, data in items:
+                if op == "append":
+                    f = handles.get(path)
+                    if f is None:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        f = handles[path] = open(path, "ab")
+                    f.write(data)
+                    self.records += 1
+                elif op == "snapshot":
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                    self.fsyncs += 1
+                elif op == "cleanup":
+                    cleanups.extend(data)
+            for f in handles.values():
+                f.flush()
+                os.fsync(f.fileno())
+                self.fsyncs += 1
+        finally:
+            for f in handles.values():
+                f.close()
+        # 新快照已落盘后才删除旧快照和旧日志
+        for path in cleanups:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.batches += 1
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "records": self.records, "fsyncs": self.fsyncs, "pending": len(self._pending)}
+
+
+journal_writer = JournalWriter()
+
+
+class SessionJournal:
+    """
+    Write-ahead log for one session: ``snapshot-<seq>.mhsave`` holds the state
+    after record ``seq`` and ``log-<seq>.jsonl`` the records after it. Each
+    record is a TurnPlan (input, RNG seed, LLM outputs) or a small op, so
+    replaying the log on top of the snapshot rebuilds the session.
+    """
+
+    def __init__(self, session_id: str, root: str = JOURNAL_DIR, writer: JournalWriter = None):
+        self.dir = os.path.join(root, session_id)
+        self.writer = writer or journal_writer
+        self.seq = 0
+        self.base_seq = None
+        self.since_snapshot = 0
+        self._last = None
+
+    @classmethod
+    def for_session(cls, session_id: str):
+        if not JOURNAL_ENABLED or not session_id or not _SESSION_ID_RE.match(session_id):
+            return None
+        return cls(session_id)
+
+    def _snapshot_path(self, seq: int) -> str:
+        return os.path.join(self.dir, f"snapshot-{seq:08d}.mhsave")
+
+    def _log_path(self, seq: int) -> str:
+        return os.path.join(self.dir, f"log-{seq:08d}.jsonl")
+
+    def record(self, manager, op: str, **fields):
+        # 还没有快照（未开局）时不记日志，恢复时也无从重放
+        if self.base_seq is None:
+            return
+        self.seq += 1
+        line = json.dumps({"seq": self.seq, "op": op, **fields}, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._last = self.writer.submit("append", self._log_path(self.base_seq), line.encode("utf-8"))
+        self.since_snapshot += 1
+        if self.since_snapshot >= SNAPSHOT_EVERY:
+            self.snapshot(manager)
+
+    def snapshot(self, manager):
+        old_paths = []
+        if self.base_seq is not None and self.base_seq != self.seq:
+            old_paths = [self._snapshot_path(self.base_seq), self._log_path(self.base_seq)]
+        self.base_seq = self.seq
+        self.since_snapshot = 0
+        self.writer.submit("snapshot", self._snapshot_path(self.base_seq), manager.export_save())
+        self._last = self.writer.submit("cleanup", None, old_paths)
+
+    async def commit(self):
+        """Wait until everything recorded so far is on disk."""
+        if self._last is not None:
+            await self._last
+
+    def recover(self, manager) -> bool:
+        """Load the latest snapshot into ``manager`` and replay the log after it."""
+        try:
+            names = sorted(n for n in os.listdir(self.dir) if n.startswith("snapshot-") and n.endswith(".mhsave"))
+        except FileNotFoundError:
+            return False
+        if not names:
+            return False
+        base_seq = int(names[-1][len("snapshot-"):-len(".mhsave")])
+        with open(self._snapshot_path(base_seq), "rb") as f:
+            manager.import_save(f.read())
+        self.base_seq = self.seq = base_seq
+        self.since_snapshot = 0
+        replayed = 0
+        try:
+            with open(self._log_path(base_seq), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时写了一半的尾行
+                    if record.get("seq", 0) <= self.seq:
+                        continue
+                    manager.replay_journal_record(record)
+                    self.seq = record["seq"]
+                    self.since_snapshot += 1
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        print(f"Recovered session {os.path.basename(self.dir)}: snapshot {base_seq} + {replayed} records")
+        return True
@@ -1,33 +1,268 @@
-from openai import AsyncOpenAI
+import asyncio
 import os
 import random
 import json
-import time
+
+from metrics import llm_metrics
+from prompts import PromptTemplate
 
 API_BASE = "https://ark.cn-beijing.volces.com/api/v3"
 API_KEY = os.getenv("ARK_API_KEY")
 MODEL = os.getenv("ARK_MODEL_ID", "ep-20260118232344-2rdf8")
+# 重试由 _create 自己做（SDK 内置重试关掉），这样每次重试都能计入指标
+MAX_RETRIES = int(os.getenv("MH_LLM_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.5
+
+
+def retryable_errors() -> tuple:
+    # openai 包 import 要 ~0.7s，推迟到第一次真正用到客户端时
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+    return (APIConnectionError, RateLimitError, InternalServerError)
+
+# 系统提示词：静态前缀在 import 时压缩一次，跨调用逐字节不变，便于服务端前缀缓存命中；
+# 每次调用才变化的上下文统一放在末尾的 context 段
+
+_GM_HEADER = """
+You are the Game Master of a corporate RPG (MiHoYo style).
+IMPORTANT: All output text (narrative, reply) MUST be in Chinese (Simplified).
+"""
+
+_ACTOR_CONTEXT = """
+Context:
+- Player: {player_role}
+- Target NPC: {target}
+"""
+
+_STREAM_FORMAT = """
+<narrative>
+System narrative description here (In Chinese)...
+</narrative>
+<reply npc="NPC_NAME">
+NPC reply content here (In Chinese)...
+</reply>
+<effects>
+mood: int (-10 to 10)
+trust: int (-20 to 20)
+</effects>
+Strictly follow this order. Do not output markdown code blocks.
+"""
+
+ACTION_STREAM_PROMPT = PromptTemplate("process_action_stream", _GM_HEADER + """
+Task:
+1. If a Target NPC is present (or implied), generate their Reply.
+2. Generate System Narrative (Effects).
+Output Format (Use XML tags for streaming):
+""" + _STREAM_FORMAT, _ACTOR_CONTEXT)
+
+ACTION_STREAM_ANALYSIS_PROMPT = PromptTemplate("process_action_stream+analysis", _GM_HEADER + """
+Task:
+1. Analyze Player Input (Intent & Magnitude).
+2. If a Target NPC is present (or implied), generate their Reply.
+3. Generate System Narrative (Effects).
+Output Format (Use XML tags for streaming):
+<analysis>
+intent: WORK/REFUSE/SHOP/LEARN/ATTACK/SOCIAL
+magnitude: float (0.0-2.0)
+</analysis>
+""" + _STREAM_FORMAT, _ACTOR_CONTEXT)
+
+ACTION_PROMPT = PromptTemplate("process_action", _GM_HEADER + """
+Task:
+1. Analyze Player Input (Intent & Magnitude).
+2. If a Target NPC is present (or implied), generate their Reply.
+3. Generate System Narrative (Effects).
+PRD Logic (Intent):
+- "加班/肝/工作": WORK
+- "摸鱼/休息": REFUSE
+- "买/吃/喝": SHOP
+- "学习": LEARN
+- 攻击/辱骂: ATTACK
+- Default: SOCIAL
+Output JSON:
+{
+  "intent": "WORK/REFUSE/SHOP/LEARN/ATTACK/SOCIAL",
+  "magnitude": float (0.0-2.0),
+  "npc_reply": "String" or null (Roleplay based on traits, REFER to chat_history),
+  "npc_name": "String" (Name of NPC replying),
+  "system_narrative": "String" (Outcome description),
+  "mood_change": int (-10 to 10),
+  "trust_change": int (-20 to 20)
+}
+""", _ACTOR_CONTEXT)
+
+RANDOM_EVENT_PROMPT = PromptTemplate("generate_random_event", """
+You are the Game Master of a corporate RPG (MiHoYo style).
+IMPORTANT: All output text (event_msg) MUST be in Chinese (Simplified).
+Generate a random workplace event for the player.
+Task:
+Create a short, interesting random event (1-2 sentences).
+It can be positive (bonus, food, inspiration) or negative (bug, meeting, overtime).
+Output JSON:
+{
+    "event_msg": "String (The event description)",
+    "mood_change": int (-20 to 20),
+    "energy_change": int (-20 to 20),
+    "money_change": int (-100 to 100)
+}
+""", """
+Context:
+- Role: {role}
+- Project: {project}
+- Status: Energy {energy}, Mood {mood}, Money {money}
+""")
+
+CROSSTALK_PROMPT = PromptTemplate("generate_group_crosstalk", """
+You are the Game Master of a corporate RPG (MiHoYo style).
+Language: Chinese (Simplified) only.
+The backend系统已经根据玩家输入和NPC标签筛选出了少量“最相关”的NPC,
+现在传给你的是这个精简后的 NPC 列表(npcs 数组)。你不需要再做 NPC 选择,
+但需要为这些 NPC 写台词。
+要点:
+- 使用玩家的最新发言推断话题和情绪(正向/中性/负向)。
+- 根据每个 NPC 的 role / traits / project / relations(对立/上级/下属/合作等)
+决定该 NPC 的语气和立场。
+- messages 数组中的第 i 条内容, 视为 npcs 数组中第 i 个 NPC 的发言。
+必须严格用该 NPC 的身份、人设、立场来写台词。
+- 如果同一个话题中包含对立关系的 NPC, 在负面情绪下可以吵架/互相否定;
+在正向情绪下可以轻微抢功/互相不服; 在中性时保持专业争论。
+- 如果是合作/友好关系, 他们更倾向于互相补充、互相肯定、一起扛事。
+Requirements:
+1. All contents MUST be in Chinese.
+2. Generate 2-4 short messages in total, 优先覆盖 npcs 前 2-3 个角色。
+3. Each message should be 5-40 Chinese characters.
+4. Do not output system narration here, only dialogue content.
+5. 不要在内容里注明说话人姓名或ID, 也不要加冒号前缀。
+Output JSON:
+{"messages": [{"content": "string (Chinese, 5-40 characters, what this NPC says)"}]}
+""", """
+Player:
+- Role: {role}
+- Project: {project}
+""")
+
+TOPICS_PROMPT = PromptTemplate("extract_player_topics", """
+You are an assistant for a corporate RPG.
+Language: Chinese (Simplified) only.
+Task:
+- Read the player's latest group chat message.
+- Extract 1-5 compact Chinese keywords/短语 that能最好概括这条消息关注的业务主题,
+比如: "IAM邀请制", "访问控制权限", "IAM研发", "IAM产品", "绩效考核", "项目延期", "加班文化" 等。
+- 这些关键词将被用来在服务端匹配 NPC 的标签(姓名、角色、项目、traits 等),
+所以应尽量贴近玩家话语中出现的实体或概念, 而不是泛泛的情绪词。
+Requirements:
+- 返回 JSON, 仅包含 keywords 字段。
+- 每个 keyword 控制在 2-8 个汉字以内。
+Output JSON:
+{"keywords": ["string (core topic word or short phrase, e.g. IAM邀请制, 访问控制权限, 绩效考核, 研发流程, 产品需求)"]}
+""")
+
+WELCOME_PROMPT = PromptTemplate("generate_welcome", """
+You are a project leader in a corporate RPG (MiHoYo style); who you are and who just joined is given under Context.
+Task:
+Welcome the new employee to your team.
+The welcome should naturally guide the player to type their first message in the chat.
+Requirements:
+1. Language: Chinese (Simplified) ONLY.
+2. Tone: Matches your traits (e.g. strict, friendly, otaku, etc.).
+3. Content: Mention something specific about your project or their role, and briefly set expectations.
+4. At the end, add a clear call-to-action, explicitly inviting the player to在下方直接打字回复，例如给出1-2个可以说的话的示例（例如“可以先自我介绍一下”或“说说你对项目的第一印象”）。
+5. Length: Keep it concise, roughly within 60 Chinese characters if possible.
+6. Format: Start with @ followed by the new employee's name, no bullet points or lists.
+Return ONLY the welcome message content string.
+""", """
+Context:
+- You: {leader_name} ({leader_role}), the leader of {project_name} project. Traits: {leader_traits}.
+- New employee: {player_name}（岗位：{player_role}）
+""")
+
+SUGGESTED_REPLIES_PROMPT = PromptTemplate("generate_suggested_replies", """
+You are the dialogue assistant for a corporate RPG chat.
+Language: Chinese (Simplified) only.
+Task:
+Based on the recent conversation between player and NPCs, propose 2 very short follow-up reply options for the player.
+Requirements:
+1. Strongly condition on the latest NPC feedback and the player's last message.
+2. Each option must be a natural next sentence the player might say.
+3. Focus on concrete actions or decisions, not generic greetings.
+4. Length: each option MUST be within 10 Chinese characters.
+5. Do not include speaker names or punctuation like "：", just the content.
+Output JSON:
+{"suggestions": ["string (short reply option, <=10 Chinese characters)", "string (short reply option, <=10 Chinese characters)"]}
+""", """
+Player status:
+- Role: {role}
+- Project: {project}
+- Energy: {energy}
+- Mood: {mood}
+""")
+
+PROMOTION_PROMPT = PromptTemplate("score_promotion_answer", """
+你是一款职场 RPG 游戏中的晋升评委。
+语言：必须使用简体中文回答。
+任务：
+1. 阅读用户消息中 review 的晋升述职题目（question）和玩家回答（answer）。
+2. 综合考虑玩家所在岗位、当前职级、目标职级、项目背景，给出一个 0-100 的分数。
+3. 分数主要看：是否说清了自己做过的事情、是否有结果导向、是否体现和项目/团队目标的关系。
+打分规则提示（供你参考，不需要原文输出）：
+- 整体倾向于宽松：只要回答不是敷衍、能看出认真思考，请给出相对偏高分数。
+- P5→P6：只要基本完整、有一些具体细节，建议 70 分及以上。
+- P6→P7：能说明自己对项目有持续贡献，有一定 owner 意识，建议 70-85 分区间。
+- 更高职级：需要体现跨团队影响力、对业务结果负责，好的回答可以在 80 分以上。
+- 只有在回答几乎没有内容、严重跑题或明显敷衍时，才考虑打到 60 分以下。
+输出要求：
+- 只输出一个 JSON 对象，不要有多余文本。
+- score 为 0-100 的整数。
+- comment 为一句简短中文评语（不超过 80 个字），给玩家简单反馈和建议。
+输出 JSON：
+{"score": int (0-100), "comment": "string (short Chinese feedback for the player, <=80 characters)"}
+""", """
+玩家信息：
+- 岗位：{role}
+- 当前职级：{level}
+- 当前项目：{project}
+""")
 
 class LLMService:
     def __init__(self):
-        try:
-            self.api_key = API_KEY
-            if not self.api_key:
-                print("Warning: ARK_API_KEY not found in environment variables. Switching to Mock Mode.")
-                self.use_mock = True
-            else:
-                print(f"LLM Client Initializing with Key: {self.api_key[:8]}..., Model: {MODEL}")
-                self.client = AsyncOpenAI(base_url=API_BASE, api_key=self.api_key, timeout=20.0)
-                self.use_mock = False
-        except Exception as e:
-            print(f"LLM Client Init Failed: {e}. Switching to Mock Mode.")
+        # 客户端延迟到启动预热（warm_up）或第一次调用时才创建，import llm 不再拉起 openai
+        self._client = None
+        self.api_key = API_KEY
+        if not self.api_key:
+            print("Warning: ARK_API_KEY not found in environment variables. Switching to Mock Mode.")
             self.use_mock = True
+        else:
+            self.use_mock = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                from openai import AsyncOpenAI
+                print(f"LLM Client Initializing with Key: {self.api_key[:8]}..., Model: {MODEL}")
+                self._client = AsyncOpenAI(base_url=API_BASE, api_key=self.api_key, timeout=20.0, max_retries=0)
+            except Exception as e:
+                print(f"LLM Client Init Failed: {e}. Switching to Mock Mode.")
+                self.use_mock = True
+                raise
+        return self._client
+
+    def warm_up(self):
+        """Import the SDK and build the client ahead of the first call (no-op in mock mode)."""
+        if self.use_mock:
+            return
+        try:
+            self.client
+        except Exception:
+            pass
 
     def _handle_error(self, e):
         """
         Check error type and switch to mock mode if critical (Auth/Billing/Authz).
         Prefer real LLM: network/timeout errors will not permanently enable mock mode.
         """
+        call = llm_metrics.current()
+        if call:
+            call.fail(e)
         err_str = str(e).lower()
         auth_substrings = [
             "401",
@@ -43,6 +278,29 @@ class LLMService:
         else:
             print(f"LLM Non-critical error: {e}")
 
+    async def _create(self, template: PromptTemplate, **kwargs):
+        """chat.completions.create with backoff retries on transient errors; usage is recorded for non-streaming calls."""
+        call = llm_metrics.current()
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = await self.client.chat.completions.create(**kwargs)
+                break
+            except retryable_errors():
+                if attempt >= MAX_RETRIES:
+                    raise
+                if call:
+                    call.retry()
+                await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+        if not kwargs.get("stream"):
+            self._record_usage(template, getattr(response, "usage", None))
+        return response
+
+    def _record_usage(self, template: PromptTemplate, usage):
+        template.record_usage(usage)
+        call = llm_metrics.current()
+        if call:
+            call.usage(usage)
+
     def _map_role_cn(self, role: str) -> str:
         if not role:
             return "员工"
@@ -55,6 +313,14 @@ class LLMService:
             return "综合运营"
         return r
 
+    def _target_line(self, target_npc: dict) -> str:
+        if not target_npc:
+            return "None"
+        return (
+            f"{target_npc.get('name', 'System')}（项目组：{target_npc.get('project', '')}，"
+            f"职级：{target_npc.get('level', '')}，性格：{target_npc.get('traits', '')}）"
+        )
+
     def _map_project_cn(self, project: str) -> str:
         if not project:
             return "公共项目"
@@ -77,76 +343,37 @@ class LLMService:
             return "人力资源"
         return p
 
-    async def process_action_stream(self, text: str, player_context: dict, chat_history: list = None, target_npc: dict = None):
+    @llm_metrics.instrument_stream("process_action_stream")
+    async def process_action_stream(self, text: str, player_context: dict, chat_history: list = None, target_npc: dict = None, analysis: bool = True):
+        # analysis=False：本地意图引擎已经足够确定，prompt 里不再要求 <analysis> 段
         if self.use_mock:
-            yield f"<analysis>intent: WORK</analysis>"
             yield f"<narrative>你开始假装工作...</narrative>"
             yield f"<reply npc='System'>摸鱼也是一种工作。</reply>"
             yield f"<effects>mood:1</effects>"
             return
 
         try:
-            player = player_context
-            target_name = target_npc.get("name", "System") if target_npc else "None"
-            target_traits = target_npc.get("traits", "") if target_npc else ""
-            target_project = target_npc.get("project", "") if target_npc else ""
-            target_level = target_npc.get("level", "") if target_npc else ""
-            target_project = target_npc.get("project", "") if target_npc else ""
-            target_level = target_npc.get("level", "") if target_npc else ""
-            player_role_cn = self._map_role_cn(player.get("role", "Employee"))
-            prompt_context = f"""
-            You are the Game Master of a corporate RPG (MiHoYo style).
-            IMPORTANT: All output text (narrative, reply) MUST be in Chinese (Simplified).
-            
-            Task:
-            1. Analyze Player Input (Intent & Magnitude).
-            2. If a Target NPC is present (or implied), generate their Reply.
-            3. Generate System Narrative (Effects).
-            
-            Context:
-            - Player: {player_role_cn}
-            - Target NPC: {target_name}（项目组：{target_project}，职级：{target_level}，性格：{target_traits}）
-            
-            Output Format (Use XML tags for streaming):
-            <analysis>
-            intent: WORK/REFUSE/SHOP/LEARN/ATTACK/SOCIAL
-            magnitude: float (0.0-2.0)
-            </analysis>
-            <narrative>
-            System narrative description here (In Chinese)...
-            </narrative>
-            <reply npc="NPC_NAME">
-            NPC reply content here (In Chinese)...
-            </reply>
-            <effects>
-            mood: int (-10 to 10)
-            trust: int (-20 to 20)
-            </effects>
-            
-            Strictly follow this order. Do not output markdown code blocks.
-            """
-            
-            user_payload = {
-                "player_input": text,
-                "chat_history": chat_history[-5:] if chat_history else []
-            }
+            template = ACTION_STREAM_ANALYSIS_PROMPT if analysis else ACTION_STREAM_PROMPT
+            messages = template.messages(
+                {"player_input": text, "chat_history": template.history(chat_history, 5)},
+                player_role=self._map_role_cn(player_context.get("role", "Employee")),
+                target=self._target_line(target_npc),
+            )
 
-            t_start = time.perf_counter()
-            first_token_time = None
-            last_time = None
-            stream = await self.client.chat.completions.create(
+            stream = await self._create(
+                template,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-                ],
+                messages=messages,
                 temperature=0.7,
                 max_tokens=500,
                 stream=True,
+                stream_options={"include_usage": True},
                 extra_body={"thinking": {"type": "disabled"}},
             )
 
             async for chunk in stream:
+                # include_usage：最后一个 chunk 没有 choices，只带本次的 token 用量
+                self._record_usage(template, getattr(chunk, "usage", None))
                 choices = getattr(chunk, "choices", None) or []
                 for choice in choices:
                     delta = getattr(choice, "delta", None)
@@ -154,17 +381,8 @@ class LLMService:
                         continue
                     content_piece = getattr(delta, "content", None)
                     if content_piece:
-                        now = time.perf_counter()
-                        if first_token_time is None:
-                            first_token_time = now
-                        last_time = now
                         yield content_piece
 
-            if first_token_time is not None:
-                total = (last_time or time.perf_counter()) - t_start
-                first_cost = first_token_time - t_start
-                print(f"LLM_STREAM first={first_cost:.3f}s total={total:.3f}s")
-
         except Exception as e:
             print(f"LLM Stream Error: {e}")
             self._handle_error(e)
@@ -173,6 +391,7 @@ class LLMService:
             yield f"<error>{str(e)}</error>"
 
 
+    @llm_metrics.instrument("process_action")
     async def process_action(self, text: str, player_context: dict, chat_history: list = None, target_npc: dict = None) -> dict:
         """
         Combined Layer: Analyze intent AND Generate response in one go.
@@ -183,72 +402,22 @@ class LLMService:
             response_res = self._mock_response({"target_npc": target_npc, "player_action": text})
             return {**intent_res, **response_res}
 
-        # JSON Schema Definition
-        json_schema = """
-        {
-          "intent": "WORK/REFUSE/SHOP/LEARN/ATTACK/SOCIAL",
-          "magnitude": float (0.0-2.0),
-          "npc_reply": "String" or null (Roleplay based on traits, REFER to chat_history),
-          "npc_name": "String" (Name of NPC replying),
-          "system_narrative": "String" (Outcome description),
-          "mood_change": int (-10 to 10),
-          "trust_change": int (-20 to 20)
-        }
-        """
-
         try:
-            player = player_context
-            target_name = target_npc.get("name", "System") if target_npc else "None"
-            target_traits = target_npc.get("traits", "") if target_npc else ""
-            target_project = target_npc.get("project", "") if target_npc else ""
-            target_level = target_npc.get("level", "") if target_npc else ""
-            player_role_cn = self._map_role_cn(player.get("role", "Employee"))
-            
-            # Construct System Prompt via f-string to avoid .format() issues with JSON braces
-            prompt_context = f"""
-            You are the Game Master of a corporate RPG (MiHoYo style).
-            IMPORTANT: All output text (narrative, reply) MUST be in Chinese (Simplified).
-            
-            Task:
-            1. Analyze Player Input (Intent & Magnitude).
-            2. If a Target NPC is present (or implied), generate their Reply.
-            3. Generate System Narrative (Effects).
-            
-            PRD Logic (Intent):
-            - "加班/肝/工作": WORK
-            - "摸鱼/休息": REFUSE
-            - "买/吃/喝": SHOP
-            - "学习": LEARN
-            - 攻击/辱骂: ATTACK
-            - Default: SOCIAL
-            
-            Context:
-            - Player: {player_role_cn}
-            - Target NPC: {target_name}（项目组：{target_project}，职级：{target_level}，性格：{target_traits}）
-            
-            Output JSON:
-            {json_schema}
-            """
-            
-            user_payload = {
-                "player_input": text,
-                "chat_history": chat_history[-5:] if chat_history else []
-            }
+            messages = ACTION_PROMPT.messages(
+                {"player_input": text, "chat_history": ACTION_PROMPT.history(chat_history, 5)},
+                player_role=self._map_role_cn(player_context.get("role", "Employee")),
+                target=self._target_line(target_npc),
+            )
 
-            t0 = time.perf_counter()
-            response = await self.client.chat.completions.create(
+            response = await self._create(
+                ACTION_PROMPT,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-                ],
+                messages=messages,
                 temperature=0.7,
                 max_tokens=300, 
                 response_format={"type": "json_object"},
                 extra_body={"thinking": {"type": "disabled"}},
             )
-            t1 = time.perf_counter()
-            print(f"LLM_PROCESS cost={t1 - t0:.3f}s")
             print(f"LLM Response Status: OK")
             # print(f"LLM Raw Content: {response.choices[0].message.content}")
             data = json.loads(response.choices[0].message.content)
@@ -271,6 +440,7 @@ class LLMService:
             return {**intent_res, **response_res}
 
 
+    @llm_metrics.instrument("generate_random_event")
     async def generate_random_event(self, player_context: dict) -> dict:
         if self.use_mock:
             return {
@@ -280,42 +450,19 @@ class LLMService:
                 "money_change": 0
             }
 
-        # JSON Schema
-        json_schema = """
-        {
-            "event_msg": "String (The event description)",
-            "mood_change": int (-20 to 20),
-            "energy_change": int (-20 to 20),
-            "money_change": int (-100 to 100)
-        }
-        """
-
         try:
-            # Construct System Prompt via f-string
-            prompt_context = f"""
-            You are the Game Master of a corporate RPG (MiHoYo style).
-            IMPORTANT: All output text (event_msg) MUST be in Chinese (Simplified).
-            Generate a random workplace event for the player.
-            
-            Context:
-            - Role: {player_context.get("role", "Employee")}
-            - Project: {self._map_project_cn(player_context.get("current_project", "General"))}
-            - Status: Energy {player_context.get("energy", 0)}, Mood {player_context.get("mood", 0)}, Money {player_context.get("money", 0)}
-            
-            Task:
-            Create a short, interesting random event (1-2 sentences).
-            It can be positive (bonus, food, inspiration) or negative (bug, meeting, overtime).
-            
-            Output JSON:
-            {json_schema}
-            """
-
-            response = await self.client.chat.completions.create(
+            messages = RANDOM_EVENT_PROMPT.messages(
+                "Generate event",
+                role=player_context.get("role", "Employee"),
+                project=self._map_project_cn(player_context.get("current_project", "General")),
+                energy=player_context.get("energy", 0),
+                mood=player_context.get("mood", 0),
+                money=player_context.get("money", 0),
+            )
+            response = await self._create(
+                RANDOM_EVENT_PROMPT,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": "Generate event"}
-                ],
+                messages=messages,
                 temperature=0.8,
                 max_tokens=200,
                 response_format={"type": "json_object"},
@@ -332,6 +479,7 @@ class LLMService:
                 "money_change": 0
             }
 
+    @llm_metrics.instrument("generate_group_crosstalk")
     async def generate_group_crosstalk(self, topic_text: str, player_context: dict, npcs: list, chat_history: list = None) -> dict:
         if self.use_mock:
             msgs = []
@@ -341,51 +489,7 @@ class LLMService:
                 })
             return {"messages": msgs}
 
-        json_schema = """
-        {
-          "messages": [
-            {
-              "content": "string (Chinese, 5-40 characters, what this NPC says)"
-            }
-          ]
-        }
-        """
-
         try:
-            history = chat_history[-8:] if chat_history else []
-            prompt_context = f"""
-            You are the Game Master of a corporate RPG (MiHoYo style).
-            Language: Chinese (Simplified) only.
-
-            The backend系统已经根据玩家输入和NPC标签筛选出了少量“最相关”的NPC,
-            现在传给你的是这个精简后的 NPC 列表(npcs 数组)。你不需要再做 NPC 选择,
-            但需要为这些 NPC 写台词。
-
-            要点:
-            - 使用玩家的最新发言推断话题和情绪(正向/中性/负向)。
-            - 根据每个 NPC 的 role / traits / project / relations(对立/上级/下属/合作等)
-              决定该 NPC 的语气和立场。
-            - messages 数组中的第 i 条内容, 视为 npcs 数组中第 i 个 NPC 的发言。
-              必须严格用该 NPC 的身份、人设、立场来写台词。
-            - 如果同一个话题中包含对立关系的 NPC, 在负面情绪下可以吵架/互相否定;
-              在正向情绪下可以轻微抢功/互相不服; 在中性时保持专业争论。
-            - 如果是合作/友好关系, 他们更倾向于互相补充、互相肯定、一起扛事。
-
-            Requirements:
-            1. All contents MUST be in Chinese.
-            2. Generate 2-4 short messages in total, 优先覆盖 npcs 前 2-3 个角色。
-            3. Each message should be 5-40 Chinese characters.
-            4. Do not output system narration here, only dialogue content.
-            5. 不要在内容里注明说话人姓名或ID, 也不要加冒号前缀。
-
-            Player:
-            - Role: {self._map_role_cn(player_context.get("role", "Employee"))}
-            - Project: {self._map_project_cn(player_context.get("current_project", "General"))}
-
-            Output JSON:
-            {json_schema}
-            """
-
             user_payload = {
                 "player_input": topic_text,
                 "player": {
@@ -393,16 +497,18 @@ class LLMService:
                     "current_project": player_context.get("current_project"),
                     "level": player_context.get("level"),
                 },
-                "npcs": npcs,
-                "chat_history": history
+                "npcs": CROSSTALK_PROMPT.npcs(npcs),
+                "chat_history": CROSSTALK_PROMPT.history(chat_history, 8),
             }
-
-            response = await self.client.chat.completions.create(
+            messages = CROSSTALK_PROMPT.messages(
+                user_payload,
+                role=self._map_role_cn(player_context.get("role", "Employee")),
+                project=self._map_project_cn(player_context.get("current_project", "General")),
+            )
+            response = await self._create(
+                CROSSTALK_PROMPT,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-                ],
+                messages=messages,
                 temperature=0.8,
                 max_tokens=300,
                 response_format={"type": "json_object"},
@@ -414,50 +520,18 @@ class LLMService:
             self._handle_error(e)
             return {"messages": []}
 
+    @llm_metrics.instrument("extract_player_topics")
     async def extract_player_topics(self, player_text: str) -> dict:
         if self.use_mock:
             words = [w for w in player_text.replace("，", " ").replace("。", " ").split() if w]
             top = words[:4]
             return {"keywords": top, "raw": player_text}
 
-        json_schema = """
-        {
-          "keywords": [
-            "string (core topic word or short phrase, e.g. IAM邀请制, 访问控制权限, 绩效考核, 研发流程, 产品需求)"
-          ]
-        }
-        """
-
         try:
-            prompt_context = f"""
-            You are an assistant for a corporate RPG.
-            Language: Chinese (Simplified) only.
-
-            Task:
-            - Read the player's latest group chat message.
-            - Extract 1-5 compact Chinese keywords/短语 that能最好概括这条消息关注的业务主题,
-              比如: "IAM邀请制", "访问控制权限", "IAM研发", "IAM产品", "绩效考核", "项目延期", "加班文化" 等。
-            - 这些关键词将被用来在服务端匹配 NPC 的标签(姓名、角色、项目、traits 等),
-              所以应尽量贴近玩家话语中出现的实体或概念, 而不是泛泛的情绪词。
-
-            Requirements:
-            - 返回 JSON, 仅包含 keywords 字段。
-            - 每个 keyword 控制在 2-8 个汉字以内。
-
-            Output JSON:
-            {json_schema}
-            """
-
-            user_payload = {
-                "player_text": player_text
-            }
-
-            response = await self.client.chat.completions.create(
+            response = await self._create(
+                TOPICS_PROMPT,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-                ],
+                messages=TOPICS_PROMPT.messages({"player_text": player_text}),
                 temperature=0.3,
                 max_tokens=200,
                 response_format={"type": "json_object"},
@@ -469,6 +543,7 @@ class LLMService:
             self._handle_error(e)
             return {"keywords": [], "raw": player_text}
 
+    @llm_metrics.instrument("generate_welcome")
     async def generate_welcome(self, player_name: str, player_role: str, project_name: str, leader_name: str, leader_role: str, leader_traits: str) -> str:
         """
         Dedicated method for generating welcome message to avoid Prompt conflict.
@@ -477,32 +552,19 @@ class LLMService:
             return f"@{player_name} 欢迎加入{project_name}。我是{leader_name}。Mock Welcome."
 
         try:
-            player_role_cn = self._map_role_cn(player_role)
-            prompt_context = f"""
-            You are {leader_name} ({leader_role}), the leader of {project_name} project.
-            Traits: {leader_traits}.
-            
-            Task:
-            Welcome a new employee named {player_name}（岗位：{player_role_cn}）to your team.
-            The welcome should naturally guide the player to type their first message in the chat.
-            
-            Requirements:
-            1. Language: Chinese (Simplified) ONLY.
-            2. Tone: Matches your traits (e.g. strict, friendly, otaku, etc.).
-            3. Content: Mention something specific about {project_name} or their role, and briefly set expectations.
-            4. At the end, add a clear call-to-action, explicitly inviting the player to在下方直接打字回复，例如给出1-2个可以说的话的示例（例如“可以先自我介绍一下”或“说说你对项目的第一印象”）。
-            5. Length: Keep it concise, roughly within 60 Chinese characters if possible.
-            6. Format: Start with @{player_name}, no bullet points or lists.
-            
-            Return ONLY the welcome message content string.
-            """
-
-            response = await self.client.chat.completions.create(
+            messages = WELCOME_PROMPT.messages(
+                "Generate welcome message.",
+                leader_name=leader_name,
+                leader_role=leader_role,
+                leader_traits=leader_traits,
+                project_name=project_name,
+                player_name=player_name,
+                player_role=self._map_role_cn(player_role),
+            )
+            response = await self._create(
+                WELCOME_PROMPT,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": "Generate welcome message."}
-                ],
+                messages=messages,
                 temperature=0.7,
                 max_tokens=150,
             )
@@ -515,55 +577,23 @@ class LLMService:
             # Return None to let caller handle fallback
             return None
 
+    @llm_metrics.instrument("generate_suggested_replies")
     async def generate_suggested_replies(self, player_context: dict, chat_history: list = None) -> list:
         if self.use_mock:
             return ["进一步优化日报", "改天再说"]
 
-        json_schema = """
-        {
-            "suggestions": [
-                "string (short reply option, <=10 Chinese characters)",
-                "string (short reply option, <=10 Chinese characters)"
-            ]
-        }
-        """
-
         try:
-            history = chat_history[-8:] if chat_history else []
-            prompt_context = f"""
-            You are the dialogue assistant for a corporate RPG chat.
-            Language: Chinese (Simplified) only.
-
-            Task:
-            Based on the recent conversation between player and NPCs, propose 2 very short follow-up reply options for the player.
-
-            Requirements:
-            1. Strongly condition on the latest NPC feedback and the player's last message.
-            2. Each option must be a natural next sentence the player might say.
-            3. Focus on concrete actions or decisions, not generic greetings.
-            4. Length: each option MUST be within 10 Chinese characters.
-            5. Do not include speaker names or punctuation like "：", just the content.
-
-            Player status:
-            - Role: {player_context.get("role", "Employee")}
-            - Project: {self._map_project_cn(player_context.get("current_project", "General"))}
-            - Energy: {player_context.get("energy", 0)}
-            - Mood: {player_context.get("mood", 0)}
-
-            Output JSON:
-            {json_schema}
-            """
-
-            user_payload = {
-                "chat_history": history
-            }
-
-            response = await self.client.chat.completions.create(
+            messages = SUGGESTED_REPLIES_PROMPT.messages(
+                {"chat_history": SUGGESTED_REPLIES_PROMPT.history(chat_history, 8)},
+                role=player_context.get("role", "Employee"),
+                project=self._map_project_cn(player_context.get("current_project", "General")),
+                energy=player_context.get("energy", 0),
+                mood=player_context.get("mood", 0),
+            )
+            response = await self._create(
+                SUGGESTED_REPLIES_PROMPT,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-                ],
+                messages=messages,
                 temperature=0.7,
                 max_tokens=80,
                 response_format={"type": "json_object"},
@@ -585,6 +615,7 @@ class LLMService:
             self._handle_error(e)
             return []
 
+    @llm_metrics.instrument("score_promotion_answer")
     async def score_promotion_answer(self, player_context: dict, review_context: dict) -> dict:
         if self.use_mock:
             base = 70
@@ -603,70 +634,23 @@ class LLMService:
                 "comment": "Mock 打分：整体还可以，逻辑比较清晰。"
             }
 
-        json_schema = """
-        {
-          "score": int (0-100),
-          "comment": "string (short Chinese feedback for the player, <=80 characters)"
-        }
-        """
-
         try:
-            prompt_context = f"""
-            你是一款职场 RPG 游戏中的晋升评委。
-            语言：必须使用简体中文回答。
-
-            任务：
-            1. 阅读玩家的晋升述职题目和回答。
-            2. 综合考虑玩家所在岗位、当前职级、目标职级、项目背景，给出一个 0-100 的分数。
-            3. 分数主要看：是否说清了自己做过的事情、是否有结果导向、是否体现和项目/团队目标的关系。
-
-            玩家信息：
-            - 岗位：{self._map_role_cn(player_context.get("role", "Employee"))}
-            - 当前职级：{player_context.get("level", "P5")}
-            - 当前项目：{self._map_project_cn(player_context.get("current_project", "General"))}
-
-            述职背景：
-            - 目标晋升职级：{review_context.get("target_level")}
-            - 题目：{review_context.get("question")}
-
-            玩家回答：
-            \"\"\"{review_context.get("answer")}\"\"\"
-
-            打分规则提示（供你参考，不需要原文输出）：
-            - 整体倾向于宽松：只要回答不是敷衍、能看出认真思考，请给出相对偏高分数。
-            - P5→P6：只要基本完整、有一些具体细节，建议 70 分及以上。
-            - P6→P7：能说明自己对项目有持续贡献，有一定 owner 意识，建议 70-85 分区间。
-            - 更高职级：需要体现跨团队影响力、对业务结果负责，好的回答可以在 80 分以上。
-            - 只有在回答几乎没有内容、严重跑题或明显敷衍时，才考虑打到 60 分以下。
-
-            输出要求：
-            - 只输出一个 JSON 对象，不要有多余文本。
-            - score 为 0-100 的整数。
-            - comment 为一句简短中文评语（不超过 80 个字），给玩家简单反馈和建议。
-
-            输出 JSON：
-            {json_schema}
-            """
-
-            payload = {
-                "player": {
-                    "role": player_context.get("role"),
-                    "level": player_context.get("level"),
-                    "current_project": player_context.get("current_project"),
-                },
-                "review": {
-                    "target_level": review_context.get("target_level"),
-                    "question": review_context.get("question"),
-                    "answer": review_context.get("answer"),
-                },
+            # 回答只放在用户消息里，系统提示词保持可缓存
+            review = {
+                "target_level": review_context.get("target_level"),
+                "question": review_context.get("question"),
+                "answer": review_context.get("answer"),
             }
-
-            response = await self.client.chat.completions.create(
+            messages = PROMOTION_PROMPT.messages(
+                {"review": review},
+                role=self._map_role_cn(player_context.get("role", "Employee")),
+                level=player_context.get("level", "P5"),
+                project=self._map_project_cn(player_context.get("current_project", "General")),
+            )
+            response = await self._create(
+                PROMOTION_PROMPT,
                 model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt_context},
-                    {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-                ],
+                messages=messages,
                 temperature=0.3,
                 max_tokens=200,
                 response_format={"type": "json_object"},
@@ -680,10 +664,8 @@ class LLMService:
         except Exception as e:
             print(f"LLM Promotion Review Error: {e}")
             self._handle_error(e)
-            return {
-                "score": 60,
-                "comment": "打分服务异常，默认按及格处理。"
-            }
+            # 不在这里兜底给分：调用方（promotion_reviews）会改用规则打分
+            raise
 
 
     def _mock_intent(self, text: str) -> dict:
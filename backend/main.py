@@ -1,15 +1,45 @@
+import startup  # 必须最先 import：冷启动计时和 MH_STARTUP_PROFILE 的 import 统计都从这里开始
 from fastapi import FastAPI, HTTPException, Request, Response
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from models import GameState, ActionRequest, OnboardRequest
+from models import GameState, ActionRequest, OnboardRequest, BatchActionRequest, BatchActionResponse, AdvanceRequest, AdvanceResponse
 from game import GameManager
+from llm import llm_service
+import data_loader
+from sse import SSEEventBuffer, stream_events, replay_events, parse_last_event_id
+from action_queue import ActionQueue, llm_turn_slots
+from state_delta import diff_state
+from journal import SessionJournal
+from serialization import FastJSONResponse, sse_frame, state_update_frame
+from compression import COMPRESSION_ENABLED, CompressionMiddleware
+from tracer import TRACE_ENABLED, TracingMiddleware
+import tracer
+from prompts import prompt_stats
+from promotion import promotion_reviews
+import metrics
 import uvicorn
 import asyncio
+import os
 import time
 import uuid
+from contextlib import asynccontextmanager, nullcontext
 from typing import Optional
 
-app = FastAPI(title="MiHoYo Adventure API")
+# 冷启动：进程起来就能应答 /healthz，LLM 客户端和游戏数据在后台预热，/readyz 反映进度
+readiness = startup.Readiness([
+    ("llm_client", llm_service.warm_up),
+    ("npcs", data_loader.initial_npcs),
+    ("global_events", data_loader.global_events),
+    ("relation_graph", data_loader.base_relation_graph),
+    ("relation_worlds", data_loader.relation_worlds),
+])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    readiness.start()
+    yield
+
+app = FastAPI(title="MiHoYo Adventure API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,15 +49,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+if TRACE_ENABLED:
+    # 最后注册 = 最外层：Server-Timing 能把压缩和序列化也算进去
+    app.add_middleware(TracingMiddleware)
+
 class _SessionCtx:
     def __init__(self, manager: GameManager):
         self.manager = manager
-        self.lock = asyncio.Lock()
+        # 回合落地 / 后台提交 / 读档共用 manager 的锁；聊天回合的 LLM 规划不持锁，读接口走 manager.snapshot
+        self.lock = manager.lock
+        self.actions = ActionQueue()
         self.last_access_at = time.monotonic()
+        self.events = SSEEventBuffer()
+        # 后台结果（述职评分）也写进这个缓冲，/api/events 上的客户端实时收到
+        manager.event_sink = self.events.append
 
 _SESSION_COOKIE = "mh_session"
 _sessions: dict[str, _SessionCtx] = {}
 _sessions_lock = asyncio.Lock()
+# 闲置超过 TTL 的会话从内存中驱逐（状态在 journal 里，下次访问时恢复；没有 journal 的已开局会话常驻）
+SESSION_IDLE_TTL = float(os.getenv("MH_SESSION_TTL_SECONDS", "7200"))
+_SWEEP_INTERVAL = 60.0
+_last_sweep_at = time.monotonic()
 
 def _get_session_id_from_request(request: Request) -> Optional[str]:
     header_sid = request.headers.get("x-session-id")
@@ -38,23 +84,94 @@ def _get_session_id_from_request(request: Request) -> Optional[str]:
         return cookie_sid.strip() or None
     return None
 
+def _load_manager(session_id: str) -> GameManager:
+    # 进程重启后按 session id 从 write-ahead log 恢复：最近快照 + 重放其后的日志
+    manager = GameManager()
+    journal = SessionJournal.for_session(session_id)
+    if journal:
+        try:
+            if journal.recover(manager):
+                manager.publish_snapshot()
+        except Exception as e:
+            print(f"Journal recovery failed for {session_id}: {e}")
+            manager = GameManager()
+            journal = SessionJournal.for_session(session_id)
+    manager.journal = journal
+    return manager
+
+async def _commit_journal(ctx: _SessionCtx):
+    # group commit：等本会话已记录的回合真正落盘后再应答
+    if ctx.manager.journal:
+        with tracer.span("journal_commit"):
+            await ctx.manager.journal.commit()
+
+def _take_idle_sessions(now: float, keep: Optional[str]) -> list:
+    # 调用方持有 _sessions_lock；当前请求的会话、正在跑回合或还有排队动作的会话不驱逐
+    global _last_sweep_at
+    if now - _last_sweep_at < _SWEEP_INTERVAL:
+        return []
+    _last_sweep_at = now
+    evicted = []
+    for sid, ctx in list(_sessions.items()):
+        if sid == keep or ctx.lock.locked() or ctx.actions.depth:
+            continue
+        if ctx.manager.journal is None and ctx.manager.state.player:
+            continue  # 没有 journal（MH_JOURNAL=0）时驱逐就等于丢档，只驱逐还没开局的会话
+        if now - ctx.last_access_at > SESSION_IDLE_TTL:
+            evicted.append(_sessions.pop(sid))
+    return evicted
+
+async def _evict(evicted: list):
+    for ctx in evicted:
+        await ctx.manager.background.close()
+        await _commit_journal(ctx)
+
 async def _get_or_create_session(request: Request) -> tuple[str, _SessionCtx, bool]:
+    # 预热没结束前先等着，不在事件循环里同步加载数据
+    await readiness.wait()
     session_id = _get_session_id_from_request(request)
     created = False
 
     async with _sessions_lock:
+        evicted = _take_idle_sessions(time.monotonic(), session_id)
         if not session_id:
             session_id = uuid.uuid4().hex
             created = True
 
         ctx = _sessions.get(session_id)
         if not ctx:
-            ctx = _SessionCtx(GameManager())
+            ctx = _SessionCtx(_load_manager(session_id))
             _sessions[session_id] = ctx
             created = True
+            # 进程重启前已交卷、还没出分的述职评审重新排队
+            ctx.manager.start_promotion_review()
 
         ctx.last_access_at = time.monotonic()
-        return session_id, ctx, created
+        metrics.bind(session_id=session_id)
+
+    if evicted:
+        # 锁外收尾：取消被驱逐会话的后台任务，并把其日志刷盘
+        await _evict(evicted)
+    return session_id, ctx, created
+
+def _with_headers(resp: Response, response: Response) -> Response:
+    # 直接返回 Response 时，注入的 response 上设的头（cookie 等）要手动带过去
+    resp.raw_headers.extend(h for h in response.raw_headers if h[0] not in (b"content-length", b"content-type"))
+    return resp
+
+def _fast_json(content, response: Response) -> FastJSONResponse:
+    # 直接返回自己产出的模型，跳过 response_model 的二次校验
+    with tracer.span("serialize"):
+        resp = FastJSONResponse(content)
+    return _with_headers(resp, response)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match 用弱比较：忽略 W/ 前缀
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or opaque in tags
 
 def _set_session_cookie(response: Response, session_id: str):
     response.set_cookie(
@@ -71,64 +188,307 @@ def read_root():
 
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "ts": int(time.time())}
+    # 存活探针：不等预热，keepalive 每 5 分钟来 ping 一次
+    return {"ok": True, "ready": readiness.ready, "ts": int(time.time())}
 
 @app.head("/healthz")
 def healthz_head():
     return Response(status_code=200)
 
+@app.get("/readyz")
+def readyz():
+    # 就绪探针：预热完成前 503，附带各初始化步骤的耗时
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
+
+@app.head("/readyz")
+def readyz_head():
+    return Response(status_code=200 if readiness.ready else 503)
+
 @app.post("/api/init", response_model=GameState)
 async def init_game(req: OnboardRequest, request: Request, response: Response):
     session_id, ctx, created = await _get_or_create_session(request)
     async with ctx.lock:
         state = await ctx.manager.init_game(req)
+    await _commit_journal(ctx)
     if created:
         _set_session_cookie(response, session_id)
-    return state
+    return _fast_json(state, response)
+
+MAX_LONG_POLL_SECONDS = 30.0
 
 @app.get("/api/state", response_model=GameState)
-async def get_state(request: Request, response: Response):
+async def get_state(request: Request, response: Response, wait: float = 0):
     session_id, ctx, created = await _get_or_create_session(request)
-    async with ctx.lock:
-        state = ctx.manager.state
+    manager = ctx.manager
+    if_none_match = request.headers.get("if-none-match")
+    if wait > 0 and _etag_matches(if_none_match, manager.snapshot_etag):
+        # 长轮询：客户端已是最新版本时挂起，直到发布新快照或超时
+        await manager.wait_snapshot(manager.snapshot_etag, min(wait, MAX_LONG_POLL_SECONDS))
+    state, etag = manager.snapshot, manager.snapshot_etag
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Queue-Depth"] = str(ctx.actions.depth)
     if created:
         _set_session_cookie(response, session_id)
+    if _etag_matches(if_none_match, etag):
+        return _with_headers(Response(status_code=304), response)
+    return _fast_json(state, response)
+
+@app.get("/api/queue")
+async def get_queue(request: Request, response: Response):
+    session_id, ctx, created = await _get_or_create_session(request)
+    if created:
+        _set_session_cookie(response, session_id)
+    return {
+        **ctx.actions.stats(),
+        "background": ctx.manager.background.stats(),
+        "promotion_reviews": promotion_reviews.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/llm/prompts")
+def get_prompt_stats():
+    # 各 LLM 方法的提示词 token 统计（估算值 + 服务端 usage 回报的真实值 / 缓存命中）
+    return prompt_stats()
+
+async def _run_queued_action(ctx: _SessionCtx, req: ActionRequest) -> GameState:
+    kind = "command" if req.content.startswith("cmd:") else "chat"
+    item = ctx.actions.submit(kind, req.content, req.target_npc)
+    if not await ctx.actions.wait_turn(item):
+        # 被合并进前一个指令批次，或作为过期聊天被丢弃：直接返回最新状态
+        await _commit_journal(ctx)
+        return item.state or ctx.manager.snapshot
+
+    state, batch = None, []
+    try:
+        if kind == "command":
+            batch = ctx.actions.take_commands()
+        if batch:
+            async with ctx.lock:
+                commands = [(i.text, i.target_npc) for i in [item, *batch]]
+                ctx.manager.apply_command_batch(commands)
+                state = ctx.manager.snapshot
+        else:
+            # 回合自己只在落地时拿会话锁；全局 LLM 名额只给聊天回合，指令不占
+            async with (llm_turn_slots if kind == "chat" else nullcontext()):
+                state = await ctx.manager.process_text_action(req.content, req.target_npc)
+    finally:
+        ctx.actions.finish(item, state, batch)
+    await _commit_journal(ctx)
     return state
 
 @app.post("/api/action", response_model=GameState)
 async def action(req: ActionRequest, request: Request, response: Response):
     session_id, ctx, created = await _get_or_create_session(request)
-    async with ctx.lock:
-        if req.action_type in ("chat", "workbench"):
-            state = await ctx.manager.process_text_action(req.content, req.target_npc)
-        else:
-            state = ctx.manager.state
+    if req.action_type in ("chat", "workbench"):
+        state = await _run_queued_action(ctx, req)
+    else:
+        state = ctx.manager.snapshot
+    response.headers["X-Queue-Depth"] = str(ctx.actions.depth)
     if created:
         _set_session_cookie(response, session_id)
-    return state
+    return _fast_json(state, response)
+
+MAX_BATCH_COMMANDS = 50
+_ADVANCE_POLICIES = ("per_command", "once", "none")
+
+@app.post("/api/actions/batch", response_model=BatchActionResponse)
+async def action_batch(req: BatchActionRequest, request: Request, response: Response):
+    session_id, ctx, created = await _get_or_create_session(request)
+    if req.advance not in _ADVANCE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"advance must be one of {', '.join(_ADVANCE_POLICIES)}")
+    if len(req.commands) > MAX_BATCH_COMMANDS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_BATCH_COMMANDS} commands per batch")
+    commands = [(c if c.startswith("cmd:") else f"cmd:{c}", req.target_npc) for c in req.commands]
+
+    item = ctx.actions.submit("batch")
+    await ctx.actions.wait_turn(item)
+    try:
+        async with ctx.lock:
+            before = ctx.manager.snapshot
+            results = ctx.manager.apply_command_batch(commands, advance=req.advance)
+            after = ctx.manager.snapshot
+    finally:
+        ctx.actions.finish(item)
+    await _commit_journal(ctx)
+
+    response.headers["X-Queue-Depth"] = str(ctx.actions.depth)
+    if created:
+        _set_session_cookie(response, session_id)
+    return _fast_json(
+        BatchActionResponse(
+            results=results,
+            delta=diff_state(before, after),
+            state_version=ctx.manager.state_version,
+        ),
+        response,
+    )
+
+MAX_ADVANCE_WEEKS = 48
+
+@app.post("/api/advance", response_model=AdvanceResponse)
+async def advance(req: AdvanceRequest, request: Request, response: Response):
+    session_id, ctx, created = await _get_or_create_session(request)
+    if req.until not in (None, "quarter"):
+        raise HTTPException(status_code=400, detail="until must be 'quarter'")
+
+    item = ctx.actions.submit("advance")
+    await ctx.actions.wait_turn(item)
+    try:
+        async with ctx.lock:
+            weeks = req.weeks
+            if req.until == "quarter":
+                weeks = 12 - (ctx.manager.state.week - 1) % 12
+            weeks = max(0, min(MAX_ADVANCE_WEEKS, weeks))
+            before = ctx.manager.snapshot
+            summary = ctx.manager.fast_forward(weeks, channel=req.channel)
+            after = ctx.manager.snapshot
+    finally:
+        ctx.actions.finish(item)
+    await _commit_journal(ctx)
+
+    if created:
+        _set_session_cookie(response, session_id)
+    return _fast_json(
+        AdvanceResponse(
+            summary=summary,
+            delta=diff_state(before, after),
+            state_version=ctx.manager.state_version,
+        ),
+        response,
+    )
+
+@app.get("/api/save")
+async def export_save(request: Request):
+    session_id, ctx, created = await _get_or_create_session(request)
+    # 同步编码、中间没有 await，拿到的是回合之间的一致状态
+    blob = ctx.manager.export_save()
+    resp = Response(
+        content=blob,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="mihoyo_adventure.mhsave"'},
+    )
+    if created:
+        _set_session_cookie(resp, session_id)
+    return resp
+
+@app.post("/api/load", response_model=GameState)
+async def import_save(request: Request, response: Response):
+    session_id, ctx, created = await _get_or_create_session(request)
+    blob = await request.body()
+    item = ctx.actions.submit("load")
+    await ctx.actions.wait_turn(item)
+    try:
+        async with ctx.lock:
+            state = ctx.manager.import_save(blob)
+            ctx.manager.start_promotion_review()
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"invalid save: {e}")
+    finally:
+        ctx.actions.finish(item)
+    await _commit_journal(ctx)
+    if created:
+        _set_session_cookie(response, session_id)
+    return _fast_json(state, response)
 
 @app.post("/api/event/ack", response_model=GameState)
 async def ack_event(request: Request, response: Response):
     session_id, ctx, created = await _get_or_create_session(request)
-    async with ctx.lock:
-        state = ctx.manager.ack_global_event()
+    # 同步修改、中间没有 await，不会和进行中的回合交错，无需等回合锁
+    state = ctx.manager.ack_global_event()
+    await _commit_journal(ctx)
     if created:
         _set_session_cookie(response, session_id)
-    return state
+    return _fast_json(state, response)
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 @app.post("/api/action/stream")
 async def action_stream(req: ActionRequest, request: Request):
     session_id, ctx, created = await _get_or_create_session(request)
 
     if req.action_type not in ("chat", "workbench"):
-        return ctx.manager.state
+        return FastJSONResponse(ctx.manager.snapshot)
 
-    async def stream():
-        async with ctx.lock:
-            async for chunk in ctx.manager.stream_text_action(req.content, req.target_npc):
-                yield chunk
+    kind = "command" if req.content.startswith("cmd:") else "chat"
+
+    async def turn():
+        item = ctx.actions.submit(kind, req.content, req.target_npc)
+        if not await ctx.actions.wait_turn(item):
+            # 指令被合并进前面的批次（coalesced），或聊天作为过期消息被丢弃（dropped）
+            state = item.state or ctx.manager.snapshot
+            yield sse_frame({'type': item.status, 'content': req.content})
+            yield state_update_frame(state)
+            yield "data: [DONE]\n\n"
+            return
+        state, batch = None, []
+        try:
+            if kind == "command":
+                # 和 /api/action 一样：把排在后面的指令一并合并成一批落地
+                batch = ctx.actions.take_commands()
+            if batch:
+                async with ctx.lock:
+                    prev_len = len(ctx.manager.state.chat_history)
+                    commands = [(i.text, i.target_npc) for i in [item, *batch]]
+                    ctx.manager.apply_command_batch(commands)
+                    msgs = ctx.manager.state.chat_history[prev_len:]
+                    state = ctx.manager.snapshot
+                for msg in msgs:
+                    yield sse_frame({'type': 'msg_append', 'msg': msg})
+                yield state_update_frame(state)
+            else:
+                async with (llm_turn_slots if kind == "chat" else nullcontext()):
+                    async for chunk in ctx.manager.stream_text_action(req.content, req.target_npc):
+                        yield chunk
+        finally:
+            ctx.actions.finish(item, state, batch)
+        await _commit_journal(ctx)
 
-    resp = StreamingResponse(stream(), media_type="text/event-stream")
+    def on_abort():
+        # 客户端已断开：已生效的状态变更保留，补一帧最终状态供 Last-Event-ID 续传
+        state = ctx.manager.snapshot
+        return [
+            state_update_frame(state),
+            "data: [DONE]\n\n",
+        ]
+
+    resp = StreamingResponse(
+        stream_events(request, turn(), ctx.events, on_abort=on_abort),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
+    if created:
+        _set_session_cookie(resp, session_id)
+    return resp
+
+@app.get("/api/action/stream/resume")
+async def action_stream_resume(request: Request, last_event_id: Optional[int] = None):
+    session_id, ctx, created = await _get_or_create_session(request)
+    if last_event_id is None:
+        last_event_id = parse_last_event_id(request.headers.get("last-event-id"))
+    resp = StreamingResponse(
+        replay_events(ctx.events, last_event_id),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
+    if created:
+        _set_session_cookie(resp, session_id)
+    return resp
+
+@app.get("/api/events")
+async def session_events(request: Request, last_event_id: Optional[int] = None):
+    # 会话级事件流：先补发 Last-Event-ID 之后的帧，然后一直跟随（回合帧 + 述职评分等后台结果），直到客户端断开
+    session_id, ctx, created = await _get_or_create_session(request)
+    if last_event_id is None:
+        last_event_id = parse_last_event_id(request.headers.get("last-event-id"))
+    resp = StreamingResponse(
+        replay_events(ctx.events, last_event_id, follow=True),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
     if created:
         _set_session_cookie(resp, session_id)
     return resp
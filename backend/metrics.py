@@ -0,0 +1,269 @@
+import contextvars
+import functools
+import json
+import os
+import time
+from typing import Dict, Optional
+
+import tracer
+from commands import command_stats
+from prompts import prompt_stats
+
+# 每次真实 LLM 调用打印一行结构化 JSON 日志（mock 不打）；MH_LLM_LOG=0 关闭
+CALL_LOG_ENABLED = os.getenv("MH_LLM_LOG", "1") != "0"
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+# 请求 / 回合维度的标签：main 在解析会话时绑定 session，GameManager 建 plan 时绑定 turn。
+# asyncio 任务创建时会复制上下文，回合内派生的后台调用自动继承这两个标签
+session_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("mh_session_id", default=None)
+turn_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("mh_turn_id", default=None)
+_current_call: contextvars.ContextVar[Optional["LLMCall"]] = contextvars.ContextVar("mh_llm_call", default=None)
+
+
+def bind(session_id: str = None, turn_id: str = None):
+    if session_id is not None:
+        session_id_var.set(session_id)
+    if turn_id is not None:
+        turn_id_var.set(turn_id)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MethodMetrics:
+    def __init__(self):
+        self.outcomes: Dict[str, int] = {}
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latency = Histogram()
+        self.ttft = Histogram()
+
+
+class LLMCall:
+    """
+    One LLMService call. outcome is ``ok``, ``error`` (the method returned
+    its fallback result) or ``mock`` (served by mock mode without a request).
+    """
+
+    def __init__(self, method: str):
+        self.method = method
+        self.session_id = session_id_var.get()
+        self.turn_id = turn_id_var.get()
+        self.started = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.outcome = "ok"
+        self.error: Optional[str] = None
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+
+    def usage(self, usage):
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+    def retry(self):
+        self.retries += 1
+
+    def fail(self, exc: BaseException):
+        self.outcome = "error"
+        self.error = f"{type(exc).__name__}: {exc}"[:200]
+
+    def mock(self):
+        self.outcome = "mock"
+
+    def as_log(self, elapsed: float) -> dict:
+        record = {
+            "event": "llm_call",
+            "method": self.method,
+            "session_id": self.session_id,
+            "turn_id": self.turn_id,
+            "outcome": self.outcome,
+            "wall_ms": round(elapsed * 1000, 1),
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "retries": self.retries,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class LLMMetrics:
+    def __init__(self):
+        self.methods: Dict[str, MethodMetrics] = {}
+
+    def current(self) -> Optional[LLMCall]:
+        return _current_call.get()
+
+    def record(self, call: LLMCall):
+        elapsed = time.perf_counter() - call.started
+        tracer.record(f"llm.{call.method}", elapsed)
+        m = self.methods.setdefault(call.method, MethodMetrics())
+        m.outcomes[call.outcome] = m.outcomes.get(call.outcome, 0) + 1
+        m.retries += call.retries
+        m.prompt_tokens += call.prompt_tokens
+        m.completion_tokens += call.completion_tokens
+        m.cached_tokens += call.cached_tokens
+        if call.outcome != "mock":
+            m.latency.observe(elapsed)
+            if call.ttft is not None:
+                m.ttft.observe(call.ttft)
+        if CALL_LOG_ENABLED and call.outcome != "mock":
+            print(json.dumps(call.as_log(elapsed), ensure_ascii=False))
+
+    def instrument(self, method: str):
+        """Decorator for ``async def`` LLMService methods."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(service, *args, **kwargs):
+                call = LLMCall(method)
+                if service.use_mock:
+                    call.mock()
+                token = _current_call.set(call)
+                try:
+                    return await fn(service, *args, **kwargs)
+                except BaseException as e:
+                    call.fail(e)
+                    raise
+                finally:
+                    _current_call.reset(token)
+                    self.record(call)
+
+            return wrapper
+
+        return decorator
+
+    def instrument_stream(self, method: str):
+        """Decorator for async-generator methods; time to first token is the first yielded chunk."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(service, *args, **kwargs):
+                call = LLMCall(method)
+                if service.use_mock:
+                    call.mock()
+                agen = fn(service, *args, **kwargs)
+                try:
+                    while True:
+                        # 只在推进内部生成器时挂上当前调用，不把上下文泄漏给消费方
+                        token = _current_call.set(call)
+                        try:
+                            chunk = await agen.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _current_call.reset(token)
+                        call.first_token()
+                        yield chunk
+                except BaseException as e:
+                    if call.outcome == "ok" and not isinstance(e, GeneratorExit):
+                        call.fail(e)
+                    raise
+                finally:
+                    await agen.aclose()
+                    self.record(call)
+
+            return wrapper
+
+        return decorator
+
+
+llm_metrics = LLMMetrics()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, method: str, h: Histogram) -> list:
+    lines = []
+    for bound, count in zip(h.buckets, h.counts):
+        lines.append(f"{name}_bucket{_labels(method=method, le=bound)} {count}")
+    lines.append(f"{name}_bucket{_labels(method=method, le='+Inf')} {h.count}")
+    lines.append(f"{name}_sum{_labels(method=method)} {h.sum:.6f}")
+    lines.append(f"{name}_count{_labels(method=method)} {h.count}")
+    return lines
+
+
+def prometheus_text() -> str:
+    """Prometheus text exposition (format 0.0.4) of the LLM call, prompt and command metrics."""
+    methods = llm_metrics.methods
+    lines = [
+        "# HELP mh_llm_calls_total LLM calls by method and outcome (ok / error / mock).",
+        "# TYPE mh_llm_calls_total counter",
+    ]
+    for method, m in methods.items():
+        for outcome, n in m.outcomes.items():
+            lines.append(f"mh_llm_calls_total{_labels(method=method, outcome=outcome)} {n}")
+    lines += ["# HELP mh_llm_retries_total Transient-error retries.", "# TYPE mh_llm_retries_total counter"]
+    for method, m in methods.items():
+        lines.append(f"mh_llm_retries_total{_labels(method=method)} {m.retries}")
+    lines += [
+        "# HELP mh_llm_tokens_total Tokens reported by the provider (prompt / completion / cached).",
+        "# TYPE mh_llm_tokens_total counter",
+    ]
+    for method, m in methods.items():
+        for kind, n in (("prompt", m.prompt_tokens), ("completion", m.completion_tokens), ("cached", m.cached_tokens)):
+            lines.append(f"mh_llm_tokens_total{_labels(method=method, kind=kind)} {n}")
+    lines += ["# HELP mh_llm_latency_seconds Wall time per LLM call.", "# TYPE mh_llm_latency_seconds histogram"]
+    for method, m in methods.items():
+        lines += _histogram_lines("mh_llm_latency_seconds", method, m.latency)
+    lines += ["# HELP mh_llm_ttft_seconds Time to first streamed token.", "# TYPE mh_llm_ttft_seconds histogram"]
+    for method, m in methods.items():
+        if m.ttft.count:
+            lines += _histogram_lines("mh_llm_ttft_seconds", method, m.ttft)
+
+    prompts = prompt_stats()
+    lines += [
+        "# HELP mh_llm_prompt_estimated_tokens_total Estimated prompt tokens sent, per template.",
+        "# TYPE mh_llm_prompt_estimated_tokens_total counter",
+    ]
+    for name, s in prompts.items():
+        lines.append(f"mh_llm_prompt_estimated_tokens_total{_labels(template=name)} {s['estimated_tokens']}")
+    lines += [
+        "# HELP mh_llm_prompt_trimmed_items_total History messages / NPC payloads dropped by the token budget.",
+        "# TYPE mh_llm_prompt_trimmed_items_total counter",
+    ]
+    for name, s in prompts.items():
+        lines.append(f"mh_llm_prompt_trimmed_items_total{_labels(template=name)} {s['trimmed_items']}")
+
+    commands = command_stats()
+    lines += ["# HELP mh_command_calls_total Workbench command runs.", "# TYPE mh_command_calls_total counter"]
+    for name, s in commands.items():
+        lines.append(f"mh_command_calls_total{_labels(command=name)} {s['calls']}")
+    lines += ["# HELP mh_command_seconds_total Time spent in workbench command handlers.", "# TYPE mh_command_seconds_total counter"]
+    for name, s in commands.items():
+        lines.append(f"mh_command_seconds_total{_labels(command=name)} {s['total_ms'] / 1000:.6f}")
+    return "\n".join(lines) + "\n"
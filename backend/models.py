@@ -17,6 +17,44 @@ class ProjectStatus(str, Enum):
     LIVE = "Live"
     CANCELED = "Canceled"
 
+class UndoLog:
+    """
+    Old values of NPC fields assigned while a turn is applied. NPCs are only
+    ever changed by attribute assignment, so recording the first old value
+    of each (npc, field) is enough to roll a turn back without copying the
+    whole roster. ``active`` is set by TurnTransaction; apply is synchronous,
+    so one process-wide slot is enough.
+    """
+
+    active: Optional["UndoLog"] = None
+
+    def __init__(self, parent: Optional["UndoLog"] = None):
+        self.parent = parent
+        self.entries = []
+        self._seen = set()
+
+    def record(self, obj, name: str):
+        key = (id(obj), name)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self.entries.append((obj, name, obj.__dict__.get(name)))
+
+    def rollback(self):
+        for obj, name, value in reversed(self.entries):
+            obj.__dict__[name] = value
+        self.entries.clear()
+        self._seen.clear()
+
+    def merge_into_parent(self):
+        # 嵌套事务成功结束：外层回滚时也要能撤销这些改动
+        if self.parent is not None:
+            for obj, name, value in self.entries:
+                key = (id(obj), name)
+                if key not in self.parent._seen:
+                    self.parent._seen.add(key)
+                    self.parent.entries.append((obj, name, value))
+
 class Project(BaseModel):
     name: str
     type: ProjectType
@@ -49,6 +87,12 @@ class NPC(BaseModel):
     status: str = "在职"
     relations: Dict[str, str] = {}
 
+    def __setattr__(self, name, value):
+        log = UndoLog.active
+        if log is not None:
+            log.record(self, name)
+        super().__setattr__(name, value)
+
 class Player(BaseModel):
     name: str
     role: Role
@@ -116,6 +160,8 @@ class GameState(BaseModel):
     player_subordinates: List[str] = []
     promotion_review: Optional[Dict[str, Any]] = None
     tutorial_reward_claimed: bool = False
+    # 发布版本号：只在 GameManager.publish_snapshot 产出的快照上赋值，对应 /api/state 的 ETag
+    version: int = 0
 
 class ActionRequest(BaseModel):
     action_type: str # "chat", "workbench"
@@ -126,3 +172,23 @@ class OnboardRequest(BaseModel):
     name: str
     role: Role
     project_name: str
+
+class BatchActionRequest(BaseModel):
+    commands: List[str]
+    target_npc: Optional[str] = "workbench"
+    advance: str = "per_command" # "per_command", "once", "none"
+
+class BatchActionResponse(BaseModel):
+    results: List[Dict[str, Any]] = []
+    delta: Dict[str, Any] = {}
+    state_version: int = 0
+
+class AdvanceRequest(BaseModel):
+    weeks: int = 1
+    until: Optional[str] = None # "quarter": 快进到下个季度开始
+    channel: str = "group"
+
+class AdvanceResponse(BaseModel):
+    summary: Dict[str, Any] = {}
+    delta: Dict[str, Any] = {}
+    state_version: int = 0
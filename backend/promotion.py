@@ -0,0 +1,291 @@
+import asyncio
+import os
+import re
+from typing import Awaitable, Callable, List, Optional
+
+from models import ProjectStatus
+
+# 非 12 的倍数但也做晋升评估的周（其余评估周是 12 的倍数）
+EXTRA_EVAL_WEEKS = frozenset({52, 80})
+FIRST_EVAL_WEEK = 12
+MAX_LEVEL = 10
+
+
+def is_eval_week(week: int) -> bool:
+    return week >= FIRST_EVAL_WEEK and (week % 12 == 0 or week in EXTRA_EVAL_WEEKS)
+
+
+def level_num(level: str) -> int:
+    try:
+        return int(level.replace("P", ""))
+    except Exception:
+        return 5
+
+
+class PromotionRung:
+    """
+    Requirements for one target level, fixed at import. ``advice`` pairs a
+    requirement key with the hint shown on evaluation weeks, in display order.
+    """
+
+    __slots__ = (
+        "level", "min_week", "kpi", "political_capital", "revenue",
+        "max_accidents", "needs_project", "score_threshold", "advice",
+    )
+
+    def __init__(
+        self,
+        level: int,
+        min_week: int,
+        kpi: int = 0,
+        political_capital: int = 0,
+        revenue: int = 0,
+        max_accidents: Optional[int] = None,
+        needs_project: bool = False,
+        score_threshold: int = 55,
+        advice=(),
+    ):
+        self.level = level
+        self.min_week = min_week
+        self.kpi = kpi
+        self.political_capital = political_capital
+        self.revenue = revenue
+        self.max_accidents = max_accidents
+        self.needs_project = needs_project
+        self.score_threshold = score_threshold
+        self.advice = tuple(advice)
+
+    def unmet(self, stats: "PromotionStats") -> set:
+        """Requirement keys (other than the week) that ``stats`` does not satisfy."""
+        missing = set()
+        if stats.kpi < self.kpi:
+            missing.add("kpi")
+        if stats.political_capital < self.political_capital:
+            missing.add("political_capital")
+        if stats.revenue_total < self.revenue:
+            missing.add("revenue")
+        if self.max_accidents is not None and stats.accidents > self.max_accidents:
+            missing.add("accidents")
+        if self.needs_project and not stats.has_project:
+            missing.add("project")
+        return missing
+
+    def satisfied(self, stats: "PromotionStats") -> bool:
+        return stats.week >= self.min_week and not self.unmet(stats)
+
+    def hints(self, stats: "PromotionStats") -> List[str]:
+        missing = self.unmet(stats)
+        return [text for key, text in self.advice if key in missing]
+
+
+PROMOTION_LADDER = (
+    PromotionRung(6, 12, kpi=400, max_accidents=0, needs_project=True, score_threshold=55, advice=(
+        ("project", "至少参与一个已上线项目，或在预研项目中持续贡献"),
+        ("accidents", "避免重大事故"),
+        ("kpi", "累计更多有效KPI"),
+    )),
+    PromotionRung(7, 24, kpi=1300, political_capital=8, score_threshold=60, advice=(
+        ("kpi", "提升项目KPI贡献"),
+        ("political_capital", "多与关键老板正向互动积累政治资本"),
+    )),
+    PromotionRung(8, 36, kpi=3000, political_capital=25, revenue=20000, max_accidents=1, score_threshold=65, advice=(
+        ("kpi", "承担更大范围的核心任务"),
+        ("political_capital", "在跨团队协作中建立更强话语权"),
+        ("revenue", "推动至少一个项目形成可观营收"),
+        ("accidents", "降低重大事故发生次数"),
+    )),
+    PromotionRung(9, 52, kpi=5000, political_capital=40, revenue=50000, score_threshold=70, advice=(
+        ("kpi", "在多个关键项目中形成稳定输出"),
+        ("political_capital", "在高层视角中建立稳定信任"),
+        ("revenue", "带动更高的业务营收"),
+    )),
+    PromotionRung(10, 80, political_capital=80, revenue=200000, score_threshold=72, advice=(
+        ("political_capital", "在公司范围内形成决定性影响力"),
+        ("revenue", "推动公司级标志性业务成功"),
+    )),
+)
+# 从高到低排列：第一个满足的就是可晋升的最高档
+_LADDER_DESC = tuple(sorted(PROMOTION_LADDER, key=lambda rung: -rung.level))
+_RUNG_BY_LEVEL = {rung.level: rung for rung in PROMOTION_LADDER}
+
+
+class PromotionStats:
+    __slots__ = ("week", "level", "kpi", "political_capital", "revenue_total", "accidents", "has_project")
+
+    def __init__(self, week, level, kpi, political_capital, revenue_total, accidents, has_project):
+        self.week = week
+        self.level = level
+        self.kpi = kpi
+        self.political_capital = political_capital
+        self.revenue_total = revenue_total
+        self.accidents = accidents
+        self.has_project = has_project
+
+
+class PromotionTracker:
+    """
+    Promotion bookkeeping kept next to the game state. The company revenue
+    total is a running counter fed by ``credit_revenue`` instead of a sum
+    over every project per tick; it is rebuilt when the manager's state
+    object is swapped (load, recovery) or after ``invalidate()`` (turn rollback).
+
+    ``refresh`` recomputes the eligible target level from the precomputed
+    ladder and calls ``on_change(old, new)`` when it flips.
+    """
+
+    def __init__(self, on_change: Optional[Callable[[Optional[int], Optional[int]], None]] = None):
+        self.on_change = on_change
+        self._state = None
+        self.revenue_total = 0
+        self.eligible: Optional[int] = None
+
+    def sync(self, state):
+        if state is self._state:
+            return
+        self._state = state
+        self.revenue_total = sum(p.revenue for p in state.projects.values()) if state.projects else 0
+
+    def invalidate(self):
+        """Force a resum on the next sync (state restored in place, e.g. turn rollback)."""
+        self._state = None
+
+    def credit_revenue(self, state, project, gain: int):
+        self.sync(state)
+        project.revenue += gain
+        self.revenue_total += gain
+
+    def stats(self, state) -> Optional[PromotionStats]:
+        self.sync(state)
+        player = state.player
+        if not player:
+            return None
+        project = state.projects.get(player.current_project) if state.projects else None
+        return PromotionStats(
+            week=max(0, getattr(state, "week", 0) or 0),
+            level=level_num(player.level),
+            kpi=getattr(player, "kpi", 0) or 0,
+            political_capital=getattr(player, "political_capital", 0) or 0,
+            revenue_total=self.revenue_total,
+            accidents=getattr(player, "major_accidents", 0) or 0,
+            has_project=bool(getattr(player, "participated_live_projects", None))
+            or bool(project and getattr(project, "status", None) == ProjectStatus.RD),
+        )
+
+    def refresh(self, stats: PromotionStats) -> Optional[PromotionRung]:
+        target = None
+        for rung in _LADDER_DESC:
+            if rung.level <= stats.level:
+                break
+            if rung.satisfied(stats):
+                target = rung
+                break
+        level = target.level if target else None
+        if level != self.eligible:
+            old, self.eligible = self.eligible, level
+            if self.on_change:
+                self.on_change(old, level)
+        return target
+
+    def next_rung(self, stats: PromotionStats) -> Optional[PromotionRung]:
+        return _RUNG_BY_LEVEL.get(max(6, stats.level + 1))
+
+
+# 述职打分：进程内共享的有界 worker 池；排队太长或 LLM 超时就改用本地规则打分
+REVIEW_WORKERS = int(os.getenv("MH_PROMOTION_WORKERS", "4"))
+REVIEW_MAX_WAITING = int(os.getenv("MH_PROMOTION_MAX_WAITING", "8"))
+REVIEW_TIMEOUT = float(os.getenv("MH_PROMOTION_SCORE_TIMEOUT", "10"))
+
+RUBRIC_BASE = 40
+RUBRIC_DIMENSIONS = (
+    ("impact", 12, ("上线", "营收", "收入", "增长", "转化", "留存", "用户", "指标", "效率", "成本", "性能")),
+    ("ownership", 10, ("负责", "主导", "推动", "牵头", "落地", "决策", "owner")),
+    ("collaboration", 8, ("团队", "协作", "跨部门", "沟通", "带新人", "对齐", "配合")),
+    ("reflection", 8, ("复盘", "改进", "优化", "反思", "教训", "风险", "沉淀")),
+)
+RUBRIC_HINTS = {
+    "impact": "缺少对业务结果的说明",
+    "ownership": "个人承担的职责不够清晰",
+    "collaboration": "没有体现团队协作",
+    "reflection": "缺少复盘与改进",
+}
+_DIGIT_RE = re.compile(r"\d")
+
+
+def rubric_score(answer: str, project: str = "") -> dict:
+    """
+    Deterministic local scorer used when the LLM queue is saturated or slow.
+    Rewards length, concrete numbers, naming the project and covering each
+    rubric dimension; the same answer always gets the same score.
+    """
+    text = (answer or "").strip()
+    lowered = text.lower()
+    score = RUBRIC_BASE + min(12, len(text) // 15)
+    missing = []
+    for name, points, words in RUBRIC_DIMENSIONS:
+        hits = sum(1 for w in words if w in lowered)
+        if hits:
+            score += points if hits > 1 else points // 2
+        else:
+            missing.append(RUBRIC_HINTS[name])
+    if _DIGIT_RE.search(text):
+        score += 6
+    if project and project.lower() in lowered:
+        score += 4
+    score = max(0, min(95, score))
+    if missing:
+        comment = "规则评审：" + "，".join(missing) + "。"
+    else:
+        comment = "规则评审：结果、职责、协作与复盘都有覆盖，表达完整。"
+    return {"score": score, "comment": comment}
+
+
+class ReviewQueue:
+    """
+    Process-wide pool for promotion scoring. At most ``workers`` LLM scoring
+    calls run at once; once ``max_waiting`` reviews are already queued (eval
+    weeks hit many sessions together) new ones are scored by ``rubric_score``
+    right away, and an LLM call that errors or exceeds ``timeout`` falls back
+    to the rubric too. ``score`` always returns a result.
+    """
+
+    def __init__(self, workers: int = REVIEW_WORKERS, max_waiting: int = REVIEW_MAX_WAITING, timeout: float = REVIEW_TIMEOUT):
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self.max_waiting = max(0, max_waiting)
+        self.timeout = timeout
+        self.waiting = 0
+        self.running = 0
+        self.scored = {"llm": 0, "rubric_load": 0, "rubric_timeout": 0, "rubric_error": 0}
+
+    def stats(self) -> dict:
+        return {"waiting": self.waiting, "running": self.running, "scored": dict(self.scored)}
+
+    def _rubric(self, reason: str, answer: str, project: str) -> dict:
+        self.scored[reason] += 1
+        return {**rubric_score(answer, project), "scored_by": "rubric"}
+
+    async def score(self, llm_score: Callable[[], Awaitable[dict]], answer: str, project: str = "") -> dict:
+        if self.waiting >= self.max_waiting and self._slots.locked():
+            return self._rubric("rubric_load", answer, project)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            result = await asyncio.wait_for(llm_score(), self.timeout)
+        except asyncio.TimeoutError:
+            return self._rubric("rubric_timeout", answer, project)
+        except Exception as e:
+            print(f"Promotion scoring failed, using rubric: {type(e).__name__}: {e}")
+            return self._rubric("rubric_error", answer, project)
+        finally:
+            self.running -= 1
+            self._slots.release()
+        if not isinstance(result, dict) or "score" not in result:
+            return self._rubric("rubric_error", answer, project)
+        self.scored["llm"] += 1
+        return {**result, "scored_by": "llm"}
+
+
+promotion_reviews = ReviewQueue()
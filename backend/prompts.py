@@ -0,0 +1,135 @@
+import json
+import os
+import textwrap
+from typing import Dict, List, Optional
+
+# 每次调用送给 LLM 的聊天记录 / NPC 列表的估算 token 上限
+HISTORY_TOKEN_BUDGET = int(os.getenv("MH_PROMPT_HISTORY_TOKENS", "360"))
+NPC_TOKEN_BUDGET = int(os.getenv("MH_PROMPT_NPC_TOKENS", "320"))
+MESSAGE_MAX_CHARS = int(os.getenv("MH_PROMPT_MESSAGE_CHARS", "120"))
+TRAITS_MAX_CHARS = 40
+NPC_MAX_RELATIONS = 4
+
+
+def compact(text: str) -> str:
+    """Drop indentation, trailing spaces and blank lines from a triple-quoted prompt."""
+    lines = (line.strip() for line in textwrap.dedent(text).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Tokenizer-free estimate: one token per CJK / non-ASCII character, one per
+    four ASCII characters. Close enough to budget payloads and compare prompts.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def _clip(text, limit: int) -> str:
+    text = str(text or "")
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class PromptTemplate:
+    """
+    A system prompt split into a static prefix, compacted once at import and
+    byte-identical across calls so provider-side prefix caching can hit, and
+    a short per-call ``context`` tail formatted with ``str.format``.
+
+    Also keeps the per-method token counters exported by ``prompt_stats()``.
+    """
+
+    def __init__(self, name: str, static: str, context: str = ""):
+        self.name = name
+        self.static = compact(static)
+        self.context = compact(context)
+        self.static_tokens = estimate_tokens(self.static)
+        self.calls = 0
+        self.estimated_tokens = 0
+        self.prompt_tokens = 0  # 服务端 usage 回报的真实值
+        self.cached_tokens = 0
+        self.trimmed_items = 0
+        _TEMPLATES[name] = self
+
+    def render(self, **values) -> str:
+        if not self.context:
+            return self.static
+        return self.static + "\n" + self.context.format(**values)
+
+    def messages(self, user, **values) -> List[dict]:
+        system = self.render(**values)
+        user_text = user if isinstance(user, str) else dumps(user)
+        self.calls += 1
+        self.estimated_tokens += estimate_tokens(system) + estimate_tokens(user_text)
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user_text},
+        ]
+
+    def history(self, history: Optional[list], limit: int, budget: int = HISTORY_TOKEN_BUDGET) -> list:
+        """Keep the newest ``limit`` messages that fit ``budget``; long contents are clipped."""
+        kept, used = [], 0
+        recent = (history or [])[-limit:] if limit else []
+        for msg in reversed(recent):
+            msg = {k: v for k, v in msg.items() if v is not None}
+            if "content" in msg:
+                msg["content"] = _clip(msg["content"], MESSAGE_MAX_CHARS)
+            cost = estimate_tokens(dumps(msg))
+            if kept and used + cost > budget:
+                break
+            kept.append(msg)
+            used += cost
+        kept.reverse()
+        self.trimmed_items += len(history or []) - len(kept)
+        return kept
+
+    def npcs(self, npcs: list, budget: int = NPC_TOKEN_BUDGET) -> list:
+        """Clip traits / relations of each NPC payload and stop once ``budget`` is spent (the list is pre-sorted by relevance)."""
+        kept, used = [], 0
+        for npc in npcs or []:
+            npc = dict(npc)
+            if "traits" in npc:
+                npc["traits"] = _clip(npc["traits"], TRAITS_MAX_CHARS)
+            relations = npc.get("relations")
+            if isinstance(relations, dict) and len(relations) > NPC_MAX_RELATIONS:
+                npc["relations"] = dict(list(relations.items())[:NPC_MAX_RELATIONS])
+            cost = estimate_tokens(dumps(npc))
+            if kept and used + cost > budget:
+                break
+            kept.append(npc)
+            used += cost
+        self.trimmed_items += len(npcs or []) - len(kept)
+        return kept
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "static_tokens": self.static_tokens,
+            "estimated_tokens": self.estimated_tokens,
+            "avg_estimated_tokens": round(self.estimated_tokens / self.calls, 1) if self.calls else 0,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_hit_rate": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "trimmed_items": self.trimmed_items,
+        }
+
+
+_TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def prompt_stats() -> dict:
+    return {name: template.stats() for name, template in _TEMPLATES.items()}
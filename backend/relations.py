@@ -0,0 +1,311 @@
+from enum import Enum
+import random
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class RelationKind(str, Enum):
+    RIVAL = "对立"
+    ALLY = "合作"
+    SUPERIOR = "上级"
+    SUBORDINATE = "下属"
+    OTHER = "其他"
+
+
+# 关系标签是自由文本，只在建图时分类一次，之后的查询都按 RelationKind 比较
+_LABEL_KEYWORDS = [
+    (RelationKind.RIVAL, ["对立", "冲突", "矛盾"]),
+    (RelationKind.SUPERIOR, ["上级"]),
+    (RelationKind.SUBORDINATE, ["下属"]),
+    (RelationKind.ALLY, ["合作", "友好", "搭档"]),
+]
+
+# 话题选人时会被“拉进群聊”的关系类型
+TENSION_KINDS = frozenset({RelationKind.RIVAL, RelationKind.SUPERIOR, RelationKind.SUBORDINATE})
+
+
+def classify_label(label: str) -> RelationKind:
+    text = str(label or "")
+    for kind, words in _LABEL_KEYWORDS:
+        if any(w in text for w in words):
+            return kind
+    return RelationKind.OTHER
+
+
+def _field(npc, key: str, default=None):
+    if isinstance(npc, dict):
+        return npc.get(key, default)
+    return getattr(npc, key, default)
+
+
+def _parse_level(level) -> int:
+    try:
+        return int(str(level).replace("P", ""))
+    except Exception:
+        return 5
+
+
+def should_be_rivals(npc_a, npc_b) -> bool:
+    roles = {_field(npc_a, "role"), _field(npc_b, "role")}
+    traits_text = (_field(npc_a, "traits") or "") + (_field(npc_b, "traits") or "")
+    tough_keywords = ["毒舌", "强硬", "零容忍"]
+    has_tough = any(k in traits_text for k in tough_keywords)
+    cross_role = "Dev" in roles and "Product" in roles
+    project_a = _field(npc_a, "project")
+    same_project = project_a == _field(npc_b, "project") and project_a not in ("", "General")
+    high_level = _parse_level(_field(npc_a, "level")) >= 7 or _parse_level(_field(npc_b, "level")) >= 7
+    if cross_role and same_project and has_tough:
+        return True
+    if same_project and has_tough and high_level:
+        return True
+    return False
+
+
+def build_relation_pairs(npcs: dict, rng=random) -> List[Tuple[str, str, str]]:
+    """
+    Randomly pair NPCs without predefined relations inside each project group.
+    Works on NPC models or raw dicts, so the offline tool and the runtime
+    fallback share one implementation.
+    """
+    project_groups: Dict[str, List[str]] = {}
+    for npc_id, npc in npcs.items():
+        if not npc_id.startswith("NPC_"):
+            continue
+        if _field(npc, "relations"):
+            continue
+        project_key = _field(npc, "project") or "General"
+        project_groups.setdefault(project_key, []).append(npc_id)
+
+    pairs = []
+    seen: Set[Tuple[str, str]] = set()
+    for ids in project_groups.values():
+        if len(ids) < 2:
+            continue
+        rng.shuffle(ids)
+        pair_count = max(1, len(ids) // 4)
+        for _ in range(pair_count):
+            a_id, b_id = rng.sample(ids, 2)
+            if (a_id, b_id) in seen:
+                continue
+            if should_be_rivals(npcs[a_id], npcs[b_id]):
+                label = RelationKind.RIVAL.value
+            else:
+                label = RelationKind.ALLY.value
+            seen.add((a_id, b_id))
+            seen.add((b_id, a_id))
+            pairs.append((a_id, b_id, label))
+    return pairs
+
+
+class RelationWorld:
+    """
+    A precomputed set of session relation edges ("world"), shared read-only
+    by every session that picks it.
+    """
+
+    def __init__(self):
+        self.adjacency: Dict[str, Dict[str, RelationKind]] = {}
+        self.labels: Dict[Tuple[str, str], str] = {}
+        self.mirror: Dict[str, Dict[str, str]] = {}
+
+    @classmethod
+    def from_pairs(cls, pairs, known_ids=None) -> "RelationWorld":
+        world = cls()
+        for a_id, b_id, label in pairs:
+            if known_ids is not None and (a_id not in known_ids or b_id not in known_ids):
+                continue
+            kind = classify_label(label)
+            for src, dst in ((a_id, b_id), (b_id, a_id)):
+                world.adjacency.setdefault(src, {})[dst] = kind
+                world.labels[(src, dst)] = str(label)
+                world.mirror.setdefault(src, {})[dst] = str(label)
+        return world
+
+    def edges(self, npc_id: str) -> Dict[str, RelationKind]:
+        return self.adjacency.get(npc_id) or {}
+
+
+class RelationGraph:
+    """
+    Shared, read-only relation graph built from the base NPC roster.
+    Edges are stored as adjacency dicts so neighbourhood lookups are O(degree).
+    """
+
+    def __init__(self):
+        self.adjacency: Dict[str, Dict[str, RelationKind]] = {}
+        self.labels: Dict[Tuple[str, str], str] = {}
+        self.project_members: Dict[str, List[str]] = {}
+        self.project_of: Dict[str, str] = {}
+
+    @classmethod
+    def from_npcs(cls, npcs: dict) -> "RelationGraph":
+        graph = cls()
+        for npc_id, npc in npcs.items():
+            project_key = getattr(npc, "project", None) or "General"
+            graph.project_of[npc_id] = project_key
+            graph.project_members.setdefault(project_key, []).append(npc_id)
+        for npc_id, npc in npcs.items():
+            rels = getattr(npc, "relations", None) or {}
+            for other_id, label in rels.items():
+                if other_id not in npcs:
+                    continue
+                graph.adjacency.setdefault(npc_id, {})[other_id] = classify_label(label)
+                graph.labels[(npc_id, other_id)] = str(label)
+        return graph
+
+    def edges(self, npc_id: str) -> Dict[str, RelationKind]:
+        return self.adjacency.get(npc_id) or {}
+
+
+class RelationOverlay:
+    """
+    Per-session view over a shared RelationGraph.
+
+    The session's relation world (shared, precomputed) is layered on top of the
+    base graph; edges created during play live in ``added`` and edges removed
+    in this session are tracked in ``removed``.
+    Inactive NPCs (离职) and project transfers are tracked here as well so the
+    base graph is never mutated.
+    """
+
+    def __init__(self, base: RelationGraph, npcs: Optional[dict] = None, world: Optional[RelationWorld] = None):
+        self.base = base
+        self.world = world or RelationWorld()
+        self.added: Dict[str, Dict[str, RelationKind]] = {}
+        self.added_labels: Dict[Tuple[str, str], str] = {}
+        self.removed: Set[Tuple[str, str]] = set()
+        self.inactive: Set[str] = set()
+        self.moved: Dict[str, str] = {}
+        if npcs:
+            for npc_id, npc in npcs.items():
+                if getattr(npc, "status", "在职") != "在职":
+                    self.inactive.add(npc_id)
+
+    def checkpoint(self) -> tuple:
+        return (
+            {k: dict(v) for k, v in self.added.items()},
+            dict(self.added_labels),
+            set(self.removed),
+            set(self.inactive),
+            dict(self.moved),
+        )
+
+    def restore(self, saved: tuple):
+        self.added, self.added_labels, self.removed, self.inactive, self.moved = saved
+
+    def export_changes(self) -> dict:
+        """Session-local edits for save files; inactive NPCs are rebuilt from NPC.status."""
+        return {
+            "added": [[a_id, b_id, label] for (a_id, b_id), label in self.added_labels.items()],
+            "removed": [list(pair) for pair in sorted(self.removed)],
+            "moved": dict(self.moved),
+        }
+
+    def import_changes(self, payload: dict):
+        for a_id, b_id, label in payload.get("added") or []:
+            self.add_edge(a_id, b_id, label, symmetric=False)
+        self.removed.update(tuple(pair) for pair in payload.get("removed") or [])
+        self.moved.update(payload.get("moved") or {})
+
+    def add_edge(self, a_id: str, b_id: str, label: str, symmetric: bool = True):
+        kind = classify_label(label)
+        pairs = [(a_id, b_id), (b_id, a_id)] if symmetric else [(a_id, b_id)]
+        for src, dst in pairs:
+            self.added.setdefault(src, {})[dst] = kind
+            self.added_labels[(src, dst)] = str(label)
+            self.removed.discard((src, dst))
+
+    def remove_edge(self, a_id: str, b_id: str, symmetric: bool = True):
+        pairs = [(a_id, b_id), (b_id, a_id)] if symmetric else [(a_id, b_id)]
+        for src, dst in pairs:
+            own = self.added.get(src)
+            if own:
+                own.pop(dst, None)
+            self.added_labels.pop((src, dst), None)
+            self.removed.add((src, dst))
+
+    def has_edge(self, a_id: str, b_id: str) -> bool:
+        if (a_id, b_id) in self.removed:
+            return False
+        return (
+            b_id in self.base.edges(a_id)
+            or b_id in self.world.edges(a_id)
+            or b_id in (self.added.get(a_id) or {})
+        )
+
+    def has_relations(self, npc_id: str) -> bool:
+        return any(True for _ in self._iter_edges(npc_id))
+
+    def set_active(self, npc_id: str, active: bool):
+        if active:
+            self.inactive.discard(npc_id)
+        else:
+            self.inactive.add(npc_id)
+
+    def is_active(self, npc_id: str) -> bool:
+        return npc_id not in self.inactive
+
+    def set_project(self, npc_id: str, project: str):
+        self.moved[npc_id] = project or "General"
+
+    def project_of(self, npc_id: str) -> str:
+        if npc_id in self.moved:
+            return self.moved[npc_id]
+        return self.base.project_of.get(npc_id, "General")
+
+    def project_groups(self) -> Dict[str, List[str]]:
+        if not self.moved:
+            return {k: list(v) for k, v in self.base.project_members.items()}
+        groups: Dict[str, List[str]] = {}
+        for project_key, ids in self.base.project_members.items():
+            for npc_id in ids:
+                groups.setdefault(self.project_of(npc_id), []).append(npc_id)
+        return groups
+
+    def label(self, a_id: str, b_id: str) -> str:
+        if (a_id, b_id) in self.added_labels:
+            return self.added_labels[(a_id, b_id)]
+        if (a_id, b_id) in self.world.labels:
+            return self.world.labels[(a_id, b_id)]
+        return self.base.labels.get((a_id, b_id), "")
+
+    def _iter_edges(self, npc_id: str):
+        own = self.added.get(npc_id) or {}
+        shared = self.world.edges(npc_id)
+        for other_id, kind in self.base.edges(npc_id).items():
+            if other_id in own or other_id in shared or (npc_id, other_id) in self.removed:
+                continue
+            yield other_id, kind
+        for other_id, kind in shared.items():
+            if other_id in own or (npc_id, other_id) in self.removed:
+                continue
+            yield other_id, kind
+        for other_id, kind in own.items():
+            yield other_id, kind
+
+    def neighbors(
+        self,
+        npc_id: str,
+        kinds: Optional[Iterable[RelationKind]] = None,
+        active_only: bool = True,
+    ) -> List[Tuple[str, RelationKind]]:
+        if active_only and npc_id in self.inactive:
+            return []
+        kind_set = set(kinds) if kinds is not None else None
+        result = []
+        for other_id, kind in self._iter_edges(npc_id):
+            if kind_set is not None and kind not in kind_set:
+                continue
+            if active_only and other_id in self.inactive:
+                continue
+            result.append((other_id, kind))
+        return result
+
+    def labels_within(self, npc_id: str, members: Set[str]) -> Dict[str, str]:
+        return {
+            other_id: self.label(npc_id, other_id)
+            for other_id, _ in self._iter_edges(npc_id)
+            if other_id in members
+        }
+
+    def relations_dict(self, npc_id: str) -> Dict[str, str]:
+        return {other_id: self.label(npc_id, other_id) for other_id, _ in self._iter_edges(npc_id)}
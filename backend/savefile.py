@@ -0,0 +1,264 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from models import GameState
+import data_loader
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖：缺失时退回紧凑 JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：缺失时退回 zlib
+    zstandard = None
+
+SAVE_MAGIC = b"MHSV"
+SCHEMA_VERSION = 1
+
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+COMPRESS_NONE = 0
+COMPRESS_ZLIB = 1
+COMPRESS_ZSTD = 2
+
+CHAT_KEYS = ("sender", "content", "type", "target", "timestamp")
+_EPOCH = datetime(1970, 1, 1)
+
+
+# ---- NPC：只存和“基础名册 + 本局关系世界”不同的字段 ----
+
+def _baseline_npcs(world_mirror: dict) -> dict:
+    baseline = {}
+    for npc_id, values in data_loader.npc_rows():
+        fields = dict(zip(data_loader.NPC_FIELDS, values))
+        fields["relations"] = {**(fields.get("relations") or {}), **(world_mirror.get(npc_id) or {})}
+        baseline[npc_id] = fields
+    return baseline
+
+
+def _encode_npcs(npcs: dict, baseline: dict) -> dict:
+    changed, added = {}, {}
+    for npc_id, fields in npcs.items():
+        base = baseline.get(npc_id)
+        if base is None:
+            added[npc_id] = fields
+            continue
+        diff = {k: v for k, v in fields.items() if base.get(k) != v}
+        if diff:
+            changed[npc_id] = diff
+    removed = [npc_id for npc_id in baseline if npc_id not in npcs]
+    return {"changed": changed, "added": added, "removed": removed}
+
+
+def _decode_npcs(payload: dict, baseline: dict) -> dict:
+    removed = set(payload.get("removed") or [])
+    changed = payload.get("changed") or {}
+    npcs = {}
+    for npc_id, base in baseline.items():
+        if npc_id in removed:
+            continue
+        npcs[npc_id] = {**base, **(changed.get(npc_id) or {})}
+    npcs.update(payload.get("added") or {})
+    return npcs
+
+
+# ---- 聊天记录：按列存，时间戳转成相邻差值（微秒） ----
+
+def _ts_to_int(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        return None
+    n = (dt - _EPOCH) // timedelta(microseconds=1)
+    # 只接受能原样还原的时间戳
+    return n if (_EPOCH + timedelta(microseconds=n)).isoformat() == value else None
+
+
+def _encode_chat(history: list) -> dict:
+    cols = {k: [] for k in CHAT_KEYS}
+    raw = {}
+    prev = 0
+    for idx, msg in enumerate(history):
+        ts = _ts_to_int(msg.get("timestamp")) if isinstance(msg, dict) and set(msg) == set(CHAT_KEYS) else None
+        if ts is None:
+            raw[str(idx)] = msg
+            continue
+        for k in CHAT_KEYS[:-1]:
+            cols[k].append(msg[k])
+        cols["timestamp"].append(ts - prev)
+        prev = ts
+    return {**cols, "raw": raw}
+
+
+def _decode_chat(payload: dict) -> list:
+    raw = {str(k): v for k, v in (payload.get("raw") or {}).items()}
+    cols = [payload.get(k) or [] for k in CHAT_KEYS]
+    total = len(cols[0]) + len(raw)
+    history = []
+    col_idx = 0
+    ts = 0
+    for idx in range(total):
+        if str(idx) in raw:
+            history.append(raw[str(idx)])
+            continue
+        ts += cols[4][col_idx]
+        msg = {k: cols[i][col_idx] for i, k in enumerate(CHAT_KEYS[:-1])}
+        msg["timestamp"] = (_EPOCH + timedelta(microseconds=ts)).isoformat()
+        history.append(msg)
+        col_idx += 1
+    return history
+
+
+# ---- 版本迁移：MIGRATIONS[v] 把 v 版 payload 升到 v+1 ----
+
+def _migrate_v0(payload: dict) -> dict:
+    """v0 = 直接导出的 pydantic JSON（GameState.model_dump），没有头、NPC 全量。"""
+    state = dict(payload["state"])
+    npcs = state.pop("npcs", {}) or {}
+    history = state.pop("chat_history", []) or []
+    base_labels = data_loader.base_relation_graph().labels
+    world_pairs = [
+        [npc_id, other_id, label]
+        for npc_id, npc in npcs.items()
+        for other_id, label in (npc.get("relations") or {}).items()
+        if (npc_id, other_id) not in base_labels and other_id in npcs
+    ]
+    return {
+        "v": 1,
+        "state": state,
+        "npcs": {"changed": {}, "added": npcs, "removed": [npc_id for npc_id, _ in data_loader.npc_rows() if npc_id not in npcs]},
+        "chat": _encode_chat(history),
+        "relations": {"world": None, "world_pairs": world_pairs},
+    }
+
+
+MIGRATIONS = {
+    0: _migrate_v0,
+}
+
+
+def migrate(payload: dict) -> dict:
+    version = int(payload.get("v", 0))
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"save version {version} is newer than supported {SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        payload = MIGRATIONS[version](payload)
+        version = int(payload["v"])
+    return payload
+
+
+# ---- 编解码 ----
+
+def _pack(payload: dict) -> tuple:
+    if msgpack is not None:
+        return CODEC_MSGPACK, msgpack.packb(payload, use_bin_type=True)
+    return CODEC_JSON, json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _unpack(codec: int, body: bytes) -> dict:
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise ValueError("save was written with msgpack, which is not installed")
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    return json.loads(body.decode("utf-8"))
+
+
+def _compress(body: bytes) -> tuple:
+    if zstandard is not None:
+        return COMPRESS_ZSTD, zstandard.ZstdCompressor(level=3).compress(body)
+    return COMPRESS_ZLIB, zlib.compress(body, 6)
+
+
+def _decompress(method: int, body: bytes) -> bytes:
+    if method == COMPRESS_ZSTD:
+        if zstandard is None:
+            raise ValueError("save was written with zstd, which is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if method == COMPRESS_ZLIB:
+        return zlib.decompress(body)
+    return body
+
+
+def dump_save(state: GameState, relations: dict, world_mirror: dict, compress: bool = True) -> bytes:
+    """
+    Encode a session as ``MHSV | codec | compression | body``.
+    ``relations`` is the overlay payload from GameManager; ``world_mirror`` the
+    mirrored labels of the session's relation world, used as the NPC baseline.
+    """
+    data = state.model_dump(mode="json")
+    npcs = data.pop("npcs", {})
+    history = data.pop("chat_history", [])
+    payload = {
+        "v": SCHEMA_VERSION,
+        "state": data,
+        "npcs": _encode_npcs(npcs, _baseline_npcs(world_mirror)),
+        "chat": _encode_chat(history),
+        "relations": relations,
+    }
+    codec, body = _pack(payload)
+    method = COMPRESS_NONE
+    if compress:
+        method, body = _compress(body)
+    return SAVE_MAGIC + bytes([codec, method]) + body
+
+
+_HEADER_LEN = len(SAVE_MAGIC) + 2
+
+
+def read_payload(blob: bytes) -> dict:
+    """
+    Decode and migrate a save. Anything malformed (short header, unknown
+    codec, corrupt body, wrong payload shape) raises ValueError, which
+    /api/load reports as 400.
+    """
+    if blob[:len(SAVE_MAGIC)] == SAVE_MAGIC:
+        if len(blob) < _HEADER_LEN:
+            raise ValueError("truncated save header")
+        codec, method = blob[_HEADER_LEN - 2], blob[_HEADER_LEN - 1]
+        if codec not in (CODEC_JSON, CODEC_MSGPACK) or method not in (COMPRESS_NONE, COMPRESS_ZLIB, COMPRESS_ZSTD):
+            raise ValueError(f"unknown save encoding {codec}/{method}")
+        try:
+            payload = _unpack(codec, _decompress(method, blob[_HEADER_LEN:]))
+        except ValueError:
+            raise
+        except Exception as e:
+            # zlib.error / ZstdError / msgpack 的各类解码异常都不是 ValueError
+            raise ValueError(f"corrupt save body: {type(e).__name__}: {e}") from e
+    elif blob.lstrip()[:1] == b"{":
+        payload = {"v": 0, "state": json.loads(blob.decode("utf-8"))}
+    else:
+        raise ValueError("not a save file")
+    if not isinstance(payload, dict):
+        raise ValueError("save payload is not an object")
+    if not isinstance(payload.get("v", 0), int):
+        raise ValueError(f"bad save version {payload.get('v')!r}")
+    if int(payload.get("v", 0)) <= SCHEMA_VERSION and not isinstance(payload.get("state"), dict):
+        raise ValueError("save state is not an object")
+    payload = migrate(payload)
+    for key in ("npcs", "chat", "relations"):
+        if not isinstance(payload.get(key) or {}, dict):
+            raise ValueError(f"save section {key} is not an object")
+    return payload
+
+
+def load_save(blob: bytes, world_mirror_for) -> tuple:
+    """
+    Decode a save into ``(GameState, relations payload)``. ``world_mirror_for``
+    maps the relations payload to the mirrored labels of its relation world.
+    """
+    payload = read_payload(blob)
+    relations = payload.get("relations") or {}
+    data = dict(payload["state"])
+    try:
+        data["npcs"] = _decode_npcs(payload.get("npcs") or {}, _baseline_npcs(world_mirror_for(relations)))
+        data["chat_history"] = _decode_chat(payload.get("chat") or {})
+    except (TypeError, AttributeError, IndexError, KeyError) as e:
+        raise ValueError(f"malformed save: {type(e).__name__}: {e}") from e
+    return GameState.model_validate(data), relations
@@ -0,0 +1,43 @@
+import json
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # 可选依赖：缺失时退回标准库 json
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def model_bytes(model: BaseModel) -> bytes:
+    # pydantic-core 为每个模型预编译的序列化器：直接产出 JSON 字节，不经过 dict，也不再校验
+    return model.__pydantic_serializer__.to_json(model)
+
+
+def sse_frame(payload: dict) -> str:
+    return f"data: {dumps(payload).decode('utf-8')}\n\n"
+
+
+def state_update_frame(state: BaseModel) -> str:
+    return f'data: {{"type":"state_update","state":{model_bytes(state).decode("utf-8")}}}\n\n'
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for models the server produced itself: pydantic models go
+    through their compiled serializer, everything else through orjson.
+    Returning it from a handler skips FastAPI's response_model re-validation.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, BaseModel):
+            return model_bytes(content)
+        return dumps(content)
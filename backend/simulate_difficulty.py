@@ -51,11 +51,11 @@ async def run_simulation(strategy_name, strategy_func):
             elif action_type == "rest":
                 gm._apply_effects("REFUSE", 1.0, channel="group")
             elif action_type == "rice":
-                gm._apply_rice_item(arg)
+                gm.run_command("rice", arg, channel="workbench")
             elif action_type == "shop":
-                gm._apply_shop_item(arg, channel="group")
+                gm.run_command("shop", arg, channel="group")
             elif action_type == "course":
-                gm._apply_academy_course(arg, channel="group")
+                gm.run_command("academy", arg, channel="group")
 
             # Advance time (1 day)
             gm._advance_time("group", days=1)
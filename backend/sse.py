@@ -0,0 +1,142 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import suppress
+
+HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+DISCONNECT_POLL_INTERVAL = 1.0
+MAX_PENDING_FRAMES = 32
+EVENT_BUFFER_SIZE = 256
+HEARTBEAT_FRAME = ": ping\n\n"
+
+
+class SSEEventBuffer:
+    """
+    Per-session ring buffer of emitted SSE frames, used for ``Last-Event-ID``
+    resume. Event ids increase monotonically across all streams of a session.
+    """
+
+    def __init__(self, maxlen: int = EVENT_BUFFER_SIZE):
+        self._frames = deque(maxlen=maxlen)
+        self._last_id = 0
+        self._changed = asyncio.Event()
+        self.active = False
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def append(self, chunk: str) -> str:
+        self._last_id += 1
+        frame = f"id: {self._last_id}\n{chunk}"
+        self._frames.append((self._last_id, frame))
+        self._notify()
+        return frame
+
+    def frames_after(self, last_id: int) -> list:
+        return [(event_id, frame) for event_id, frame in self._frames if event_id > last_id]
+
+    def open(self):
+        self.active = True
+        self._notify()
+
+    def close(self):
+        self.active = False
+        self._notify()
+
+    def _notify(self):
+        changed = self._changed
+        self._changed = asyncio.Event()
+        changed.set()
+
+    async def wait_changed(self, timeout: float) -> bool:
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def parse_last_event_id(value) -> int:
+    try:
+        return max(0, int(str(value).strip()))
+    except Exception:
+        return 0
+
+
+async def stream_events(request, source, buffer: SSEEventBuffer, on_abort=None):
+    """
+    Drive ``source`` (an async generator of ``data: ...\\n\\n`` chunks) in its own
+    task and relay its frames to the client.
+
+    - Every frame gets an ``id:`` and is recorded in ``buffer``.
+    - A heartbeat comment is sent when nothing was emitted for HEARTBEAT_INTERVAL.
+    - The producer blocks once MAX_PENDING_FRAMES are waiting (backpressure).
+    - If the client goes away the producer is cancelled, which stops any
+      in-flight LLM call and releases locks held inside ``source``. State
+      mutations already applied are kept; ``on_abort()`` may return closing
+      chunks (e.g. a final state_update) that are recorded for resume.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_FRAMES)
+    done = object()
+
+    async def produce():
+        try:
+            async for chunk in source:
+                await queue.put(buffer.append(chunk))
+        finally:
+            with suppress(asyncio.QueueFull):
+                queue.put_nowait(done)
+
+    async def watch_disconnect():
+        while not producer.done():
+            if await request.is_disconnected():
+                producer.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    buffer.open()
+    producer = asyncio.create_task(produce())
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        while True:
+            if producer.done() and queue.empty():
+                break
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME
+                continue
+            if frame is done:
+                break
+            yield frame
+    finally:
+        watcher.cancel()
+        aborted = not producer.done()
+        if aborted:
+            producer.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await producer
+        if (aborted or producer.cancelled()) and on_abort:
+            for chunk in on_abort() or []:
+                buffer.append(chunk)
+        buffer.close()
+
+
+async def replay_events(buffer: SSEEventBuffer, last_event_id: int, follow: bool = False):
+    """
+    Replay frames newer than ``last_event_id``, then keep tailing while a
+    stream for this session is still producing. With ``follow`` the tail
+    never ends on its own (session event feed); the server stops it when
+    the client disconnects.
+    """
+    sent_id = last_event_id
+    while True:
+        for event_id, frame in buffer.frames_after(sent_id):
+            sent_id = event_id
+            yield frame
+        if not buffer.active and not follow:
+            break
+        if not await buffer.wait_changed(HEARTBEAT_INTERVAL):
+            yield HEARTBEAT_FRAME
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# main 第一行 import 本模块；从这里开始算冷启动
+PROCESS_STARTED = time.perf_counter()
+
+# MH_STARTUP_PROFILE=1：统计每个模块的 import 耗时（含其依赖），预热结束时和各初始化步骤一起打一行 JSON
+PROFILE_ENABLED = os.getenv("MH_STARTUP_PROFILE", "0") == "1"
+PROFILE_TOP_N = int(os.getenv("MH_STARTUP_PROFILE_TOP", "20"))
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _TimedLoader:
+    """Loader proxy that times ``exec_module``; everything else goes to the wrapped loader."""
+
+    def __init__(self, loader, name: str, timings: Dict[str, float]):
+        self._loader = loader
+        self._name = name
+        self._timings = timings
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timings[self._name] = time.perf_counter() - started
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler:
+    """
+    ``sys.meta_path`` finder recording the inclusive import time of top-level
+    packages and of every module under backend/. Only installed when
+    MH_STARTUP_PROFILE=1.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            first_party = bool(spec.origin) and os.path.abspath(spec.origin).startswith(_BACKEND_DIR)
+            if ("." not in fullname or first_party) and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, fullname, self.timings)
+            return spec
+        return None
+
+    def report(self) -> Dict[str, float]:
+        top = sorted(self.timings.items(), key=lambda kv: -kv[1])[:PROFILE_TOP_N]
+        return {name: round(sec * 1000, 1) for name, sec in top}
+
+
+import_profiler: Optional[ImportProfiler] = None
+if PROFILE_ENABLED:
+    import_profiler = ImportProfiler()
+    sys.meta_path.insert(0, import_profiler)
+
+
+class Readiness:
+    """
+    Readiness gate for the cold start. ``/healthz`` answers as soon as the
+    app imports; the slow parts (LLM SDK / client, NPC and relation data)
+    run as warm-up ``steps`` in a worker thread, and session endpoints
+    ``await wait()`` before touching game state. A failed step is logged
+    and skipped: everything it warms is also built lazily on first use.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], object]]]):
+        self.steps = steps
+        self.ready = False
+        self.pending = [name for name, _ in steps]
+        self.phases: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.ready_at: Optional[float] = None
+        self._done = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Schedule warm-up once (lifespan startup, or the first request if the lifespan did not run)."""
+        if self.ready or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._warm_up(), name="startup-warm-up")
+
+    async def wait(self):
+        if self.ready:
+            return
+        self.start()
+        await self._done.wait()
+
+    async def _warm_up(self):
+        for name, step in self.steps:
+            if name in self.phases:
+                continue  # 上一轮预热被取消前已完成的步骤
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(step)
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+                print(f"Warm-up step {name} failed: {e}")
+            self.phases[name] = time.perf_counter() - started
+            self.pending.remove(name)
+        self.ready = True
+        self.ready_at = time.perf_counter()
+        self._done.set()
+        if PROFILE_ENABLED:
+            print(json.dumps({"event": "startup", **self.status(), "import_ms": import_profiler.report()}, ensure_ascii=False))
+
+    def status(self) -> dict:
+        status = {
+            "ready": self.ready,
+            "pending": list(self.pending),
+            "init_ms": {name: round(sec * 1000, 1) for name, sec in self.phases.items()},
+        }
+        if self.ready_at is not None:
+            status["ready_after_ms"] = round((self.ready_at - PROCESS_STARTED) * 1000, 1)
+        if self.errors:
+            status["errors"] = dict(self.errors)
+        return status
@@ -0,0 +1,44 @@
+from models import GameState
+
+# 只会追加的列表：增量里只给新增部分
+APPEND_ONLY_FIELDS = ("chat_history", "workbench_feedback", "memory_facts")
+# 按 id 索引的字典：增量里只给变化的条目/字段
+KEYED_FIELDS = ("projects", "npcs")
+
+
+def _diff_fields(old: dict, new: dict) -> dict:
+    return {k: v for k, v in new.items() if old.get(k) != v}
+
+
+def diff_state(before: GameState, after: GameState) -> dict:
+    """
+    Compact delta between two GameState snapshots. Clients merge it as:
+    ``<field>_append`` lists are extended, ``player`` / ``projects`` / ``npcs``
+    entries are merged field by field (``None`` = removed), anything else is
+    replaced.
+    """
+    old = before.model_dump()
+    new = after.model_dump()
+    delta = {}
+    for key, new_value in new.items():
+        old_value = old.get(key)
+        if new_value == old_value:
+            continue
+        if key in APPEND_ONLY_FIELDS and isinstance(old_value, list) and new_value[:len(old_value)] == old_value:
+            delta[f"{key}_append"] = new_value[len(old_value):]
+        elif key == "player" and old_value and new_value:
+            delta[key] = _diff_fields(old_value, new_value)
+        elif key in KEYED_FIELDS:
+            changed = {}
+            for item_id, item in new_value.items():
+                prev = old_value.get(item_id)
+                if prev is None:
+                    changed[item_id] = item
+                elif prev != item:
+                    changed[item_id] = _diff_fields(prev, item)
+            for item_id in old_value.keys() - new_value.keys():
+                changed[item_id] = None
+            delta[key] = changed
+        else:
+            delta[key] = new_value
+    return delta
@@ -0,0 +1,64 @@
+import random
+
+MOOD_DROPS = tuple(range(3, 11))  # 每次集体加班每人心情 -3..-10
+UNHAPPY_MOOD = 35
+UNHAPPY_TRUST_LOSS = 3
+
+
+class TeamTable:
+    """
+    Column view of the player's active subordinates: the NPC objects plus
+    parallel level-efficiency / mood / trust lists, so a team order is a few
+    list passes instead of per-NPC bookkeeping.
+    """
+
+    __slots__ = ("npcs", "efficiency", "mood", "trust")
+
+    def __init__(self, npcs: list, efficiency: list, mood: list, trust: list):
+        self.npcs = npcs
+        self.efficiency = efficiency
+        self.mood = mood
+        self.trust = trust
+
+    @classmethod
+    def from_state(cls, state, parse_level) -> "TeamTable":
+        npcs = [
+            npc for npc in (state.npcs.get(npc_id) for npc_id in state.player_subordinates)
+            if npc and npc.status == "在职"
+        ]
+        # 职级字符串只有十来种，解析结果按字符串缓存
+        levels = {}
+        for npc in npcs:
+            if npc.level not in levels:
+                levels[npc.level] = max(1, int(parse_level(npc.level) / 2))
+        return cls(
+            npcs,
+            [levels[npc.level] for npc in npcs],
+            [npc.mood for npc in npcs],
+            [npc.trust for npc in npcs],
+        )
+
+    def __len__(self) -> int:
+        return len(self.npcs)
+
+    def work_all(self, rng=random) -> dict:
+        """Everyone pushes the project once; returns the aggregated delta and writes mood/trust back."""
+        drops = rng.choices(MOOD_DROPS, k=len(self.npcs))
+        before_mood, before_trust = self.mood, list(self.trust)
+        self.mood = [max(0, min(100, m - d)) for m, d in zip(before_mood, drops)]
+        unhappy = [i for i, m in enumerate(self.mood) if m < UNHAPPY_MOOD]
+        for i in unhappy:
+            self.trust[i] = max(0, self.trust[i] - UNHAPPY_TRUST_LOSS)
+        # pydantic 的属性赋值不便宜，只回写真正变了的格子
+        for i, npc in enumerate(self.npcs):
+            if self.mood[i] != before_mood[i]:
+                npc.mood = self.mood[i]
+        for i in unhappy:
+            if self.trust[i] != before_trust[i]:
+                self.npcs[i].trust = self.trust[i]
+        return {
+            "members": len(self.npcs),
+            "progress": sum(self.efficiency),
+            "mood": sum(self.mood) - sum(before_mood),
+            "unhappy": len(unhappy),
+        }
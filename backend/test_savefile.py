@@ -0,0 +1,52 @@
+import json
+import zlib
+
+import savefile
+from models import GameState
+
+# 离线检查：损坏 / 截断的存档都应以 ValueError 拒绝（/api/load 返回 400 而不是 500）
+
+BAD_SAVES = {
+    "empty": b"",
+    "bare magic": b"MHSV",
+    "truncated header": b"MHSV\x01",
+    "unknown codec": b"MHSV\x07\x00{}",
+    "corrupt zlib body": b"MHSV\x01\x01garbage",
+    "corrupt json body": b"MHSV\x00\x00{not json",
+    "truncated zlib body": b"MHSV\x00\x01" + zlib.compress(b'{"v": 1, "state": {}}')[:-4],
+    "non-dict payload": b"MHSV\x00\x00" + json.dumps([1, 2, 3]).encode(),
+    "non-dict state": b"MHSV\x00\x00" + json.dumps({"v": 1, "state": "x"}).encode(),
+    "bad version": b"MHSV\x00\x00" + json.dumps({"v": "1", "state": {}}).encode(),
+    "bad chat columns": b"MHSV\x00\x00" + json.dumps({"v": 1, "state": {}, "chat": {"sender": ["a"]}}).encode(),
+    "legacy non-dict": b'{"player": 1',
+}
+
+
+def test_bad_saves():
+    failed = 0
+    for name, blob in BAD_SAVES.items():
+        try:
+            savefile.load_save(blob, lambda relations: {})
+            print(f"FAIL: {name} was accepted")
+            failed += 1
+        except ValueError as e:
+            print(f"SUCCESS: {name} -> {e}")
+        except Exception as e:
+            print(f"FAIL: {name} raised {type(e).__name__}: {e}")
+            failed += 1
+    return failed
+
+
+def test_round_trip():
+    blob = savefile.dump_save(GameState(), {}, {})
+    state, _ = savefile.load_save(blob, lambda relations: {})
+    if state.model_dump() == GameState().model_dump():
+        print("SUCCESS: round trip")
+        return 0
+    print("FAIL: round trip changed the state")
+    return 1
+
+
+if __name__ == "__main__":
+    failed = test_bad_saves() + test_round_trip()
+    print("All save checks passed." if not failed else f"{failed} save checks failed.")
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from data.intent_corpus import INTENT_CORPUS
+from intent import CONFIDENCE_THRESHOLD, INTENT_KEYWORDS, MAGNITUDE_KEYWORDS, SMALL_TALK_MAGNITUDE, classify_intent
+
+REPEAT = int(os.getenv("BENCH_REPEAT", "200"))
+
+
+def legacy_infer(text: str):
+    # 改造前 _infer_intent_magnitude 的逐表 any() 扫描，作为对照组
+    t = (text or "").lower()
+
+    def has_any(words):
+        return any(w in t for w in words)
+
+    intent = "SMALL_TALK"
+    for name, words in INTENT_KEYWORDS:
+        if has_any(words):
+            intent = name
+            break
+    magnitude = 1.0
+    if intent == "SMALL_TALK":
+        magnitude = SMALL_TALK_MAGNITUDE
+    else:
+        for value, words in MAGNITUDE_KEYWORDS:
+            if has_any(words):
+                magnitude = value
+                break
+    return intent, magnitude
+
+
+def bench(label, fn, texts):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for text in texts:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    calls = REPEAT * len(texts)
+    print(f"{label:<22} {elapsed / calls * 1e6:7.2f} us/call  {calls / elapsed:10.0f} calls/s")
+
+
+def main():
+    texts = [text for text, _ in INTENT_CORPUS]
+
+    mismatched = [t for t in texts if legacy_infer(t) != (classify_intent(t).intent, classify_intent(t).magnitude)]
+    print(f"legacy parity: {len(texts) - len(mismatched)}/{len(texts)}")
+    for t in mismatched:
+        print("  MISMATCH", t, legacy_infer(t), classify_intent(t))
+
+    correct, confident, confident_correct = 0, 0, 0
+    errors = Counter()
+    for text, label in INTENT_CORPUS:
+        result = classify_intent(text)
+        ok = result.intent == label
+        correct += ok
+        if result.confidence >= CONFIDENCE_THRESHOLD:
+            confident += 1
+            confident_correct += ok
+        if not ok:
+            errors[(label, result.intent)] += 1
+    total = len(INTENT_CORPUS)
+    print(f"accuracy:              {correct}/{total} = {correct / total:.1%}")
+    print(f"confident (>= {CONFIDENCE_THRESHOLD}):    {confident}/{total} = {confident / total:.1%} of turns skip <analysis>")
+    if confident:
+        print(f"confident precision:   {confident_correct}/{confident} = {confident_correct / confident:.1%}")
+    for (label, got), n in errors.most_common():
+        print(f"  {label:<10} -> {got:<10} x{n}")
+
+    bench("legacy any() scans", legacy_infer, texts)
+    bench("keyword trie", classify_intent, texts)
+
+
+if __name__ == "__main__":
+    main()
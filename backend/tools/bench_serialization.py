@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import serialization
+from game import GameManager
+from main import app
+from models import OnboardRequest, Role
+
+WEEKS = int(os.getenv("BENCH_WEEKS", "150"))
+CHAT_MESSAGES = int(os.getenv("BENCH_CHAT_MESSAGES", "3000"))
+REPEAT = int(os.getenv("BENCH_REPEAT", "30"))
+
+
+async def build_late_game_state():
+    # 后期存档：快进若干周，再把聊天记录补到上限附近，近似最大的响应体
+    random.seed(7)
+    manager = GameManager()
+    await manager.init_game(OnboardRequest(name="bench", role=Role.DEV, project_name="Genshin"))
+    await asyncio.sleep(0.1)
+    while manager.state.week < WEEKS:
+        manager.state.active_global_event = None
+        manager.fast_forward(12)
+    npc_names = [npc.name for npc in manager.state.npcs.values()]
+    while len(manager.state.chat_history) < CHAT_MESSAGES:
+        manager.state.chat_history.append(manager._chat_msg(random.choice(npc_names), "这个需求下周能上线吗？" * 3, "npc", "group"))
+    return manager.publish_snapshot()
+
+
+def report(label: str, elapsed: float, size: int) -> float:
+    print(f"{label:<38} {elapsed * 1e6:10.1f} us  {size / 1024:8.1f} KB  {size / elapsed / 1e6:8.1f} MB/s")
+    return elapsed
+
+
+def bench(label: str, fn, repeat: int = REPEAT) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = len(fn())
+    return report(label, (time.perf_counter() - start) / repeat, size)
+
+
+async def bench_async(label: str, fn, repeat: int = REPEAT) -> float:
+    # serialize_response 是协程，逐次 await
+    await fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = len(await fn())
+    return report(label, (time.perf_counter() - start) / repeat, size)
+
+
+async def main():
+    state = await build_late_game_state()
+    field = next(r for r in app.routes if getattr(r, "path", None) == "/api/state").response_field
+    msg = state.chat_history[-1]
+
+    async def fastapi_path():
+        content = await serialize_response(field=field, response_content=state)
+        return JSONResponse(content).body
+
+    print(f"week {state.week}, {len(state.chat_history)} messages, {len(state.npcs)} npcs, orjson={'yes' if serialization.orjson else 'no'}")
+    old = await bench_async("GameState: response_model + json", fastapi_path)
+    new = bench("GameState: FastJSONResponse", lambda: serialization.FastJSONResponse(state).body)
+    print(f"  -> {old / new:.1f}x")
+
+    old = bench("SSE state_update: json.dumps", lambda: f"data: {json.dumps({'type': 'state_update', 'state': state.dict()})}\n\n".encode())
+    new = bench("SSE state_update: state_update_frame", lambda: serialization.state_update_frame(state).encode())
+    print(f"  -> {old / new:.1f}x")
+
+    old = bench("SSE msg_append: json.dumps", lambda: f"data: {json.dumps({'type': 'msg_append', 'msg': msg})}\n\n".encode(), REPEAT * 1000)
+    new = bench("SSE msg_append: sse_frame", lambda: serialization.sse_frame({"type": "msg_append", "msg": msg}).encode(), REPEAT * 1000)
+    print(f"  -> {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
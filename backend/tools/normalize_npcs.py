@@ -1,8 +1,16 @@
 import json
 import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from relations import build_relation_pairs
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "backend", "data", "npcs.json")
+WORLDS_PATH = os.path.join(os.path.dirname(__file__), "..", "backend", "data", "relation_worlds.json")
 PRESERVE_KEYS = set()
+WORLD_COUNT = 8
+WORLD_SEED = 20240101
 
 COMMON_SURNAMES = set(list("赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜戚谢邹喻柏水窦章云苏潘葛奚范彭郎鲁韦昌马苗凤花方俞任袁柳唐罗薛尤任杜阮闵席季顾孟平黄和穆萧尹姚邵湛汪祁毛禹狄米贝明臧戴宋茅庞熊纪舒屈项祝董粱杜阮蓝采"))
 GIVEN_POOL = ["衡","砚","屿","澜","宁","曜","晏","行","临","槿","潇","然","祁","珺","宸","沐","岑","澈","瑜","墨","澜","岚","晗","玥","凝","珩","砺","砾","衡","砚","潞","珞","菡","芷","笙","尧","尘","喆","翊","祎","琪","苏","槐","渝","景","澈","恺","澄","渊","湛","沁","泽","言"]
@@ -74,6 +82,23 @@ def _dedupe_name(original: str, npc_id: str, used_names: set) -> str:
             tries += 1
         return candidate
 
+def strip_role_suffix(name: str) -> str:
+    name = str(name or "").strip()
+    if "（" in name and "）" in name:
+        return name.split("（")[0].strip()
+    if "(" in name and ")" in name:
+        return name.split("(")[0].strip()
+    return name
+
+def normalize_name(name: str, npc_id: str, used_names: set) -> str:
+    base = strip_role_suffix(name)
+    if base and base not in used_names:
+        used_names.add(base)
+        return base
+    new_name = _dedupe_name(base, npc_id, used_names)
+    used_names.add(new_name)
+    return new_name
+
 def ensure_unique_names(npcs, mapping):
     name_to_ids = {}
     for old_key, data in npcs.items():
@@ -108,6 +133,19 @@ def remap_relations(relations, mapping):
         new_rel[new_k] = v
     return new_rel
 
+def build_relation_worlds(npcs, count=WORLD_COUNT, seed=WORLD_SEED):
+    rng = random.Random(seed)
+    worlds = []
+    for _ in range(count):
+        pairs = build_relation_pairs(npcs, rng)
+        worlds.append([list(p) for p in pairs])
+    return {
+        "version": 1,
+        "seed": seed,
+        "npc_count": len(npcs),
+        "worlds": worlds,
+    }
+
 def main():
     npcs = load_json(DATA_PATH)
     mapping = build_id_mapping(npcs)
@@ -121,12 +159,8 @@ def main():
             data["manager_id"] = mapping.get(m, m)
         data["relations"] = remap_relations(data.get("relations", {}), mapping)
         name = str(data.get("name", "")).strip()
-        if "（" in name and "）" in name:
-            base = name.split("（")[0].strip()
-            data["name"] = base
-        elif "(" in name and ")" in name:
-            base = name.split("(")[0].strip()
-            data["name"] = base
+        if name:
+            data["name"] = strip_role_suffix(name)
 
         new_npcs[new_key] = data
 
@@ -135,5 +169,9 @@ def main():
     save_json(DATA_PATH, new_npcs)
     print(f"Remapped {len(npcs)} NPC entries. All IDs normalized to NPC_ format and names de-duplicated.")
 
+    worlds = build_relation_worlds(new_npcs)
+    save_json(WORLDS_PATH, worlds)
+    print(f"Built {len(worlds['worlds'])} relation worlds into {os.path.basename(WORLDS_PATH)}.")
+
 if __name__ == "__main__":
     main()
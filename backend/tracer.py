@@ -0,0 +1,204 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import random
+import time
+from typing import Dict, Optional
+
+try:
+    import pyinstrument
+except ImportError:  # 可选依赖：缺失时用标准库 cProfile
+    pyinstrument = None
+
+# MH_TRACE=1 开启分阶段计时（Server-Timing 头 + SSE timing 事件）；关闭时 @traced 原样返回函数，零开销
+TRACE_ENABLED = os.getenv("MH_TRACE", "0") == "1"
+SLOW_TURN_MS = float(os.getenv("MH_TRACE_SLOW_MS", "500"))
+# 慢回合按这个比例采样 profile，写到 PROFILE_DIR；0 表示不采样
+PROFILE_SAMPLE = float(os.getenv("MH_PROFILE_SAMPLE", "0"))
+PROFILE_DIR = os.getenv("MH_PROFILE_DIR", os.path.join(os.path.dirname(__file__), ".profiles"))
+
+_current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar("mh_trace", default=None)
+_profiling = False  # 同一时刻只允许一个 profiler
+
+
+class RequestTrace:
+    """
+    Per-request phase timings. A phase entered several times (or nested
+    inside itself) accumulates; concurrent LLM calls each add their own
+    wall time, so phases can sum to more than the request.
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._active: Dict[str, int] = {}
+        self.profiler = None
+
+    def add(self, name: str, elapsed: float):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round(self.elapsed_ms(), 2),
+            "phases": {name: round(sec * 1000, 2) for name, sec in self.phases.items()},
+            "counts": dict(self.counts),
+        }
+
+    def server_timing(self) -> str:
+        # Server-Timing 的 metric 名只能是 token，把 llm.xxx 这类名字里的点换成下划线
+        parts = [f"{name.replace('.', '_')};dur={sec * 1000:.2f}" for name, sec in self.phases.items()]
+        parts.append(f"total;dur={self.elapsed_ms():.2f}")
+        return ", ".join(parts)
+
+
+def current() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started", "outer")
+
+    def __init__(self, trace: RequestTrace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        active = self.trace._active
+        # 递归进入同名阶段时只计最外层，避免重复计时
+        self.outer = active.get(self.name, 0) == 0
+        active[self.name] = active.get(self.name, 0) + 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace._active[self.name] -= 1
+        if self.outer:
+            self.trace.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    trace = _current_trace.get()
+    return _Span(trace, name) if trace is not None else _NULL_SPAN
+
+
+def record(name: str, elapsed: float):
+    """Attribute an already measured duration (e.g. an LLM call) to the current request."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, elapsed)
+
+
+def traced(name: str):
+    """Time a sync or async function as phase ``name``; a no-op unless MH_TRACE=1."""
+
+    def decorator(fn):
+        if not TRACE_ENABLED:
+            return fn
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _start_profiler():
+    global _profiling
+    if _profiling or PROFILE_SAMPLE <= 0 or random.random() >= PROFILE_SAMPLE:
+        return None
+    _profiling = True
+    if pyinstrument is not None:
+        profiler = pyinstrument.Profiler(async_mode="enabled")
+        profiler.start()
+        return profiler
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(trace: RequestTrace, slow: bool):
+    global _profiling
+    profiler, trace.profiler = trace.profiler, None
+    if profiler is None:
+        return
+    _profiling = False
+    if pyinstrument is not None:
+        profiler.stop()
+    else:
+        profiler.disable()
+    if not slow:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{trace.label.strip('/').replace('/', '_')}")
+    if pyinstrument is not None:
+        with open(stem + ".html", "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.dump_stats(stem + ".prof")
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a RequestTrace per HTTP request and adds a
+    ``Server-Timing`` header. Streaming responses send their headers before
+    the turn runs, so the SSE endpoint also emits a ``timing`` event.
+    Requests slower than ``MH_TRACE_SLOW_MS`` are logged as one JSON line.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace(scope.get("path", ""))
+        trace.profiler = _start_profiler()
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            slow = trace.elapsed_ms() >= SLOW_TURN_MS
+            _stop_profiler(trace, slow)
+            if slow:
+                print(json.dumps({"event": "slow_request", "path": trace.label, **trace.summary()}, ensure_ascii=False))
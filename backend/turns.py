@@ -0,0 +1,164 @@
+import random
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from models import UndoLog
+
+
+def new_seed() -> int:
+    return random.getrandbits(32)
+
+
+def now_iso() -> str:
+    return datetime.now().isoformat()
+
+
+def new_turn_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class TurnPlan(BaseModel):
+    """
+    Everything a turn takes from the outside world, gathered before any state
+    is touched: LLM outputs, the RNG seed and the wall clock. Applying the same
+    plan to the same state gives the same result, so plans can be retried or
+    replayed.
+    """
+    kind: str  # command / chat / stream / player_message / promotion / promotion_review / advance / fast_forward / welcome / random_event
+    text: str
+    target_npc: Optional[str] = None
+    channel: str = "group"
+    seed: int = Field(default_factory=new_seed)
+    turn_id: str = Field(default_factory=new_turn_id)  # 指标 / 日志里关联同一回合的多次 LLM 调用
+    started_at: str = Field(default_factory=now_iso)
+
+    active_npc_id: Optional[str] = None
+    responders: List[str] = []
+    known_ids: List[str] = []
+    event_mode: bool = False
+    advance: Dict[str, Any] = {}
+    random_event_prob: float = 0.0
+    # 流式回合先单独提交了玩家发言（kind=player_message），apply 时不再追加
+    player_committed: bool = False
+
+    # LLM 输出原样记录：replies / npc_reply / crosstalk / stream_response / fallback / promotion_score / suggested_replies
+    llm: Dict[str, Any] = {}
+    # apply 阶段产出的结果（如快进摘要），只给调用方用，重放时会重新生成
+    outcome: Dict[str, Any] = {}
+
+
+def _copy_value(value):
+    # 状态里的容器最多两层（消息 / 事件字典、字符串列表），值都是不可变标量，拷两层就够
+    if isinstance(value, dict):
+        return {k: (v.copy() if isinstance(v, (dict, list)) else v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [v.copy() if isinstance(v, (dict, list)) else v for v in value]
+    return value
+
+
+def _copy_model(model):
+    copied = model.model_copy()
+    for name, value in copied.__dict__.items():
+        if isinstance(value, (dict, list)):
+            copied.__dict__[name] = _copy_value(value)
+    return copied
+
+
+# 只追加、追加后不再修改条目的列表：拷贝列表本身即可，条目可以共享
+APPEND_ONLY = ("chat_history", "workbench_feedback")
+
+
+def _share_unchanged(live: dict, previous: dict) -> dict:
+    # 字段和上一份快照里完全相同的模型直接复用，改过的才重新拷贝
+    view = {}
+    for key, model in live.items():
+        old = previous.get(key)
+        view[key] = old if old is not None and old.__dict__ == model.__dict__ else _copy_model(model)
+    return view
+
+
+def snapshot_view(state, previous=None):
+    """
+    Read-only copy of ``state`` for a published snapshot, sharing what did
+    not change: entries of the append-only lists, and NPCs / projects whose
+    fields equal those in ``previous``. Everything else is copied the way
+    StateCheckpoint copies it.
+    """
+    fields = {}
+    for name, value in state.__dict__.items():
+        if name in APPEND_ONLY:
+            fields[name] = value.copy()
+        elif name in ("npcs", "projects"):
+            fields[name] = _share_unchanged(value, getattr(previous, name, None) or {})
+        elif isinstance(value, BaseModel):
+            fields[name] = _copy_model(value)
+        else:
+            fields[name] = _copy_value(value)
+    return state.model_copy(update=fields)
+
+
+class StateCheckpoint:
+    """
+    Rollback point for one turn without deep-copying the GameState.
+    The append-only lists never have entries edited, and NPC writes go to
+    an UndoLog, so they are copied shallowly. The player, the projects and
+    the small containers are copied two levels deep.
+    """
+
+    SHALLOW = APPEND_ONLY + ("npcs",)
+
+    def __init__(self, state):
+        self.state = state
+        self.fields = {}
+        for name, value in state.__dict__.items():
+            if name in self.SHALLOW:
+                self.fields[name] = value.copy()
+            elif name == "projects":
+                self.fields[name] = {k: _copy_model(p) for k, p in value.items()}
+            elif isinstance(value, BaseModel):
+                self.fields[name] = _copy_model(value)
+            else:
+                self.fields[name] = _copy_value(value)
+        self.undo = UndoLog(parent=UndoLog.active)
+        UndoLog.active = self.undo
+
+    def release(self, rollback: bool):
+        UndoLog.active = self.undo.parent
+        if not rollback:
+            self.undo.merge_into_parent()
+            return
+        self.undo.rollback()
+        self.state.__dict__.update(self.fields)
+
+
+class TurnTransaction:
+    """
+    Apply phase of a turn. Runs synchronously with the plan's seed and clock;
+    on any exception the session state and relation overlay are rolled back
+    in place from a StateCheckpoint.
+    """
+
+    def __init__(self, manager, plan: TurnPlan):
+        self.manager = manager
+        self.plan = plan
+
+    def __enter__(self):
+        self._checkpoint = StateCheckpoint(self.manager.state)
+        self._relations = self.manager.relations.checkpoint()
+        self._rng = random.getstate()
+        random.seed(self.plan.seed)
+        self.manager._clock = self.plan.started_at
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.manager._clock = None
+        random.setstate(self._rng)
+        self._checkpoint.release(rollback=exc_type is not None)
+        if exc_type is not None:
+            self.manager.relations.restore(self._relations)
+            # 状态是原地恢复的（对象没换），晋升计数要显式重算
+            self.manager.promotion.invalidate()
+        return False
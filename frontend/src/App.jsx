@@ -491,6 +491,7 @@ function App() {
         type: 'player',
         target,
         timestamp: new Date().toISOString(),
+        optimistic: true,
       };
       history.push(playerMsg);
       newState.chat_history = history;
@@ -566,13 +567,27 @@ function App() {
               const newState = { ...prevState };
 
               if (data.type === 'msg_append') {
-                const exists = (newState.chat_history || []).some(m =>
-                  m.sender === data.msg.sender &&
-                  m.content === data.msg.content &&
-                  m.type === data.msg.type
-                );
-                if (!exists) {
-                  newState.chat_history = [...newState.chat_history, data.msg];
+                // 每条消息服务端只发一次；预览消息带 preview_id，续传重放时按 id 去重
+                const history = newState.chat_history || [];
+                if (data.preview_id && history.some(m => m.preview_id === data.preview_id)) {
+                  return newState;
+                }
+                const incoming = data.preview_id ? { ...data.msg, preview_id: data.preview_id } : data.msg;
+                const optimisticIdx = incoming.type === 'player'
+                  ? history.findIndex(m => m.optimistic && m.content === incoming.content)
+                  : -1;
+                if (optimisticIdx >= 0) {
+                  const next = [...history];
+                  next[optimisticIdx] = incoming;
+                  newState.chat_history = next;
+                } else {
+                  newState.chat_history = [...history, incoming];
+                }
+              } else if (data.type === 'msg_commit') {
+                // 预览已落地；没有落地的预览（discarded）撤掉
+                const discarded = new Set(data.discarded || []);
+                if (discarded.size) {
+                  newState.chat_history = (newState.chat_history || []).filter(m => !discarded.has(m.preview_id));
                 }
               } else if (data.type === 'msg_update') {
                 const lastIdx = newState.chat_history.length - 1;